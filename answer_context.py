@@ -0,0 +1,105 @@
+"""
+Compact, token-budgeted graph context for the answer prompt.
+
+Retrieval matches relationships in both directions, so the same fact often
+comes back twice (Alice --[LIVES_IN]--> Ohio from the Alice anchor and
+Ohio --[LIVES_IN]--> Alice from the Ohio anchor), and two-hop paths add many
+weakly related rows. Every row used to become its own prompt line, so
+prompt tokens (and answer latency and cost) grew with that noise.
+
+build_answer_context:
+  * drops mirrored copies of a path, keeping the direction that starts at
+    an entity named in the question
+  * ranks paths by length, then by how many of their ends the question names
+  * groups paths with the same subject and relationship chain into one
+    line (Alice --[LOVES]--> Football, Chess)
+  * stops adding paths once ANSWER_CONTEXT_TOKENS would be exceeded
+
+Token counts are estimated from characters (about 4 per token for English
+text), which is close enough for a budget and needs no tokenizer.
+"""
+
+import math
+import re
+
+from config import config
+
+WORD_PATTERN = re.compile(r"\w+")
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def legacy_context(results: list) -> str:
+    """One line per result row, as the answer prompt was built originally"""
+    structured_data = []
+    for record in results:
+        entity1 = record.get('entity1', '')
+        relationships = record.get('relationships', [])
+        entity2 = record.get('entity2', '')
+
+        # Format as structured triples
+        if isinstance(relationships, list):
+            rel_chain = ' -> '.join(relationships)
+            structured_data.append(f"{entity1} --[{rel_chain}]--> {entity2}")
+        else:
+            structured_data.append(f"{entity1} --[{relationships}]--> {entity2}")
+    return "\n".join(structured_data)
+
+
+def _mentioned(name: str, question_words: set) -> bool:
+    words = WORD_PATTERN.findall(str(name).lower())
+    return bool(words) and all(word in question_words for word in words)
+
+
+def _unique_paths(question: str, results: list) -> list:
+    """[(rank, entity1, chain, entity2)] with mirrored copies removed"""
+    question_words = set(WORD_PATTERN.findall(question.lower()))
+    best = {}
+    for order, record in enumerate(results):
+        entity1, entity2 = str(record.get("entity1") or ""), str(record.get("entity2") or "")
+        relationships = record.get("relationships", [])
+        chain = tuple(relationships) if isinstance(relationships, list) else (relationships,)
+        length = record.get("path_length") or len(chain)
+
+        mentioned1, mentioned2 = _mentioned(entity1, question_words), _mentioned(entity2, question_words)
+        if mentioned2 and not mentioned1:
+            # Read the path from the end the question is about
+            entity1, entity2, chain = entity2, entity1, chain[::-1]
+        key = min((entity1, chain, entity2), (entity2, chain[::-1], entity1))
+        rank = (length, -(mentioned1 + mentioned2), order)
+        if key not in best or rank < best[key][0]:
+            best[key] = (rank, entity1, chain, entity2)
+    return sorted(best.values())
+
+
+def build_answer_context(question: str, results: list, token_budget: int = None) -> str:
+    """Prompt lines for results; token_budget 0 means no limit"""
+    if token_budget is None:
+        token_budget = config.ANSWER_CONTEXT_TOKENS
+
+    groups = {}  # (subject, chain) -> objects, in rank order of first path
+    used = 0
+    for _, entity1, chain, entity2 in _unique_paths(question, results):
+        group = groups.get((entity1, chain))
+        if group is None:
+            cost = estimate_tokens(f"{entity1} --[{' -> '.join(chain)}]--> {entity2}\n")
+        else:
+            cost = estimate_tokens(f", {entity2}")
+        # The best path always goes in, whatever the budget
+        if token_budget and used + cost > token_budget and groups:
+            continue
+        used += cost
+        if group is None:
+            groups[(entity1, chain)] = [entity2]
+        else:
+            group.append(entity2)
+
+    # Lines about the same subject stay together, subjects in rank order
+    subjects = list(dict.fromkeys(entity1 for entity1, _ in groups))
+    return "\n".join(
+        f"{entity1} --[{' -> '.join(chain)}]--> {', '.join(objects)}"
+        for (entity1, chain), objects in sorted(groups.items(), key=lambda item: subjects.index(item[0][0]))
+    )
@@ -0,0 +1,159 @@
+"""
+Deterministic answers for direct one-hop results.
+
+"Where does Alice live?" with an Alice --[LIVES_IN]--> Ohio path does not need
+a Gemini generation to become "Alice lives in Ohio.". AnswerTemplates answers
+from a relationship type -> question patterns table when the result is
+unambiguous:
+
+  * the question names exactly one entity from the results (the subject)
+  * with the subject written as S, the whole question matches one of the
+    relationship's patterns: question word, auxiliary, subject, verb or
+    noun, optional preposition, and nothing else ("Where does S live",
+    "Who are S's friends"). Leftover words ("not", "before", "with",
+    "and Bob", "S's brother") mean the question was not understood
+  * the subject has direct (one-hop) paths of that type
+
+Retrieval rows are turned to start at their anchor and carry no stored
+direction, so only types whose direction follows from the type itself are
+templated: a person lives in, works at or studies at a place and has a
+hobby, and FRIEND_OF is symmetric. "Who does Alice love?" could be answered
+from a Bob --[LOVES]--> Alice row, so LOVES and LIKES always go to Gemini,
+as does everything else (multi-hop only, several candidate subjects, yes/no
+questions).
+"""
+
+import re
+import threading
+
+WORD_PATTERN = re.compile(r"\w+(?:['’]\w+)*")
+
+# type -> (question patterns over the words with the subject as S,
+#          answer for one object, answer for several)
+RELATION_TEMPLATES = {
+    "LIVES_IN": ([r"where does S (?:live|reside)",
+                  r"where is S living",
+                  r"(?:what|which) (?:city|town|state|country|place) does S (?:live|reside) in"],
+                 "{subject} lives in {objects}.", "{subject} lives in {objects}."),
+    "WORKS_AT": ([r"where does S work",
+                  r"where is S (?:working|employed)",
+                  r"(?:what|which) (?:company|organization) does S work (?:at|for)",
+                  r"(?:who|what) is S's employer"],
+                 "{subject} works at {objects}.", "{subject} works at {objects}."),
+    "STUDIES_AT": ([r"where does S study",
+                    r"where is S studying",
+                    r"(?:what|which) (?:school|college|university) does S (?:study at|attend)"],
+                   "{subject} studies at {objects}.", "{subject} studies at {objects}."),
+    "HAS_HOBBY": ([r"what (?:is|are) S's hobb(?:y|ies)",
+                   r"what hobb(?:y|ies) does S have"],
+                  "{possessive} hobby is {objects}.", "{possessive} hobbies are {objects}."),
+    "FRIEND_OF": ([r"who (?:is|are) S's friends?",
+                   r"who (?:is|are) friends with S"],
+                  "{possessive} friend is {objects}.", "{possessive} friends are {objects}."),
+}
+QUESTION_PATTERNS = {
+    rel: re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+    for rel, (patterns, _, _) in RELATION_TEMPLATES.items()
+}
+
+
+def join_list(items: list) -> str:
+    """A / A and B / A, B and C"""
+    if len(items) == 1:
+        return items[0]
+    return f"{', '.join(items[:-1])} and {items[-1]}"
+
+
+def possessive(name: str) -> str:
+    return f"{name}'" if name.endswith("s") else f"{name}'s"
+
+
+class AnswerTemplates:
+    """Template answer generator with counters for /metrics"""
+
+    def __init__(self):
+        self.templated = 0
+        self.generated = 0
+        self._llm_latency = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _position(name: str, words: list):
+        """Index of name's words in the question words, or None"""
+        name_words = WORD_PATTERN.findall(name.lower())
+        for i in range(len(words) - len(name_words) + 1):
+            if name_words and words[i:i + len(name_words)] == name_words:
+                return i
+        return None
+
+    def answer(self, question: str, results: list):
+        """Answer text, or None when the LLM should write the answer"""
+        raw = WORD_PATTERN.findall(question.lower().replace("’", "'"))
+        words = [re.sub(r"'s$", "", w) for w in raw]
+        if not words:
+            return None
+
+        positions = {}
+        for record in results:
+            for name in (record.get("entity1"), record.get("entity2")):
+                if name and name not in positions:
+                    positions[name] = self._position(str(name), words)
+        mentioned = [name for name, position in positions.items() if position is not None]
+        if len(mentioned) != 1:
+            return None
+        subject = mentioned[0]
+        start = positions[subject]
+        end = start + len(WORD_PATTERN.findall(subject.lower()))
+
+        shape = " ".join(raw[:start] + ["S's" if raw[end - 1] != words[end - 1] else "S"] + raw[end:])
+        asked = [rel for rel, pattern in QUESTION_PATTERNS.items() if pattern.fullmatch(shape)]
+        if len(asked) != 1:
+            return None
+
+        objects = []
+        for record in results:
+            if (record.get("relationships") or []) != [asked[0]]:
+                continue
+            if record.get("entity1") == subject:
+                other = record.get("entity2")
+            elif record.get("entity2") == subject:
+                other = record.get("entity1")
+            else:
+                continue
+            if other and other != subject and other not in objects:
+                objects.append(other)
+        if not objects:
+            return None
+
+        _, one, many = RELATION_TEMPLATES[asked[0]]
+        names = [str(o) for o in objects]
+        return (one if len(names) == 1 else many).format(
+            subject=subject, possessive=possessive(subject), objects=join_list(names)
+        )
+
+    def record(self, templated: bool, llm_latency: float = None):
+        """Count an answer; llm_latency is the duration of a generated one"""
+        with self._lock:
+            if templated:
+                self.templated += 1
+            else:
+                self.generated += 1
+                if llm_latency is not None:
+                    self._llm_latency = (
+                        llm_latency if self._llm_latency is None else 0.9 * self._llm_latency + 0.1 * llm_latency
+                    )
+
+    def latency_saved_ms(self) -> float:
+        return round((self._llm_latency or 0.0) * 1000, 1)
+
+    def stats(self) -> dict:
+        total = self.templated + self.generated
+        return {
+            "templated": self.templated,
+            "generated": self.generated,
+            "templated_rate": round(self.templated / total, 4) if total else 0.0,
+            "avg_generation_ms": self.latency_saved_ms(),
+        }
+
+
+answer_templates = AnswerTemplates()
@@ -1,10 +1,15 @@
+import asyncio
 from fastapi import FastAPI, HTTPException
 from contextlib import asynccontextmanager
 from config import config
-from database import db
-from embeddings import embedding_service
+from database import async_db
+from embedding_cache import embedding_cache
+from embeddings import embedding_service, entity_dictionary
+from global_snapshot import global_snapshot
 from models import HealthResponse
 from routes import router
+from session_cleanup import session_cleaner
+from vector_index import vector_search
 from fastapi.middleware.cors import CORSMiddleware
 
 @asynccontextmanager
@@ -12,11 +17,30 @@ async def lifespan(app: FastAPI):
     """Manage application lifecycle"""
     # Startup: Validate config and initialize connections
     config.validate()
-    db.connect()
+    await async_db.connect()
     embedding_service.initialize()
+    # Retrieval anchors fall back to prefix lookups if the full-text index is missing
+    await embedding_service.check_anchor_indexes(async_db)
+    # Mirror Embedding nodes into the local vector index(es), if configured
+    await vector_search.sync(async_db)
+    # Known node names for the local keyword stage, kept fresh in the background
+    await entity_dictionary.load(async_db)
+    refresher = asyncio.create_task(entity_dictionary.refresh_periodically(async_db))
+    # Compiled global layer, rebuilt by whichever worker first sees it stale
+    await global_snapshot.refresh(async_db)
+    snapshot_refresher = asyncio.create_task(global_snapshot.refresh_periodically(async_db))
+    # Expired session data, deleted in batches
+    cleaner = None
+    if config.SESSION_CLEANUP_INTERVAL > 0:
+        cleaner = asyncio.create_task(session_cleaner.run_periodically(async_db))
     yield
     # Shutdown: Close connections
-    db.close()
+    refresher.cancel()
+    snapshot_refresher.cancel()
+    if cleaner is not None:
+        cleaner.cancel()
+    await async_db.close()
+    embedding_cache.close()
 
 app = FastAPI(
     title="AI Memory API",
@@ -38,7 +62,7 @@ async def health():
     """Public health check for UptimeRobot"""
     try:
         # Check database connection
-        db.driver.verify_connectivity()
+        await async_db.driver.verify_connectivity()
         return {
             "status": "healthy", 
             "neo4j": "connected", 
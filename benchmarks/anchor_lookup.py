@@ -0,0 +1,187 @@
+"""
+Anchor lookup plans and latency for the retrieval query, against a live Neo4j.
+
+Unlike the other benchmarks this one needs a real database (NEO4J_URI etc.
+from .env): plans and db hits only mean something on the real planner. It
+seeds synthetic :Entity nodes (labeled :BenchNode, in a private session) up
+to each requested size, then for the current build_secure_cypher_query and
+the previous `toLower(name) CONTAINS` query:
+
+  * EXPLAINs the plan and fails if the current query contains any full node
+    scan operator (AllNodesScan, NodeByLabelScan, NodeIndexScan, ...)
+  * PROFILEs one run for total db hits
+  * times repeated runs for p50/p99 latency
+
+The seeded nodes are deleted at the end (or with --cleanup only).
+
+Usage:
+    python benchmarks/anchor_lookup.py --sizes 10000 100000 1000000 --legacy-max 100000
+"""
+
+import argparse
+import random
+import time
+
+from common import summarize_ms
+
+from config import config
+from database import db
+from embeddings import embedding_service
+from init_global_nodes import create_indexes
+
+SESSION_ID = "bench_anchor_lookup"
+
+# build_secure_cypher_query before anchor-first retrieval
+LEGACY_QUERY = """
+MATCH path = (n)-[*1..2]-(m)
+WHERE (
+    ANY(kw IN $keywords WHERE toLower(n.name) CONTAINS toLower(kw))
+    OR ANY(kw IN $keywords WHERE toLower(m.name) CONTAINS toLower(kw))
+)
+AND ALL(node IN nodes(path) WHERE node.session_id = 'global' OR node.session_id = $session_id)
+WITH n, m, relationships(path) as rels, length(path) as path_length
+ORDER BY path_length ASC
+RETURN DISTINCT n.name as entity1,
+       [r IN rels | type(r)] as relationships,
+       m.name as entity2,
+       path_length
+LIMIT 20
+"""
+
+# Operators that read every node (or every node with a label / in an index)
+SCAN_OPERATORS = {
+    "AllNodesScan",
+    "NodeByLabelScan",
+    "UnionNodeByLabelsScan",
+    "IntersectionNodeByLabelsScan",
+    "SubtractionNodeByLabelsScan",
+    "NodeIndexScan",
+    "NodeIndexContainsScan",
+    "NodeIndexEndsWithScan",
+    "PartitionedAllNodesScan",
+    "PartitionedNodeByLabelScan",
+    "PartitionedNodeIndexScan",
+}
+
+
+def run_summary(query: str, params: dict):
+    with db.driver.session(database=config.NEO4J_DATABASE) as session:
+        return session.run(query, params).consume()
+
+
+def operators(plan: dict) -> list:
+    """Flatten a plan tree into operator names (without the @runtime suffix)"""
+    found = [plan["operatorType"].split("@")[0]]
+    for child in plan.get("children", []):
+        found.extend(operators(child))
+    return found
+
+
+def db_hits(profile: dict) -> int:
+    return profile.get("dbHits", 0) + sum(db_hits(child) for child in profile.get("children", []))
+
+
+def seed(current: int, target: int, batch: int = 10000):
+    """Grow the synthetic graph to target nodes, ~3 relationships per node"""
+    for start in range(current, target, batch):
+        end = min(start + batch, target)
+        db.execute_cypher(
+            """
+            UNWIND range($start, $end - 1) AS i
+            CREATE (:Entity:BenchNode {
+                normalized_id: 'entity_' + toString(i),
+                name: 'Entity ' + toString(i),
+                session_id: CASE WHEN i % 10 = 0 THEN 'global' ELSE $session_id END,
+                created_at: datetime()
+            })
+            """,
+            {"start": start, "end": end, "session_id": SESSION_ID},
+        )
+        db.execute_cypher(
+            """
+            UNWIND range($start, $end - 1) AS i
+            MATCH (a:Entity {normalized_id: 'entity_' + toString(i)})
+            UNWIND [(i * 7919 + 1) % $end, (i * 104729 + 3) % $end, (i + 1) % $end] AS j
+            MATCH (b:Entity {normalized_id: 'entity_' + toString(j)})
+            CREATE (a)-[:RELATED_TO {session_id: a.session_id, created_at: datetime()}]->(b)
+            """,
+            {"start": start, "end": end},
+        )
+
+
+def cleanup():
+    db.execute_cypher(
+        """
+        MATCH (n:BenchNode)
+        CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS
+        """
+    )
+
+
+def measure(name: str, query: str, params_for, keyword_sets: list, queries: int):
+    plan = run_summary("EXPLAIN " + query, params_for(keyword_sets[0])).plan
+    scans = sorted(set(operators(plan)) & SCAN_OPERATORS)
+    hits = db_hits(run_summary("PROFILE " + query, params_for(keyword_sets[0])).profile)
+
+    latencies = []
+    for keywords in keyword_sets[:queries]:
+        start = time.perf_counter()
+        db.execute_cypher(query, params_for(keywords))
+        latencies.append(time.perf_counter() - start)
+
+    print(f"  {name:<8} {summarize_ms(latencies)}  db hits={hits:>12,}  scans={', '.join(scans) or 'none'}")
+    return scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--legacy-max", type=int, default=100000,
+                        help="largest size to run the old full-scan query at")
+    parser.add_argument("--cleanup", action="store_true", help="only delete previously seeded nodes")
+    args = parser.parse_args()
+
+    db.connect()
+    try:
+        cleanup()
+        if args.cleanup:
+            return
+        create_indexes()
+
+        anchor_query = embedding_service.build_secure_cypher_query(["placeholder"])
+
+        def anchor_params(keywords):
+            params = embedding_service.build_retrieval_params(keywords)
+            params["session_id"] = SESSION_ID
+            return params
+
+        def legacy_params(keywords):
+            return {"keywords": keywords, "session_id": SESSION_ID}
+
+        rng = random.Random(3)
+        size = 0
+        failed = False
+        for target in sorted(args.sizes):
+            started = time.perf_counter()
+            seed(size, target)
+            db.execute_cypher("CALL db.awaitIndexes(600)")
+            size = target
+            print(f"\n{size:,} nodes (seeded in {time.perf_counter() - started:.0f}s)")
+
+            keyword_sets = [[f"Entity {rng.randrange(size)}"] for _ in range(args.queries)]
+            scans = measure("anchor", anchor_query, anchor_params, keyword_sets, args.queries)
+            failed = failed or bool(scans)
+            if size <= args.legacy_max:
+                measure("legacy", LEGACY_QUERY, legacy_params, keyword_sets, min(args.queries, 5))
+
+        if failed:
+            raise SystemExit("❌ The anchor query plan contains a full scan operator")
+        print("\n✅ No full node scans in the anchor query plan")
+    finally:
+        cleanup()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
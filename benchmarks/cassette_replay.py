@@ -0,0 +1,135 @@
+"""
+Record a /chat session log on the fake model backend, then replay it from
+the cassette with and without the recorded latencies.
+
+Recording runs sessions of facts and questions through /chat (even
+sessions) and /chat/stream (odd sessions, as the UI does) with
+CASSETTE_MODE=record semantics (FakeBackend wrapped in a recording
+CassetteBackend) and captures the session log. Replay drives each request's
+recorded endpoint with replay_chat.py's replayer from that log, serving
+every model call from the cassette: once reproducing the recorded latencies
+(comparable to the recording) and once without them (app overhead only).
+A last pass sends every request to /chat, so answers recorded as streams
+are served to non-streaming generations. Neo4j is an
+in-memory stub, reset before each phase. Similar-question answer matching
+is on so questions are embedded too, into a throwaway embedding cache.
+Fails on any cassette miss, or if replayed fake-model vectors are cached
+as the real embedding model's.
+
+Usage:
+    python benchmarks/cassette_replay.py --sessions 20 --turns 6 --median-ms 150
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import tempfile
+
+from common import api_client
+from offline_backend import OBJECTS, PEOPLE, QUESTIONS, install_graph_store
+
+from cache import answer_cache, retrieval_cache
+from cassette import CassetteBackend, chat_log
+from config import config
+from embedding_cache import embedding_cache
+from embeddings import embedding_service
+from model_backends import FakeBackend
+from model_scheduler import model_scheduler
+from replay_chat import load_log, print_report, replay
+
+
+def reset():
+    install_graph_store()
+    retrieval_cache.clear()
+    answer_cache.clear()
+    model_scheduler.pools = {}
+
+
+def session_script(session: int, turns: int, rng: random.Random) -> list:
+    """Alternating facts (pronoun follow-ups) and questions about one person"""
+    person = f"{PEOPLE[session % len(PEOPLE)]}{session}"
+    requests = [{"message": f"{person} is my friend", "action_type": "add_fact", "history": []}]
+    history = [{"role": "user", "content": f"{person} is my friend"}]
+    for _ in range(turns):
+        relation = rng.choice(list(OBJECTS))
+        requests.append({"message": f"he {relation} {rng.choice(OBJECTS[relation])}",
+                         "action_type": "add_fact", "history": list(history)})
+        requests.append({"message": QUESTIONS[relation].format(person),
+                         "action_type": "ask_question", "history": []})
+    for body in requests:
+        body["session_id"] = f"session_1700000000000_replay{session}"
+        body["endpoint"] = "/chat/stream" if session % 2 else "/chat"
+    return requests
+
+
+async def record(sessions: int, turns: int, concurrency: int) -> None:
+    reset()
+    embedding_service.backend = CassetteBackend("record", config.CASSETTE_PATH, inner=FakeBackend())
+    rng = random.Random(4)
+    scripts = {s: session_script(s, turns, rng) for s in range(sessions)}
+    async with api_client() as client:
+        with contextlib.redirect_stdout(io.StringIO()):
+            outcome = await replay(client, scripts, concurrency)
+    print("record (live fake model):")
+    print_report(outcome)
+
+
+async def replay_cassette(concurrency: int, latency: bool, endpoint: str = None) -> CassetteBackend:
+    reset()
+    backend = embedding_service.backend = CassetteBackend("replay", config.CASSETTE_PATH, replay_latency=latency)
+    async with api_client() as client:
+        with contextlib.redirect_stdout(io.StringIO()):
+            outcome = await replay(client, load_log(config.CASSETTE_CHAT_LOG), concurrency, endpoint)
+    if outcome["errors"]:
+        raise SystemExit(f"❌ {outcome['errors']} replayed requests failed")
+    print(f"replay ({'recorded latencies' if latency else 'no model latency'}"
+          f"{', all through ' + endpoint if endpoint else ''}):")
+    print_report(outcome)
+    return backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=6, help="fact + question pairs per session")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--median-ms", type=float, default=150, help="fake model median generation latency")
+    args = parser.parse_args()
+
+    config.FAKE_MODEL_LATENCY = {"generate": {"dist": "lognormal", "median_ms": args.median_ms, "sigma": 0.3},
+                                 "embed": {"dist": "fixed", "ms": 20}}
+    config.GLOBAL_SNAPSHOT_ENABLED = False
+    config.LOCAL_KEYWORDS_ENABLED = False
+    # Embeds every question without letting near-duplicates share an answer
+    answer_cache.similarity_threshold = 0.9999
+
+    with tempfile.TemporaryDirectory() as directory:
+        embedding_cache.path = os.path.join(directory, "embeddings.f32")
+        config.CASSETTE_MODE = "record"
+        config.CASSETTE_PATH = os.path.join(directory, "model_calls.jsonl")
+        config.CASSETTE_CHAT_LOG = os.path.join(directory, "chat.jsonl")
+        chat_log.writer = None
+        asyncio.run(record(args.sessions, args.turns, args.concurrency))
+        config.CASSETTE_MODE = "replay"
+        print(f"cassette: {os.path.getsize(config.CASSETTE_PATH) / 1024:.1f}KB, "
+              f"session log: {os.path.getsize(config.CASSETTE_CHAT_LOG) / 1024:.1f}KB")
+
+        misses = 0
+        for latency, endpoint in ((True, None), (False, None), (False, "/chat")):
+            backend = asyncio.run(replay_cassette(args.concurrency, latency, endpoint))
+            misses += backend.misses
+            print(f"   cassette: {backend.stats()['replayed']} calls replayed, {backend.misses} misses")
+            embedded = sum(len(calls) for (op, _), calls in backend.entries.items() if op == "embed")
+            if embedded and embedding_service.embedding_cache_model == config.EMBEDDING_MODEL:
+                raise SystemExit("❌ Replayed fake-model vectors were cached as the real embedding model's")
+
+    if misses:
+        raise SystemExit("❌ Replay asked for model calls the cassette does not have")
+    print("✅ Every model call was served from the cassette, fake vectors under their own cache namespace")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Load benchmark for concurrent /chat requests against stubbed Gemini and Neo4j.
+
+Two modes are compared:
+  blocking  the stubs sleep with time.sleep, which is what the old handlers did
+            when they called the sync genai client and neo4j driver directly
+  async     the stubs await asyncio.sleep, as the aio client and
+            AsyncGraphDatabase driver do
+
+Usage:
+    python benchmarks/chat_concurrency.py --requests 50 --llm-ms 300 --db-ms 40
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+
+from common import Timer, api_client, summarize_ms
+
+from database import async_db
+from embeddings import embedding_service
+
+ROWS = [
+    {"entity1": "Zayeem", "relationships": ["LIVES_IN"], "entity2": "Ohio", "path_length": 1},
+    {"entity1": "Zayeem", "relationships": ["DEVELOPED"], "entity2": "AI Memory System", "path_length": 1},
+]
+
+
+def canned_response(prompt: str) -> str:
+    if "keyword extraction system" in prompt:
+        return '["Zayeem"]'
+    return "Zayeem lives in Ohio."
+
+
+def install_stubs(mode: str, llm_seconds: float, db_seconds: float):
+    if mode == "blocking":
+        async def generate(prompt, generation_config=None):
+            time.sleep(llm_seconds)
+            return canned_response(prompt)
+
+        async def execute_cypher(query, params=None):
+            time.sleep(db_seconds)
+            return ROWS
+    else:
+        async def generate(prompt, generation_config=None):
+            await asyncio.sleep(llm_seconds)
+            return canned_response(prompt)
+
+        async def execute_cypher(query, params=None):
+            await asyncio.sleep(db_seconds)
+            return ROWS
+
+    embedding_service._generate_async = generate
+    async_db.execute_cypher = execute_cypher
+
+
+async def run(mode: str, requests: int, llm_seconds: float, db_seconds: float):
+    install_stubs(mode, llm_seconds, db_seconds)
+    latencies = []
+
+    # Every request is submitted at the same instant, so latency includes any
+    # time spent queued behind other requests on the event loop.
+    start = time.perf_counter()
+
+    async def one(client, i):
+        response = await client.post(
+            "/chat",
+            json={
+                "message": "Where does Zayeem live?",
+                "action_type": "ask_question",
+                "session_id": f"session_{i}",
+            },
+        )
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+    async with api_client() as client:
+        with Timer() as wall, contextlib.redirect_stdout(io.StringIO()):
+            await asyncio.gather(*(one(client, i) for i in range(requests)))
+
+    print(
+        f"{mode:>8}: {requests} concurrent /chat  {summarize_ms(latencies)}  "
+        f"wall={wall.elapsed:.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--llm-ms", type=float, default=300, help="stubbed Gemini latency")
+    parser.add_argument("--db-ms", type=float, default=40, help="stubbed Neo4j latency")
+    args = parser.parse_args()
+
+    for mode in ("blocking", "async"):
+        asyncio.run(run(mode, args.requests, args.llm_ms / 1000, args.db_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Time-to-first-byte and total time for /chat vs. the SSE /chat/stream variant.
+
+Gemini and Neo4j are stubbed: the rewrite+keywords call and the Cypher query
+sleep for fixed latencies, and the answer is produced by a fake streaming
+model that waits before its first token and then emits tokens at a steady
+rate. The app is served by uvicorn on a local port so streamed bytes are
+timed as the client actually receives them. Fails unless every stream
+delivered the stub's whole answer and the streamed first token arrived well
+before the /chat response.
+
+Usage:
+    python benchmarks/chat_stream.py --requests 20 --llm-ms 300 --db-ms 40 --first-token-ms 400 --tokens 60
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import time
+
+from common import live_server, percentile
+
+import httpx
+
+from cache import answer_cache, retrieval_cache
+from config import config
+from database import async_db
+from embeddings import embedding_service
+
+REQUEST = {
+    "message": "Where does he live?",
+    "action_type": "ask_question",
+    "history": [{"role": "user", "content": "Zayeem is my friend"}],
+}
+
+ROWS = [
+    {"entity1": "Zayeem", "relationships": ["LIVES_IN"], "entity2": "Ohio", "path_length": 1},
+    {"entity1": "Zayeem", "relationships": ["DEVELOPED"], "entity2": "AI Memory System", "path_length": 1},
+]
+
+
+def install_stubs(llm_seconds: float, db_seconds: float, first_token_seconds: float,
+                  token_seconds: float, tokens: int):
+    answer = [f"word{i} " for i in range(tokens)]
+
+    async def generate(prompt, generation_config=None):
+        if "rewritten_query" in prompt:
+            await asyncio.sleep(llm_seconds)
+            return '{"rewritten_query": "Where does Zayeem live?", "keywords": ["Zayeem"]}'
+        # Non-streaming answer generation costs the same as the full stream
+        await asyncio.sleep(first_token_seconds + token_seconds * (tokens - 1))
+        return "".join(answer)
+
+    async def generate_stream(prompt, generation_config=None):
+        await asyncio.sleep(first_token_seconds)
+        for i, token in enumerate(answer):
+            if i:
+                await asyncio.sleep(token_seconds)
+            yield token
+
+    async def execute_cypher(query, params=None):
+        await asyncio.sleep(db_seconds)
+        return ROWS
+
+    embedding_service._generate_async = generate
+    embedding_service._generate_stream_async = generate_stream
+    async_db.execute_cypher = execute_cypher
+    # Every request must reach the model
+    retrieval_cache.max_entries = 0
+    answer_cache.max_entries = 0
+    config.ANSWER_TEMPLATES_ENABLED = False
+
+
+async def timed_chat(client: httpx.AsyncClient, session_id: str) -> dict:
+    start = time.perf_counter()
+    response = await client.post("/chat", json={**REQUEST, "session_id": session_id})
+    response.raise_for_status()
+    elapsed = time.perf_counter() - start
+    return {"ttfb": elapsed, "first_token": elapsed, "total": elapsed}
+
+
+async def timed_chat_stream(client: httpx.AsyncClient, session_id: str) -> dict:
+    start = time.perf_counter()
+    timings = {}
+    event = None
+    async with client.stream("POST", "/chat/stream", json={**REQUEST, "session_id": session_id}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            now = time.perf_counter() - start
+            timings.setdefault("ttfb", now)
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                if event == "error":
+                    raise RuntimeError(json.loads(line[len("data: "):])["detail"])
+                if event == "retrieved":
+                    timings.setdefault("retrieved", now)
+                elif event == "token":
+                    timings.setdefault("first_token", now)
+                    timings["tokens"] = timings.get("tokens", 0) + 1
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+
+async def run(endpoint: str, requests: int):
+    measure = timed_chat if endpoint == "/chat" else timed_chat_stream
+    async with live_server() as base_url:
+        async with httpx.AsyncClient(
+            base_url=base_url, headers={"x-api-key": config.VITE_API_SECRET}, timeout=None
+        ) as client:
+            with contextlib.redirect_stdout(io.StringIO()):
+                samples = await asyncio.gather(*(measure(client, f"session_{i}") for i in range(requests)))
+
+    def p50(key):
+        values = [s[key] for s in samples if key in s]
+        return f"{percentile(values, 50) * 1000:7.1f}ms" if values else "      -  "
+
+    print(
+        f"{endpoint:>12}: ttfb p50={p50('ttfb')}  retrieved p50={p50('retrieved')}  "
+        f"first token p50={p50('first_token')}  total p50={p50('total')}"
+    )
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--llm-ms", type=float, default=300, help="stubbed rewrite+keywords latency")
+    parser.add_argument("--db-ms", type=float, default=40, help="stubbed Neo4j latency")
+    parser.add_argument("--first-token-ms", type=float, default=400, help="stubbed answer time-to-first-token")
+    parser.add_argument("--token-ms", type=float, default=15, help="stubbed delay between answer tokens")
+    parser.add_argument("--tokens", type=int, default=60)
+    args = parser.parse_args()
+
+    install_stubs(
+        args.llm_ms / 1000, args.db_ms / 1000, args.first_token_ms / 1000, args.token_ms / 1000, args.tokens
+    )
+    print(
+        f"{args.requests} concurrent requests, rewrite {args.llm_ms:.0f}ms + retrieval {args.db_ms:.0f}ms, "
+        f"answer {args.first_token_ms:.0f}ms + {args.tokens} x {args.token_ms:.0f}ms"
+    )
+    chat = asyncio.run(run("/chat", args.requests))
+    stream = asyncio.run(run("/chat/stream", args.requests))
+
+    if any(sample.get("tokens") != args.tokens for sample in stream):
+        raise SystemExit("❌ A stream did not deliver the stubbed model's answer token by token")
+    first_token = percentile([sample["first_token"] for sample in stream], 50)
+    chat_total = percentile([sample["total"] for sample in chat], 50)
+    # The stream skips the answer's token tail, which is most of what /chat waits for after the first token
+    if first_token > 0.75 * chat_total:
+        raise SystemExit(f"❌ Streamed first token ({first_token * 1000:.1f}ms) is not well under "
+                         f"the /chat total ({chat_total * 1000:.1f}ms)")
+    print(f"✅ Streamed first token {first_token * 1000:.1f}ms vs /chat total {chat_total * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Single-flight coalescing under a burst of identical /chat requests.
+
+Sends N simultaneous copies of the same opening question (same session) to
+/chat with Gemini stubbed at the client level and Neo4j stubbed below
+read_cypher, then counts the upstream calls that actually went out. Without
+coalescing every request makes its own keyword, retrieval and answer calls;
+with it each distinct call is made once and the other N - 1 callers await
+its result. Fails unless every distinct upstream call ran exactly once,
+unless the requests' details.llm_calls add up to the Gemini generations
+that actually went out, unless a burst split over two sessions still reads Neo4j once per session,
+and unless a retrieval that starts after a write, while a read from before
+the write is still in flight, neither joins that read nor caches its rows.
+
+Usage:
+    python benchmarks/coalescing.py --requests 100 --llm-ms 300 --db-ms 40
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+from collections import Counter
+from types import SimpleNamespace
+
+from common import Timer, api_client, summarize_ms
+
+from cache import answer_cache, retrieval_cache
+from config import config
+from database import async_db
+from embeddings import embedding_service
+from retrieval import retriever
+
+ROWS = [
+    {"entity1": "Zayeem", "relationships": ["LIVES_IN"], "entity2": "Ohio", "path_length": 1},
+    {"entity1": "Zayeem", "relationships": ["DEVELOPED"], "entity2": "AI Memory System", "path_length": 1},
+]
+
+
+class FakeModels:
+    """Stands in for client.aio.models, counting calls per prompt kind"""
+
+    def __init__(self, seconds: float, upstream: Counter):
+        self.seconds = seconds
+        self.upstream = upstream
+
+    async def generate_content(self, model, contents, config=None):
+        kind = "keywords" if "keyword extraction system" in contents else "llm"
+        self.upstream[kind] += 1
+        await asyncio.sleep(self.seconds)
+        text = '["Zayeem"]' if kind == "keywords" else "Zayeem lives in Ohio."
+        return SimpleNamespace(text=text)
+
+    async def embed_content(self, model, contents, config=None):
+        self.upstream["embed"] += 1
+        await asyncio.sleep(self.seconds / 4)
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=[0.1] * 8)])
+
+
+def install_stubs(llm_seconds: float, db_seconds: float, upstream: Counter):
+    embedding_service.client = SimpleNamespace(aio=SimpleNamespace(models=FakeModels(llm_seconds, upstream)))
+
+    async def execute_cypher(query, params=None):
+        upstream["neo4j"] += 1
+        await asyncio.sleep(db_seconds)
+        return [dict(row) for row in ROWS]
+
+    async_db.execute_cypher = execute_cypher
+
+
+async def burst(requests: int, llm_seconds: float, db_seconds: float, sessions: int = 1) -> tuple:
+    upstream = Counter()
+    install_stubs(llm_seconds, db_seconds, upstream)
+    retrieval_cache.clear()
+    answer_cache.clear()
+    flights = (embedding_service.generate_flight, embedding_service.embed_flight, async_db.read_flight)
+    for flight in flights:
+        flight.calls = flight.coalesced = 0
+
+    latencies = []
+    reported = Counter()
+
+    async def one(client, i):
+        with Timer() as timer:
+            response = await client.post(
+                "/chat",
+                json={"message": "What is Zayeem working on?", "action_type": "ask_question",
+                      "session_id": f"session_1700000000000_demo{i % sessions}"},
+            )
+            response.raise_for_status()
+        latencies.append(timer.elapsed)
+        details = response.json()["details"]
+        reported["llm_calls"] += details["llm_calls"]
+        reported["coalesced_calls"] += details["coalesced_calls"]
+
+    async with api_client() as client:
+        with contextlib.redirect_stdout(io.StringIO()):
+            await asyncio.gather(*(one(client, i) for i in range(requests)))
+
+    return upstream, {flight.name: flight.coalesced for flight in flights}, latencies, reported
+
+
+async def write_during_read(db_seconds: float) -> tuple:
+    """A read in flight, a write committing under it, then a second read of
+    the same query. Returns (rows the second read saw, rows cached after it)."""
+    session_id = "session_1700000000000_writer"
+    committed = [dict(ROWS[0])]
+
+    async def execute_cypher(query, params=None):
+        # Neo4j reads see the data committed when they start
+        rows = [dict(row) for row in committed]
+        await asyncio.sleep(db_seconds)
+        return rows
+
+    async_db.execute_cypher = execute_cypher
+    retrieval_cache.clear()
+    keywords = ["Zayeem"]
+
+    before = asyncio.create_task(retriever.retrieve(keywords, session_id))
+    await asyncio.sleep(db_seconds / 4)
+    committed.append(dict(ROWS[1]))
+    retrieval_cache.invalidate_for_write(session_id)
+    after = await retriever.retrieve(keywords, session_id)
+    await before
+
+    cached = retrieval_cache.lookup(keywords, session_id)
+    return after["results"], cached["results"] if cached is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--llm-ms", type=float, default=300, help="stubbed Gemini latency")
+    parser.add_argument("--db-ms", type=float, default=40, help="stubbed Neo4j latency")
+    args = parser.parse_args()
+
+    config.LOCAL_KEYWORDS_ENABLED = False
+
+    results = {}
+    for enabled in (False, True):
+        config.SINGLE_FLIGHT_ENABLED = enabled
+        upstream, coalesced, latencies, reported = asyncio.run(burst(args.requests, args.llm_ms / 1000, args.db_ms / 1000))
+        name = "coalesced" if enabled else "duplicate"
+        results[name] = upstream
+        calls = ", ".join(f"{kind}={count}" for kind, count in sorted(upstream.items()))
+        print(f"{name:>9}: {args.requests} identical /chat  upstream calls: {calls}  {summarize_ms(latencies)}")
+        if enabled:
+            print("           joined in-flight calls: " + ", ".join(f"{k}={v}" for k, v in coalesced.items()))
+        # Requests that joined another's generation must not report it as their own
+        generations = upstream["keywords"] + upstream["llm"]
+        if reported["llm_calls"] != generations:
+            raise SystemExit(
+                f"❌ Requests reported {reported['llm_calls']} LLM calls for {generations} generations "
+                f"({reported['coalesced_calls']} reported as coalesced)"
+            )
+
+    duplicate, coalesced = results["duplicate"], results["coalesced"]
+    if any(count != 1 for count in coalesced.values()) or set(coalesced) != set(duplicate):
+        raise SystemExit("❌ Expected exactly one upstream call per distinct call")
+    print(f"✅ {sum(duplicate.values())} upstream calls collapsed to {sum(coalesced.values())}")
+
+    # Different sessions see different data, so their Neo4j reads stay separate
+    upstream, _, _, _ = asyncio.run(burst(args.requests, args.llm_ms / 1000, args.db_ms / 1000, sessions=2))
+    if upstream["neo4j"] != 2:
+        raise SystemExit(f"❌ Expected one Neo4j read per session, got {upstream['neo4j']}")
+    print("✅ Requests from 2 sessions made 2 Neo4j reads (one per visibility scope)")
+
+    # A read started after a write must not join (and cache) one from before it
+    after, cached = asyncio.run(write_during_read(args.db_ms / 1000))
+    if len(after) != 2 or (cached is not None and len(cached) != 2):
+        raise SystemExit(f"❌ Read after a write served pre-write rows: saw {len(after)}, cached {cached and len(cached)}")
+    print("✅ A read after a write did not join the in-flight pre-write read")
+
+
+if __name__ == "__main__":
+    main()
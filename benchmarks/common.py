@@ -0,0 +1,75 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks run from the repository root, e.g. `python benchmarks/chat_concurrency.py`,
+and never need live Gemini or Neo4j credentials: each script stubs the
+backends it exercises.
+"""
+
+import asyncio
+import contextlib
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from latency import percentile  # re-exported for the benchmark scripts
+
+
+def summarize_ms(samples: list) -> str:
+    """Format p50/p99 latency (seconds in, milliseconds out)"""
+    return (
+        f"p50={percentile(samples, 50) * 1000:8.1f}ms  "
+        f"p99={percentile(samples, 99) * 1000:8.1f}ms"
+    )
+
+
+class Timer:
+    """Context manager recording wall time in seconds"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def api_client():
+    """httpx client bound to the FastAPI app in-process (lifespan is not run)"""
+    import httpx
+    from app import app
+    from config import config
+
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://bench",
+        headers={"x-api-key": config.VITE_API_SECRET},
+        timeout=None,
+    )
+
+
+@contextlib.asynccontextmanager
+async def live_server():
+    """Serve the FastAPI app with uvicorn on a free local port (lifespan is not run).
+
+    Unlike api_client(), responses arrive over a real socket as they are sent,
+    so streaming timings such as time-to-first-byte are meaningful. Yields
+    the base URL.
+    """
+    import uvicorn
+    from app import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, lifespan="off", log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await task
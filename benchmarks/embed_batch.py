@@ -0,0 +1,97 @@
+"""
+Benchmark: one POST /embed/batch vs. a loop of POST /embed over the same texts.
+
+The Gemini embedder is stubbed with a fixed per-call latency plus a small
+per-text cost, and Neo4j writes with a fixed per-transaction latency. The
+embedding cache is disabled so every text pays for an embedding.
+
+Usage:
+    python benchmarks/embed_batch.py --texts 1000 --call-ms 80 --tx-ms 5
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+from types import SimpleNamespace
+
+from common import Timer, api_client
+
+from database import async_db
+from embedding_cache import embedding_cache
+from embeddings import embedding_service
+
+DIMENSION = 768
+
+
+def install_stubs(call_seconds: float, text_seconds: float, tx_seconds: float) -> dict:
+    counters = {"embed_calls": 0, "transactions": 0}
+    ids = itertools.count()
+
+    async def embed_content(model, contents):
+        batch = contents if isinstance(contents, list) else [contents]
+        counters["embed_calls"] += 1
+        await asyncio.sleep(call_seconds + text_seconds * len(batch))
+        return SimpleNamespace(
+            embeddings=[SimpleNamespace(values=[0.1] * DIMENSION) for _ in batch]
+        )
+
+    async def create_embedding_node(text, embedding):
+        counters["transactions"] += 1
+        await asyncio.sleep(tx_seconds)
+        return {"id": next(ids)}
+
+    async def create_embedding_nodes(texts, embeddings):
+        counters["transactions"] += 1
+        await asyncio.sleep(tx_seconds)
+        return [next(ids) for _ in texts]
+
+    embedding_service.client = SimpleNamespace(
+        aio=SimpleNamespace(models=SimpleNamespace(embed_content=embed_content))
+    )
+    async_db.create_embedding_node = create_embedding_node
+    async_db.create_embedding_nodes = create_embedding_nodes
+    embedding_cache.max_bytes = 0
+    return counters
+
+
+async def run_loop(texts: list) -> None:
+    async with api_client() as client:
+        for text in texts:
+            response = await client.post("/embed", json={"text": text})
+            response.raise_for_status()
+
+
+async def run_batch(texts: list) -> None:
+    async with api_client() as client:
+        response = await client.post("/embed/batch", json={"texts": texts})
+        response.raise_for_status()
+        assert response.json()["succeeded"] == len(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--texts", type=int, default=1000)
+    parser.add_argument("--call-ms", type=float, default=80, help="stubbed latency per embed call")
+    parser.add_argument("--text-us", type=float, default=200, help="stubbed cost per embedded text")
+    parser.add_argument("--tx-ms", type=float, default=5, help="stubbed latency per Neo4j transaction")
+    args = parser.parse_args()
+
+    texts = [f"Fact number {i} about the knowledge graph" for i in range(args.texts)]
+    timings = {}
+    for name, runner in (("loop /embed", run_loop), ("/embed/batch", run_batch)):
+        counters = install_stubs(args.call_ms / 1000, args.text_us / 1_000_000, args.tx_ms / 1000)
+        with Timer() as timer, contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(runner(texts))
+        timings[name] = timer.elapsed
+        print(
+            f"{name:>13}: {timer.elapsed:7.2f}s  embed calls={counters['embed_calls']:5d}  "
+            f"transactions={counters['transactions']:5d}"
+        )
+
+    print(f"speedup: {timings['loop /embed'] / timings['/embed/batch']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
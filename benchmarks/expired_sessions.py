@@ -0,0 +1,188 @@
+"""
+Batched session cleanup against the single-transaction cleanup it replaced,
+on a live Neo4j (NEO4J_URI etc. from .env).
+
+Seeds synthetic :Entity nodes (labeled :BenchNode) spread over many expired
+sessions and a few live ones, each session node linked to a global hub, plus
+session relationships between global nodes (facts sessions added about
+global entities). expires_at and degree are written the way
+create_graph_from_json maintains them. Then runs one SessionCleaner pass and
+checks that:
+
+  * every expired session node and orphaned global relationship is gone
+  * live sessions and the global layer are untouched
+  * global nodes' degree matches their actual relationship count
+
+The cleaner pass also removes any real expired sessions in that database.
+With --legacy-max, the old query (full scan, session_id parsing, one
+transaction) runs first on a copy of the data at that size for comparison.
+
+Usage:
+    python benchmarks/expired_sessions.py --nodes 1000000 --legacy-max 100000
+"""
+
+import argparse
+import asyncio
+import time
+
+from common import Timer
+
+from database import async_db, db
+from init_global_nodes import create_indexes
+from session_cleanup import SessionCleaner
+
+SESSIONS = 2000
+GLOBAL_NODES = 50
+
+# cleanup_sessions.cleanup_old_sessions before expires_at
+LEGACY_QUERY = """
+MATCH (n)
+WHERE n.session_id <> 'global'
+  AND n.session_id IS NOT NULL
+  AND toInteger(split(n.session_id, '_')[1]) < $cutoff_timestamp
+CALL {
+    WITH n
+    MATCH (n)--(other) WHERE other <> n
+    SET other.degree = coalesce(other.degree, 1) - 1
+}
+DETACH DELETE n
+RETURN count(n) as deleted_count
+"""
+
+
+def seed(nodes: int, batch: int = 10000):
+    """nodes session nodes over SESSIONS sessions (1 in 10 still live), each
+    linked to a global hub, and 3 session relationships per session between
+    global hubs"""
+    db.execute_cypher(
+        """
+        UNWIND range(0, $count - 1) AS i
+        CREATE (:Entity:BenchNode {normalized_id: 'expiry_global_' + toString(i),
+                                   name: 'Global ' + toString(i), session_id: 'global', degree: 0})
+        """,
+        {"count": GLOBAL_NODES},
+    )
+    for start in range(0, nodes, batch):
+        db.execute_cypher(
+            """
+            UNWIND range($start, $end - 1) AS i
+            WITH i, i % $sessions AS s
+            MATCH (g:BenchNode {normalized_id: 'expiry_global_' + toString(i % $globals)})
+            CREATE (n:Entity:BenchNode {
+                normalized_id: 'expiry_' + toString(i),
+                name: 'Session node ' + toString(i),
+                session_id: 'session_' + toString(CASE WHEN s % 10 = 0 THEN 9999999999999 ELSE 1000 END) + '_' + toString(s),
+                expires_at: datetime() + duration({hours: CASE WHEN s % 10 = 0 THEN 24 ELSE -1 END}),
+                degree: 1
+            })
+            CREATE (n)-[:RELATED_TO {session_id: n.session_id, created_at: datetime(), expires_at: n.expires_at}]->(g)
+            SET g.degree = g.degree + 1
+            """,
+            {"start": start, "end": min(start + batch, nodes), "sessions": SESSIONS, "globals": GLOBAL_NODES},
+        )
+    db.execute_cypher(
+        """
+        UNWIND range(0, $sessions * 3 - 1) AS i
+        WITH i, (i / 3) % $sessions AS s
+        MATCH (a:BenchNode {normalized_id: 'expiry_global_' + toString(i % $globals)})
+        MATCH (b:BenchNode {normalized_id: 'expiry_global_' + toString((i * 7 + 1) % $globals)})
+        CREATE (a)-[:KNOWS {
+            session_id: 'session_' + toString(CASE WHEN s % 10 = 0 THEN 9999999999999 ELSE 1000 END) + '_' + toString(s),
+            created_at: datetime(),
+            expires_at: datetime() + duration({hours: CASE WHEN s % 10 = 0 THEN 24 ELSE -1 END})
+        }]->(b)
+        SET a.degree = a.degree + 1, b.degree = b.degree + 1
+        """,
+        {"sessions": SESSIONS, "globals": GLOBAL_NODES},
+    )
+    db.execute_cypher("CALL db.awaitIndexes(600)")
+
+
+def cleanup():
+    db.execute_cypher(
+        """
+        MATCH (n:BenchNode)
+        CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS
+        """
+    )
+
+
+def verify():
+    remaining = db.execute_cypher(
+        """
+        MATCH (n:BenchNode) WHERE n.session_id <> 'global'
+        RETURN count(CASE WHEN n.expires_at <= datetime() THEN 1 END) AS expired, count(*) AS total
+        """
+    )[0]
+    orphans = db.execute_cypher(
+        """
+        MATCH (:BenchNode {session_id: 'global'})-[r]->(:BenchNode {session_id: 'global'})
+        RETURN count(CASE WHEN r.expires_at <= datetime() THEN 1 END) AS expired, count(*) AS total
+        """
+    )[0]
+    wrong_degree = db.execute_cypher(
+        """
+        MATCH (g:BenchNode {session_id: 'global'})
+        WITH g, size([(g)--() | 1]) AS actual
+        WHERE g.degree <> actual
+        RETURN count(g) AS wrong
+        """
+    )[0]["wrong"]
+    print(f"  left: {remaining['expired']} expired of {remaining['total']} session nodes, "
+          f"{orphans['expired']} expired of {orphans['total']} global relationships, "
+          f"{wrong_degree} global nodes with a wrong degree")
+    return remaining["expired"] == 0 and orphans["expired"] == 0 and wrong_degree == 0
+
+
+async def run_cleaner(batch: int) -> dict:
+    await async_db.connect()
+    try:
+        return await SessionCleaner(batch).run(async_db)
+    finally:
+        await async_db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, default=1000000)
+    parser.add_argument("--batch", type=int, default=10000)
+    parser.add_argument("--legacy-max", type=int, default=100000,
+                        help="node count to run the old single-transaction query at (0 to skip)")
+    args = parser.parse_args()
+
+    db.connect()
+    try:
+        cleanup()
+        create_indexes()
+
+        if args.legacy_max:
+            seed(min(args.nodes, args.legacy_max))
+            started = time.perf_counter()
+            try:
+                deleted = db.execute_cypher(LEGACY_QUERY, {"cutoff_timestamp": 10 ** 12})[0]["deleted_count"]
+                print(f"legacy  {min(args.nodes, args.legacy_max):>9,} nodes: deleted {deleted:,} nodes "
+                      f"in {time.perf_counter() - started:.2f}s (orphaned global relationships kept)")
+            except Exception as e:
+                print(f"legacy  failed after {time.perf_counter() - started:.2f}s: {e}")
+            cleanup()
+
+        with Timer() as seeding:
+            seed(args.nodes)
+        print(f"seeded {args.nodes:,} session nodes in {seeding.elapsed:.0f}s")
+
+        report = asyncio.run(run_cleaner(args.batch))
+        print(f"batched {args.nodes:>9,} nodes: deleted {report['nodes_deleted']:,} nodes, "
+              f"{report['relationships_deleted']:,} session relationships and "
+              f"{report['global_relationships_deleted']:,} orphaned global relationships "
+              f"in {report['duration_seconds']:.2f}s")
+
+        if not verify():
+            raise SystemExit("❌ Cleanup left expired data behind or broke global degrees")
+        print("✅ Expired sessions removed, live sessions and global degrees intact")
+    finally:
+        cleanup()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
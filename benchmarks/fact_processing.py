@@ -0,0 +1,136 @@
+"""
+/chat add_fact with the single combined rewrite + extraction call against the
+previous two sequential calls (rewrite_query, then extract_graph_structure).
+
+Gemini is stubbed at the client with a fixed latency per call. Every fact is
+a pronoun follow-up with chat history, so the old path always made two
+calls. --invalid-rate of the combined responses are malformed to exercise
+the two-step fallback. LLM calls and latency per request come from the
+/chat details payload; Neo4j writes are stubbed.
+
+Usage:
+    python benchmarks/fact_processing.py --facts 200 --llm-ms 300 --invalid-rate 0.05
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import random
+import re
+from types import SimpleNamespace
+
+from common import api_client, percentile
+
+from config import config
+from database import async_db
+from embeddings import embedding_service
+
+PEOPLE = ["Zayeem", "Alice", "Priya", "Marcus", "Lena", "Tomas"]
+PLACES = ["Ohio", "Berlin", "Lagos", "Osaka", "Lima"]
+
+
+def graph_for(person: str, place: str) -> dict:
+    return {
+        "nodes": [
+            {"id": person.lower(), "label": "Person", "properties": {"name": person}},
+            {"id": place.lower(), "label": "Location", "properties": {"name": place}},
+        ],
+        "edges": [{"from": person.lower(), "to": place.lower(), "type": "LIVES_IN", "properties": {}}],
+    }
+
+
+class FakeModels:
+    """client.aio.models stand-in that answers the rewrite, extraction and combined prompts"""
+
+    def __init__(self, seconds: float, invalid_rate: float, rng: random.Random):
+        self.seconds = seconds
+        self.invalid_rate = invalid_rate
+        self.rng = rng
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self.seconds)
+        history = re.search(r"Chat History:\s*user: (\w+) is my friend", contents)
+        person = history.group(1) if history else None
+        if "Fact Processing Engine" in contents:
+            place = re.search(r'Current Message: "he lives in (\w+)"', contents).group(1)
+            if self.rng.random() < self.invalid_rate:
+                return SimpleNamespace(text='{"rewritten_fact": "", "graph": {"nodes": []}}')
+            return SimpleNamespace(text=json.dumps({
+                "rewritten_fact": f"{person} lives in {place}", "graph": graph_for(person, place),
+            }))
+        if "query rewriting assistant" in contents:
+            place = re.search(r'Current Question: "he lives in (\w+)"', contents).group(1)
+            return SimpleNamespace(text=f"{person} lives in {place}")
+        person, place = re.search(r"Text: (\w+) lives in (\w+)", contents).groups()
+        return SimpleNamespace(text=json.dumps(graph_for(person, place)))
+
+
+async def legacy_process_fact(message: str, history: list) -> dict:
+    """add_fact before the combined call"""
+    rewritten = await embedding_service.rewrite_query_async(message, history)
+    graph = await embedding_service.extract_graph_structure_async(rewritten)
+    return {"rewritten_fact": rewritten, "graph": graph, "source": "two_step"}
+
+
+async def run(facts: int, llm_seconds: float, invalid_rate: float, legacy: bool) -> dict:
+    rng = random.Random(11)
+    embedding_service.client = SimpleNamespace(aio=SimpleNamespace(models=FakeModels(llm_seconds, invalid_rate, rng)))
+    process_fact = embedding_service.process_fact_async
+    if legacy:
+        embedding_service.process_fact_async = legacy_process_fact
+
+    written = []
+
+    async def create_graph_from_json(graph_data, session_id=None, bulk=None):
+        written.append(graph_data)
+        return {"nodes_created": len(graph_data["nodes"]), "edges_created": len(graph_data["edges"]),
+                "nodes": [], "edges": [], "touched_global": False, "touched_global_edges": False}
+
+    async_db.create_graph_from_json = create_graph_from_json
+
+    outcome = {"latency_ms": [], "calls": [], "sources": {}, "correct": 0}
+    try:
+        async with api_client() as client:
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i in range(facts):
+                    person, place = PEOPLE[i % len(PEOPLE)], PLACES[i % len(PLACES)]
+                    response = await client.post("/chat", json={
+                        "message": f"he lives in {place}",
+                        "action_type": "add_fact",
+                        "history": [{"role": "user", "content": f"{person} is my friend"}],
+                        "session_id": f"session_1700000000000_{i}",
+                    })
+                    response.raise_for_status()
+                    details = response.json()["details"]
+                    outcome["latency_ms"].append(details["llm_latency_ms"])
+                    outcome["calls"].append(details["llm_calls"])
+                    outcome["sources"][details["fact_source"]] = outcome["sources"].get(details["fact_source"], 0) + 1
+                    outcome["correct"] += written[-1] == graph_for(person, place)
+    finally:
+        embedding_service.process_fact_async = process_fact
+    return outcome
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--facts", type=int, default=200)
+    parser.add_argument("--llm-ms", type=float, default=300, help="stubbed Gemini latency per call")
+    parser.add_argument("--invalid-rate", type=float, default=0.05, help="share of malformed combined responses")
+    args = parser.parse_args()
+
+    config.SINGLE_FLIGHT_ENABLED = False
+    for name, legacy in (("two calls", True), ("combined", False)):
+        outcome = asyncio.run(run(args.facts, args.llm_ms / 1000, args.invalid_rate, legacy))
+        calls = outcome["calls"]
+        print(
+            f"{name:>9}: LLM calls/fact={sum(calls) / len(calls):.2f}  "
+            f"LLM latency p50={percentile(outcome['latency_ms'], 50):7.1f}ms "
+            f"p95={percentile(outcome['latency_ms'], 95):7.1f}ms  "
+            f"graphs correct={outcome['correct']}/{args.facts}  sources={outcome['sources']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Gemini call scheduler under a bulk import burst, against a fake model.
+
+The fake model adds latency, rejects calls with 429 beyond its concurrency
+capacity, and fails a share of the rest with random 429/503s. A bulk burst
+(import-style extraction calls in the bulk lane) starts first, then
+interactive /chat-style calls arrive while it is running. Three runs:
+
+  unscheduled  no pool limit and no retries: what EmbeddingService did before
+  fifo         the scheduler with every call in one lane
+  scheduled    MODEL_CONCURRENCY slots, bulk lane below interactive, token
+               bucket, jittered backoff
+
+Reports interactive latency, errors, retries and the scheduler's queue
+metrics. Fails if the scheduled run lets any call error or if interactive
+calls wait behind the bulk burst.
+
+Usage:
+    python benchmarks/gemini_scheduler.py --bulk 200 --interactive 20 --capacity 8
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+from types import SimpleNamespace
+
+from common import percentile
+
+from config import config
+from embeddings import embedding_service
+from model_scheduler import BULK, INTERACTIVE, model_scheduler
+
+
+class FakeAPIError(Exception):
+    def __init__(self, code: int):
+        super().__init__(f"{code} fake model error")
+        self.code = code
+
+
+class FakeModels:
+    """client.aio.models stand-in with latency, a capacity limit and injected errors"""
+
+    def __init__(self, seconds: float, capacity: int, error_rate: float):
+        self.seconds = seconds
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.active = 0
+        self.calls = 0
+        self.rejected = 0
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        if self.active >= self.capacity or random.random() < self.error_rate:
+            self.rejected += 1
+            await asyncio.sleep(self.seconds / 10)
+            raise FakeAPIError(random.choice((429, 429, 503)))
+        self.active += 1
+        try:
+            await asyncio.sleep(self.seconds * random.uniform(0.8, 1.2))
+        finally:
+            self.active -= 1
+        return SimpleNamespace(text=f"answer to {contents}")
+
+
+async def run(bulk: int, interactive: int, llm_seconds: float, capacity: int, error_rate: float,
+              lanes: bool = True) -> dict:
+    models = FakeModels(llm_seconds, capacity, error_rate)
+    embedding_service.client = SimpleNamespace(aio=SimpleNamespace(models=models))
+    model_scheduler.pools = {}
+    outcome = {"interactive_ms": [], "errors": {"bulk": 0, "interactive": 0}}
+
+    async def bulk_call(i):
+        try:
+            with model_scheduler.lane(BULK if lanes else INTERACTIVE):
+                await embedding_service._generate_async(f"extract chunk {i}")
+        except FakeAPIError:
+            outcome["errors"]["bulk"] += 1
+
+    async def interactive_call(i):
+        await asyncio.sleep(llm_seconds * (1 + i / 4))
+        start = asyncio.get_running_loop().time()
+        try:
+            await embedding_service._generate_async(f"answer question {i}")
+            outcome["interactive_ms"].append((asyncio.get_running_loop().time() - start) * 1000)
+        except FakeAPIError:
+            outcome["errors"]["interactive"] += 1
+
+    start = asyncio.get_running_loop().time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(
+            *(bulk_call(i) for i in range(bulk)),
+            *(interactive_call(i) for i in range(interactive)),
+        )
+    outcome["wall"] = asyncio.get_running_loop().time() - start
+    outcome["upstream_calls"] = models.calls
+    outcome["rejected"] = models.rejected
+    outcome["stats"] = model_scheduler.stats().get(config.GENERATION_MODEL, {})
+    return outcome
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--bulk", type=int, default=200)
+    parser.add_argument("--interactive", type=int, default=20)
+    parser.add_argument("--llm-ms", type=float, default=200, help="fake model latency")
+    parser.add_argument("--capacity", type=int, default=8, help="concurrent calls the fake model accepts")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="share of accepted calls failing with 429/503")
+    args = parser.parse_args()
+
+    random.seed(7)
+    config.SINGLE_FLIGHT_ENABLED = False
+    config.MODEL_BACKOFF_BASE = args.llm_ms / 1000
+    config.MODEL_BACKOFF_MAX = args.llm_ms / 1000 * 8
+
+    scheduled = None
+    for name in ("unscheduled", "fifo", "scheduled"):
+        if name == "unscheduled":
+            config.MODEL_CONCURRENCY, config.MODEL_MAX_RETRIES = 10 ** 6, 0
+        else:
+            config.MODEL_CONCURRENCY, config.MODEL_MAX_RETRIES = args.capacity, 6
+        outcome = asyncio.run(run(args.bulk, args.interactive, args.llm_ms / 1000, args.capacity, args.error_rate,
+                                  lanes=name != "fifo"))
+        latencies = outcome["interactive_ms"]
+        print(
+            f"{name:>11}: errors bulk={outcome['errors']['bulk']:>3} interactive={outcome['errors']['interactive']:>2}  "
+            f"interactive p50={percentile(latencies, 50):7.1f}ms p95={percentile(latencies, 95):7.1f}ms  "
+            f"upstream calls={outcome['upstream_calls']:>4} (429/503: {outcome['rejected']})  "
+            f"wall={outcome['wall']:.2f}s"
+        )
+        stats = outcome["stats"]
+        print(f"             retries={stats.get('retries', 0)}  wait_ms={stats.get('wait_ms')}")
+        scheduled = outcome
+
+    if any(scheduled["errors"].values()):
+        raise SystemExit("❌ Calls failed despite retries")
+    if percentile(scheduled["interactive_ms"], 95) > args.llm_ms * 6:
+        raise SystemExit("❌ Interactive calls waited behind the bulk burst")
+    print("✅ No failed calls; interactive calls stayed ahead of the bulk burst")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+How many /chat questions the local entity dictionary answers without Gemini,
+and how much query-processing latency that saves.
+
+A synthetic graph of people, places and projects fills the dictionary. The
+question log mixes direct questions, misspelled names, pronoun follow-ups
+with chat history, questions about names the graph does not know, and
+questions using an ordinary word that is also a node name ("go" next to a
+Go node); the last two must escalate. Gemini is stubbed with a fixed latency and returns the
+expected answer, so local results can be checked against it.
+
+Usage:
+    python benchmarks/local_keywords.py --entities 5000 --questions 2000 --llm-ms 300
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from common import percentile
+
+from config import config
+from embeddings import embedding_service, entity_dictionary
+
+SYLLABLES = ["za", "yee", "mo", "ra", "li", "ka", "the", "do", "ri", "an", "so", "vel", "ni", "ta", "ro", "ma"]
+PERSON_QUESTIONS = ["Where does {} live?", "What does {} work on?", "Who is {} friends with?", "What hobbies does {} have?"]
+THING_QUESTIONS = ["What is {}?", "Who built {}?", "Where is {}?"]
+FOLLOW_UPS = [("Where does he live?", "Where does {} live?"), ("What is her job?", "What is {}'s job?"),
+              ("Who built it?", "Who built {}?")]
+
+
+def make_name(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def build_graph(entities: int, rng: random.Random) -> tuple:
+    people, things = set(), set()
+    while len(people) < entities * 2 // 3:
+        people.add(make_name(rng))
+    while len(things) < entities - len(people):
+        things.add(f"{make_name(rng)} {rng.choice(['Project', 'Lake', 'Labs', 'City'])}")
+    return sorted(people), sorted(things)
+
+
+def misspell(name: str, rng: random.Random) -> str:
+    i = rng.randrange(1, len(name) - 1)
+    return name[:i] + name[i + 1:] if rng.random() < 0.5 else name[:i] + name[i] + name[i:]
+
+
+def question_log(people: list, things: list, questions: int, rng: random.Random) -> list:
+    """[(question, history, expected_rewrite, expected_keywords)]"""
+    log = []
+    for _ in range(questions):
+        roll = rng.random()
+        if roll < 0.45:
+            person = rng.choice(people)
+            q = rng.choice(PERSON_QUESTIONS).format(person)
+            log.append((q, [], q, [person]))
+        elif roll < 0.6:
+            thing = rng.choice(things)
+            q = rng.choice(THING_QUESTIONS).format(thing)
+            log.append((q, [], q, [thing]))
+        elif roll < 0.7:
+            person = rng.choice([p for p in people if len(p) >= 6] or people)
+            q = rng.choice(PERSON_QUESTIONS).format(misspell(person, rng))
+            log.append((q, [], q, [person]))
+        elif roll < 0.88:
+            pronoun_q, template = rng.choice(FOLLOW_UPS)
+            referent = rng.choice(things if "it" in pronoun_q.split() else people)
+            history = [{"role": "user", "content": f"Tell me about {referent}"},
+                       {"role": "model", "content": "Here is what I know."}]
+            log.append((pronoun_q, history, template.format(referent), [referent]))
+        elif roll < 0.93:
+            # "go" is a verb here, not the Go node
+            person, thing = rng.choice(people), rng.choice(things)
+            q = f"Will {person} go to {thing}?"
+            log.append((q, [], q, [person, thing]))
+        else:
+            # A name the graph has never seen: only the LLM can decide
+            stranger = f"Q{make_name(rng).lower()}"
+            q = f"Tell me about {stranger} and {rng.choice(people)}"
+            log.append((q, [], q, [stranger]))
+    return log
+
+
+async def replay(log: list, local: bool, llm_seconds: float) -> dict:
+    expected = {}
+
+    async def generate(prompt, generation_config=None):
+        await asyncio.sleep(llm_seconds)
+        if "rewritten_query" in prompt:
+            return json.dumps({"rewritten_query": expected["rewrite"], "keywords": expected["keywords"]})
+        return json.dumps(expected["keywords"])
+
+    embedding_service._generate_async = generate
+    config.LOCAL_KEYWORDS_ENABLED = local
+    dictionary = entity_dictionary
+    dictionary.served_locally = dictionary.escalated = 0
+    dictionary.latency_saved = 0.0
+
+    latencies, correct = [], 0
+    for question, history, rewrite, keywords in log:
+        expected.update(rewrite=rewrite, keywords=keywords)
+        start = time.perf_counter()
+        processed = await embedding_service.process_query_optimized_async(question, history, "bench")
+        latencies.append(time.perf_counter() - start)
+        correct += sorted(processed["keywords"]) == sorted(keywords)
+
+    return {"latencies": latencies, "correct": correct, "stats": dictionary.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entities", type=int, default=5000)
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--llm-ms", type=float, default=300, help="stubbed Gemini latency")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    people, things = build_graph(args.entities, rng)
+    dictionary = entity_dictionary
+    for name in people:
+        dictionary.add(name, name.lower(), "Person")
+    for name in things:
+        dictionary.add(name, name.lower().replace(" ", "_"), "Project")
+    dictionary.add("Go", "go", "Project")
+    log = question_log(people, things, args.questions, rng)
+
+    start = time.perf_counter()
+    for question, history, _, _ in log:
+        dictionary.process_query(question, history, "bench")
+    per_query_us = (time.perf_counter() - start) / len(log) * 1e6
+    print(f"{len(dictionary)} dictionary phrases, local stage costs {per_query_us:.0f}us per question")
+
+    for local in (False, True):
+        run = asyncio.run(replay(log, local, args.llm_ms / 1000))
+        latencies, stats = run["latencies"], run["stats"]
+        print(
+            f"local stage {'on ' if local else 'off'}: served locally {stats['local_rate'] * 100:5.1f}%  "
+            f"keywords correct {run['correct'] / len(log) * 100:5.1f}%  "
+            f"p50={percentile(latencies, 50) * 1000:6.1f}ms  p95={percentile(latencies, 95) * 1000:6.1f}ms  "
+            f"total={sum(latencies):6.1f}s  latency saved={stats['latency_saved_ms'] / 1000:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+/chat end to end on the offline fake model backend (MODEL_BACKEND=fake).
+
+Adds facts and asks questions about them through /chat with no Gemini key
+or network: FakeBackend extracts the graph from each fact, rewrites pronoun
+follow-ups and answers from the retrieved paths, with latencies drawn from
+FAKE_MODEL_LATENCY and FAKE_MODEL_ERROR_RATE of the calls failing with a
+retryable 429/503. Neo4j is stubbed by an in-memory edge list. The run is
+repeated with the same seed and fails unless both runs give the same
+answers and the same simulated model latencies.
+
+Usage:
+    python benchmarks/offline_backend.py --facts 50 --error-rate 0.05 --median-ms 200
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+
+from common import Timer, api_client, percentile
+
+from cache import answer_cache, retrieval_cache
+from config import config
+from database import async_db
+from embeddings import embedding_service
+from model_backends import FakeBackend
+from model_scheduler import model_scheduler
+
+PEOPLE = ["Zayeem", "Alice", "Priya", "Marcus", "Lena", "Tomas"]
+FACTS = ["{} lives in {}", "{} works at {}", "{} loves {}"]
+OBJECTS = {"lives in": ["Ohio", "Berlin", "Lagos"], "works at": ["Google", "Acme", "Orbit Labs"],
+           "loves": ["Football", "Chess", "Jazz"]}
+QUESTIONS = {"lives in": "Where does {} live?", "works at": "Where does {} work?", "loves": "What does {} love?"}
+
+
+def install_graph_store() -> list:
+    edges = []
+
+    async def create_graph_from_json(graph_data, session_id=None, bulk=None):
+        names = {node["id"]: node["properties"]["name"] for node in graph_data["nodes"]}
+        for edge in graph_data["edges"]:
+            edges.append((names[edge["from"]], edge["type"], names[edge["to"]]))
+        return {"nodes_created": len(graph_data["nodes"]), "edges_created": len(graph_data["edges"]),
+                "nodes": [], "edges": [], "touched_global": False, "touched_global_edges": False}
+
+    async def execute_cypher(query, params=None):
+        anchors = set(params.get("anchor_ids") or [])
+        rows = []
+        for a, rel, b in edges:
+            for one, other in ((a, b), (b, a)):
+                if one.lower().replace(" ", "_") in anchors:
+                    rows.append({"entity1": one, "relationships": [rel], "entity2": other, "path_length": 1})
+        return rows
+
+    async_db.create_graph_from_json = create_graph_from_json
+    async_db.execute_cypher = execute_cypher
+    return edges
+
+
+async def run(facts: int, seed: int) -> dict:
+    embedding_service.backend = backend = FakeBackend(seed=seed)
+    model_scheduler.pools = {}
+    retrieval_cache.clear()
+    answer_cache.clear()
+    edges = install_graph_store()
+    rng = random.Random(seed)
+
+    outcome = {"fact_ms": [], "question_ms": [], "answers": [], "correct": 0}
+    async with api_client() as client:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(facts):
+                person = rng.choice(PEOPLE)
+                relation = rng.choice(list(OBJECTS))
+                obj = rng.choice(OBJECTS[relation])
+                session_id = f"session_1700000000000_offline{i}"
+                # A follow-up with a pronoun, so the fact needs rewriting
+                history = [{"role": "user", "content": f"Tell me about {person}"}]
+                with Timer() as timer:
+                    response = await client.post("/chat", json={
+                        "message": f"he {relation} {obj}", "history": history,
+                        "action_type": "add_fact", "session_id": session_id,
+                    })
+                    response.raise_for_status()
+                outcome["fact_ms"].append(timer.elapsed * 1000)
+
+                with Timer() as timer:
+                    response = await client.post("/chat", json={
+                        "message": QUESTIONS[relation].format(person), "action_type": "ask_question",
+                        "session_id": session_id,
+                    })
+                    response.raise_for_status()
+                outcome["question_ms"].append(timer.elapsed * 1000)
+                answer = response.json()["response"]
+                outcome["answers"].append(answer)
+                outcome["correct"] += obj in answer
+
+    outcome["edges"] = len(edges)
+    outcome["backend"] = backend.stats()
+    outcome["retries"] = sum(pool["retries"] for pool in model_scheduler.stats().values())
+    return outcome
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--facts", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--median-ms", type=float, default=200, help="lognormal median generation latency")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="FAKE_MODEL_ERROR_RATE")
+    args = parser.parse_args()
+
+    config.MODEL_BACKEND = "fake"
+    config.FAKE_MODEL_LATENCY = {"generate": {"dist": "lognormal", "median_ms": args.median_ms, "sigma": 0.3},
+                                 "embed": {"dist": "fixed", "ms": 20}}
+    config.FAKE_MODEL_ERROR_RATE = args.error_rate
+    config.MODEL_BACKOFF_BASE = args.median_ms / 1000 / 4
+    config.SINGLE_FLIGHT_ENABLED = False
+    config.GLOBAL_SNAPSHOT_ENABLED = False
+    config.LOCAL_KEYWORDS_ENABLED = False
+
+    runs = [asyncio.run(run(args.facts, args.seed)) for _ in range(2)]
+    for name, outcome in zip(("run 1", "run 2"), runs):
+        print(
+            f"{name}: add_fact p50={percentile(outcome['fact_ms'], 50):6.1f}ms "
+            f"p95={percentile(outcome['fact_ms'], 95):6.1f}ms  "
+            f"ask p50={percentile(outcome['question_ms'], 50):6.1f}ms "
+            f"p95={percentile(outcome['question_ms'], 95):6.1f}ms  "
+            f"edges={outcome['edges']}  correct answers={outcome['correct']}/{args.facts}  "
+            f"model calls={outcome['backend']['calls']} injected errors={outcome['backend']['errors']} "
+            f"retries={outcome['retries']}"
+        )
+
+    first, second = runs
+    if first["answers"] != second["answers"] or first["backend"] != second["backend"]:
+        raise SystemExit("❌ Two runs with the same seed diverged")
+    if first["correct"] != args.facts:
+        raise SystemExit("❌ Some answers missed the fact that was just added")
+    print("✅ Same seed, same answers and model calls; every question answered from its fact")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+/chat add_fact write latency with session facts written to Neo4j vs. kept in
+the in-process session overlay, and the cleanup load the overlay removes.
+
+Gemini (graph extraction) is stubbed to return instantly, so the numbers
+are the storage cost alone. The Neo4j write is stubbed with a fixed latency
+(--db-ms, a typical write transaction round trip). The global layer is a
+compiled snapshot, so the overlay resolves global nodes in-process.
+
+Every session adds --facts facts; --promote-rate of the sessions are
+promoted at the end (written to Neo4j), the rest simply expire, which is
+the work cleanup_sessions.py no longer has to do.
+
+Usage:
+    python benchmarks/overlay_writes.py --sessions 200 --facts 10 --db-ms 15 --promote-rate 0.1
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+from common import api_client, percentile
+
+from config import config
+from database import async_db
+from embeddings import embedding_service
+from global_snapshot import compile_snapshot, global_snapshot
+from retrieval import retriever
+from session_overlay import session_overlay
+
+GLOBAL_NODES = ["Zayeem", "AI Memory System", "Python", "React", "Neo4j"]
+
+
+def install_stubs(db_seconds: float, counters: dict):
+    async def extract(text):
+        # "Friend 12 of session_3 knows Zayeem" -> two nodes, one edge
+        name, target = text.split(" knows ")
+        node_id = name.lower().replace(" ", "_")
+        return {
+            "nodes": [
+                {"id": node_id, "label": "Person", "properties": {"name": name}},
+                {"id": target.lower().replace(" ", "_"), "label": "Person", "properties": {"name": target}},
+            ],
+            "edges": [{"from": node_id, "to": target.lower().replace(" ", "_"), "type": "KNOWS", "properties": {}}],
+        }
+
+    async def create_graph_from_json(graph_data, session_id=None, bulk=None):
+        await asyncio.sleep(db_seconds)
+        counters["neo4j_writes"] += 1
+        counters["neo4j_nodes"] += len(graph_data["nodes"])
+        counters["neo4j_edges"] += len(graph_data["edges"])
+        return {
+            "nodes_created": len(graph_data["nodes"]), "edges_created": len(graph_data["edges"]),
+            "nodes": [], "edges": [], "touched_global": False, "touched_global_edges": False,
+        }
+
+    async def execute_cypher(query, params=None):
+        await asyncio.sleep(db_seconds)
+        return []
+
+    embedding_service.extract_graph_structure_async = extract
+    async_db.create_graph_from_json = create_graph_from_json
+    async_db.execute_cypher = execute_cypher
+
+
+async def run(sessions: int, facts: int, promote_rate: float, rng: random.Random, counters: dict) -> list:
+    latencies = []
+    async with api_client() as client:
+        async def session(i: int):
+            session_id = f"session_{int(time.time() * 1000)}_{i}"
+            for j in range(facts):
+                text = f"Friend {j} of {session_id} knows {rng.choice(GLOBAL_NODES)}"
+                start = time.perf_counter()
+                response = await client.post("/chat", json={
+                    "message": text, "action_type": "add_fact", "history": [], "session_id": session_id,
+                })
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            return session_id
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            session_ids = await asyncio.gather(*(session(i) for i in range(sessions)))
+
+            if session_overlay.enabled:
+                # Facts are readable right away, merged with the global layer
+                retrieved = await retriever.retrieve(["Friend 0"], session_ids[0])
+                counters["overlay_results"] = len(retrieved["results"])
+                for session_id in session_ids[:int(sessions * promote_rate)]:
+                    (await client.post(f"/session/{session_id}/promote")).raise_for_status()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--facts", type=int, default=10)
+    parser.add_argument("--db-ms", type=float, default=15, help="stubbed Neo4j write latency")
+    parser.add_argument("--promote-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        global_snapshot.path = os.path.join(directory, "global.csr")
+        global_snapshot.marker_path = global_snapshot.path + ".stale"
+        compile_snapshot(global_snapshot.path, [
+            {"id": f"4:global:{i}", "name": name, "normalized_id": name.lower().replace(" ", "_"), "labels": ["Entity"]}
+            for i, name in enumerate(GLOBAL_NODES)
+        ], [])
+
+        for enabled in (False, True):
+            config.SESSION_OVERLAY_ENABLED = enabled
+            counters = {"neo4j_writes": 0, "neo4j_nodes": 0, "neo4j_edges": 0}
+            install_stubs(args.db_ms / 1000, counters)
+            latencies = asyncio.run(run(args.sessions, args.facts, args.promote_rate, random.Random(1), counters))
+
+            label = "overlay" if enabled else "neo4j  "
+            print(
+                f"{label}: add_fact p50={percentile(latencies, 50) * 1000:6.2f}ms  "
+                f"p95={percentile(latencies, 95) * 1000:6.2f}ms  Neo4j writes={counters['neo4j_writes']:>5}  "
+                f"session nodes/rels written={counters['neo4j_nodes']:>5}/{counters['neo4j_edges']:<5}"
+            )
+            if enabled:
+                stats = session_overlay.stats()
+                expired = args.sessions - stats["sessions_promoted"]
+                print(
+                    f"         overlay store cost {stats['avg_write_ms']:.3f}ms per fact; "
+                    f"{expired} of {args.sessions} sessions never reach Neo4j "
+                    f"(~{expired * args.facts:,} rels and their nodes cleanup_sessions.py no longer deletes); "
+                    f"retrieval over the overlay found {counters['overlay_results']} paths"
+                )
+
+
+if __name__ == "__main__":
+    main()
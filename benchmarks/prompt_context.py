@@ -0,0 +1,155 @@
+"""
+Answer prompt size and latency with the compact, token-budgeted context
+builder against the original one-line-per-row context.
+
+A synthetic social graph (people, places, hobbies, friendships) is queried
+the way the retrieval query does it: undirected 1-2 hop paths from every
+anchor named in the question, up to RETRIEVAL_RESULT_LIMIT rows, so paths
+between two anchors come back from both ends. The recorded question set
+(one or two people per question) is answered with Gemini stubbed by a fake
+model whose latency grows with prompt length. Fails if the compact context
+ever drops the fact that answers the question.
+
+Usage:
+    python benchmarks/prompt_context.py --people 200 --questions 300 --result-limit 100 --budget 300
+"""
+
+import argparse
+import asyncio
+import random
+from collections import defaultdict
+from types import SimpleNamespace
+
+from common import percentile
+
+from answer_context import build_answer_context, estimate_tokens, legacy_context
+from config import config
+from embeddings import embedding_service
+
+PLACES = ["Ohio", "Berlin", "Lagos", "Osaka", "Lima", "Oslo"]
+HOBBIES = ["Football", "Chess", "Guitar", "Painting", "Hiking", "Cooking", "Running"]
+QUESTIONS = {"LIVES_IN": "Where does {} live?", "LOVES": "What does {} love?"}
+
+
+class FakeModels:
+    """client.aio.models stand-in: base latency plus a per-prompt-token cost"""
+
+    def __init__(self, base_seconds: float, per_token_seconds: float):
+        self.base_seconds = base_seconds
+        self.per_token_seconds = per_token_seconds
+        self.prompt_tokens = []
+
+    async def generate_content(self, model, contents, config=None):
+        tokens = estimate_tokens(contents)
+        self.prompt_tokens.append(tokens)
+        await asyncio.sleep(self.base_seconds + tokens * self.per_token_seconds)
+        return SimpleNamespace(text="Here is what I found.")
+
+
+def build_graph(people: int, rng: random.Random) -> tuple:
+    names = [f"Person{i}" for i in range(people)]
+    edges = []
+    for name in names:
+        edges.append((name, "LIVES_IN", rng.choice(PLACES)))
+        for hobby in rng.sample(HOBBIES, rng.randint(1, 3)):
+            edges.append((name, "LOVES", hobby))
+        for friend in rng.sample(names, 3):
+            if friend != name:
+                edges.append((name, "FRIEND_OF", friend))
+    return names, edges
+
+
+def retrieve(anchors: list, edges: list, limit: int) -> list:
+    """Undirected 1-2 hop paths from each anchor, shortest first, like the retrieval query"""
+    adjacency = defaultdict(list)
+    for source, rel, target in edges:
+        adjacency[source].append((rel, target))
+        adjacency[target].append((rel, source))
+    rows = []
+    for anchor in anchors:
+        for rel1, b in adjacency[anchor]:
+            rows.append({"entity1": anchor, "relationships": [rel1], "entity2": b, "path_length": 1})
+            for rel2, c in adjacency[b]:
+                if c != anchor:
+                    rows.append({"entity1": anchor, "relationships": [rel1, rel2], "entity2": c, "path_length": 2})
+    rows.sort(key=lambda row: row["path_length"])
+    return rows[:limit]
+
+
+def question_set(names: list, edges: list, questions: int, rng: random.Random) -> list:
+    """[(question, anchors, expected (subject, relationship, object))]"""
+    facts = [edge for edge in edges if edge[1] in QUESTIONS]
+    recorded = []
+    for _ in range(questions):
+        subject, rel, obj = rng.choice(facts)
+        if rng.random() < 0.5:
+            recorded.append((QUESTIONS[rel].format(subject), [subject], (subject, rel, obj)))
+        else:
+            friend = rng.choice([target for source, r, target in edges if source == subject and r == "FRIEND_OF"] or names)
+            recorded.append((f"{QUESTIONS[rel].format(subject)[:-1]} and does {friend} know them?",
+                             [subject, friend], (subject, rel, obj)))
+    return recorded
+
+
+async def run(recorded: list, edges: list, compact: bool, budget: int, base: float, per_token: float) -> dict:
+    config.ANSWER_CONTEXT_COMPACT = compact
+    config.ANSWER_CONTEXT_TOKENS = budget
+    models = FakeModels(base, per_token)
+    embedding_service.client = SimpleNamespace(aio=SimpleNamespace(models=models))
+
+    outcome = {"context_tokens": [], "latency_ms": [], "missing": 0}
+    for question, anchors, (subject, rel, obj) in recorded:
+        results = retrieve(anchors, edges, config.RETRIEVAL_RESULT_LIMIT)
+        context = build_answer_context(question, results) if compact else legacy_context(results)
+        outcome["context_tokens"].append(estimate_tokens(context))
+        outcome["missing"] += not any(
+            line.startswith(f"{subject} --[{rel}]--> ") and obj in line for line in context.splitlines()
+        )
+
+        started = asyncio.get_running_loop().time()
+        await embedding_service.format_query_results_async(question, results)
+        outcome["latency_ms"].append((asyncio.get_running_loop().time() - started) * 1000)
+    outcome["prompt_tokens"] = models.prompt_tokens
+    return outcome
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--people", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=300)
+    parser.add_argument("--result-limit", type=int, default=config.RETRIEVAL_RESULT_LIMIT, help="RETRIEVAL_RESULT_LIMIT")
+    parser.add_argument("--budget", type=int, default=300, help="ANSWER_CONTEXT_TOKENS")
+    parser.add_argument("--llm-ms", type=float, default=150, help="fake model base latency")
+    parser.add_argument("--ms-per-token", type=float, default=0.2, help="fake model latency per prompt token")
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    config.SINGLE_FLIGHT_ENABLED = False
+    # Every answer is generated, so its latency follows the prompt size
+    config.ANSWER_TEMPLATES_ENABLED = False
+    config.RETRIEVAL_RESULT_LIMIT = args.result_limit
+    names, edges = build_graph(args.people, rng)
+    recorded = question_set(names, edges, args.questions, rng)
+
+    results = {}
+    for name, compact in (("per-row", False), ("compact", True)):
+        outcome = asyncio.run(run(recorded, edges, compact, args.budget, args.llm_ms / 1000, args.ms_per_token / 1000))
+        results[name] = outcome
+        context, prompt, latency = outcome["context_tokens"], outcome["prompt_tokens"], outcome["latency_ms"]
+        print(
+            f"{name:>8}: context tokens mean={sum(context) / len(context):6.1f} p95={percentile(context, 95):4d}  "
+            f"prompt tokens mean={sum(prompt) / len(prompt):6.1f}  "
+            f"answer latency p50={percentile(latency, 50):6.1f}ms p95={percentile(latency, 95):6.1f}ms  "
+            f"answering fact missing={outcome['missing']}"
+        )
+
+    before, after = results["per-row"], results["compact"]
+    saved = 1 - sum(after["prompt_tokens"]) / sum(before["prompt_tokens"])
+    print(f"prompt tokens saved: {saved:.1%}")
+    if after["missing"] > before["missing"]:
+        raise SystemExit("❌ The compact context dropped facts the per-row context kept")
+    print("✅ Every fact the per-row context carried is still in the compact context")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Recent-activity feed (the retrieval query for questions without keywords)
+against the whole-graph `(n)-[*1..2]-(m)` expansion it replaced, on a live
+Neo4j (NEO4J_URI etc. from .env).
+
+Seeds synthetic :Entity nodes (labeled :BenchNode) spread over many sessions
+plus a global layer, ~3 relationships per node, with created_at spread over
+the last year and last_fact_at / degree written the way
+create_graph_from_json maintains them. Then for the feed and the old query:
+
+  * EXPLAINs the plan and fails if the feed contains a full node scan
+  * PROFILEs one run for total db hits
+  * times repeated runs for p50/p99 latency
+
+Before that, a global layer seeded longer ago than
+RETRIEVAL_RECENT_LOOKBACK_DAYS (as init_global_nodes.py leaves it) must still
+show up in the feed of a session with no facts of its own; run it on a
+database whose own global layer is empty so the seeded one is the newest.
+
+Usage:
+    python benchmarks/recent_feed.py --relationships 1000000 --queries 20 --legacy-max 100000
+"""
+
+import argparse
+import time
+
+from anchor_lookup import SCAN_OPERATORS, cleanup, db_hits, operators, run_summary
+from common import summarize_ms
+
+from config import config
+from database import db
+from embeddings import embedding_service
+from init_global_nodes import create_indexes
+
+SESSIONS = 1000
+
+# build_secure_cypher_query without keywords, before the recent feed
+LEGACY_QUERY = """
+MATCH path = (n)-[*1..2]-(m)
+WHERE ALL(node IN nodes(path) WHERE node.session_id = 'global' OR node.session_id = $session_id)
+WITH n, m, relationships(path) as rels, n.created_at as created
+RETURN DISTINCT n.name as entity1,
+       [r IN rels | type(r)] as relationships,
+       m.name as entity2
+ORDER BY created DESC
+LIMIT 20
+"""
+
+
+def seed(nodes: int, batch: int = 10000):
+    """nodes nodes, 3 relationships each, 1 in 20 nodes global"""
+    for start in range(0, nodes, batch):
+        end = min(start + batch, nodes)
+        db.execute_cypher(
+            """
+            UNWIND range($start, $end - 1) AS i
+            CREATE (:Entity:BenchNode {
+                normalized_id: 'recent_' + toString(i),
+                name: 'Recent ' + toString(i),
+                session_id: CASE WHEN i % 20 = 0 THEN 'global' ELSE 'bench_recent_' + toString(i % $sessions) END,
+                created_at: datetime() - duration({minutes: (i * 7919) % 525600}),
+                degree: 0
+            })
+            """,
+            {"start": start, "end": end, "sessions": SESSIONS},
+        )
+    for start in range(0, nodes, batch):
+        end = min(start + batch, nodes)
+        db.execute_cypher(
+            """
+            UNWIND range($start, $end - 1) AS i
+            MATCH (a:Entity {normalized_id: 'recent_' + toString(i)})
+            UNWIND [(i * 7919 + 1) % $nodes, (i * 104729 + 3) % $nodes, (i + $sessions) % $nodes] AS j
+            MATCH (b:Entity {normalized_id: 'recent_' + toString(j)})
+            CREATE (a)-[r:RELATED_TO {
+                session_id: a.session_id,
+                created_at: datetime() - duration({minutes: (i * 31 + j) % 525600})
+            }]->(b)
+            SET a.degree = a.degree + 1, b.degree = b.degree + 1,
+                a.last_fact_at = CASE WHEN a.last_fact_at IS NULL OR a.last_fact_at < r.created_at
+                                      THEN r.created_at ELSE a.last_fact_at END
+            """,
+            {"start": start, "end": end, "nodes": nodes, "sessions": SESSIONS},
+        )
+
+
+def stale_global_check() -> bool:
+    """Feed of an empty session over a global layer older than the lookback"""
+    db.execute_cypher(
+        """
+        UNWIND range(0, 9) AS i
+        CREATE (a:Entity:BenchNode {normalized_id: 'stale_' + toString(i), name: 'Stale ' + toString(i),
+                                    session_id: 'global', degree: 1})
+        CREATE (b:Entity:BenchNode {normalized_id: 'stale_place_' + toString(i), name: 'Stale Place ' + toString(i),
+                                    session_id: 'global', degree: 1})
+        CREATE (a)-[r:LIVES_IN {session_id: 'global',
+                                created_at: datetime() - duration({days: $days + i})}]->(b)
+        SET a.last_fact_at = r.created_at, b.last_fact_at = r.created_at
+        """,
+        {"days": 2 * config.RETRIEVAL_RECENT_LOOKBACK_DAYS},
+    )
+    params = embedding_service.build_retrieval_params([])
+    params["session_id"] = "bench_recent_empty"
+    rows = db.execute_cypher(embedding_service.build_secure_cypher_query([]), params)
+    stale = [row for row in rows if str(row["entity1"]).startswith("Stale ")]
+    print(f"  stale global layer: {len(stale)} of 10 facts older than "
+          f"{config.RETRIEVAL_RECENT_LOOKBACK_DAYS} days in the feed")
+    cleanup()
+    return bool(stale)
+
+
+def measure(name: str, query: str, params: dict, queries: int) -> list:
+    plan = run_summary("EXPLAIN " + query, params).plan
+    scans = sorted(set(operators(plan)) & SCAN_OPERATORS)
+    hits = db_hits(run_summary("PROFILE " + query, params).profile)
+
+    latencies, rows = [], []
+    for _ in range(queries):
+        start = time.perf_counter()
+        rows = db.execute_cypher(query, params)
+        latencies.append(time.perf_counter() - start)
+
+    print(f"  {name:<7} {summarize_ms(latencies)}  db hits={hits:>12,}  rows={len(rows):>3}  "
+          f"scans={', '.join(scans) or 'none'}")
+    return scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--relationships", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--legacy-max", type=int, default=100000,
+                        help="largest relationship count to run the old whole-graph query at")
+    args = parser.parse_args()
+
+    db.connect()
+    try:
+        cleanup()
+        create_indexes()
+
+        if not stale_global_check():
+            raise SystemExit("❌ Global facts older than the lookback are missing from the recent feed")
+
+        started = time.perf_counter()
+        seed(args.relationships // 3)
+        db.execute_cypher("CALL db.awaitIndexes(600)")
+        print(f"{args.relationships // 3:,} nodes, ~{args.relationships:,} relationships "
+              f"(seeded in {time.perf_counter() - started:.0f}s)")
+
+        feed_query = embedding_service.build_secure_cypher_query([])
+        params = embedding_service.build_retrieval_params([])
+        params["session_id"] = "bench_recent_1"
+
+        scans = measure("feed", feed_query, params, args.queries)
+        if args.relationships <= args.legacy_max:
+            measure("legacy", LEGACY_QUERY, params, min(args.queries, 3))
+
+        if scans:
+            raise SystemExit("❌ The recent feed plan contains a full scan operator")
+        print("✅ No full node scans in the recent feed plan")
+    finally:
+        cleanup()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
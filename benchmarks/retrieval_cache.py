@@ -0,0 +1,129 @@
+"""
+Replays a synthetic question log through GraphRetriever and reports how many
+Neo4j retrieval queries the result cache saves.
+
+The log mimics demo traffic: many sessions asking mostly about the global
+layer (a few popular entities), follow-up questions about the same entity,
+and occasional add_fact writes that invalidate the cache the same way
+create_graph_from_json does. A second check writes from another process, as
+another uvicorn worker would, and fails unless this process stops serving
+exactly the retrievals that write made stale.
+
+Usage:
+    python benchmarks/retrieval_cache.py --sessions 50 --questions 2000 --write-rate 0.05
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import tempfile
+
+from common import Timer
+
+from cache import RetrievalCache, SharedGenerations, retrieval_cache
+from database import async_db
+from retrieval import retriever
+
+GLOBAL_ENTITIES = ["Zayeem", "AI Memory System", "Python", "React", "Neo4j", "Google Gemini"]
+
+
+def question_log(sessions: int, questions: int, write_rate: float, seed: int = 11) -> list:
+    rng = random.Random(seed)
+    session_entities = {f"session_{i}": [f"Friend{i}", f"City{i}", f"Hobby{i}"] for i in range(sessions)}
+    log = []
+    last = {}
+    for _ in range(questions):
+        session_id = rng.choice(list(session_entities))
+        if rng.random() < write_rate:
+            # add_fact: mostly session-only, sometimes mentioning a global entity
+            touched_global = rng.random() < 0.2
+            log.append(("write", session_id, touched_global))
+            continue
+        if session_id in last and rng.random() < 0.3:
+            keywords = last[session_id]  # follow-up about the same entity
+        elif rng.random() < 0.7:
+            # Zipf-ish popularity over the global layer
+            keywords = [GLOBAL_ENTITIES[min(int(rng.paretovariate(1.2)) - 1, len(GLOBAL_ENTITIES) - 1)]]
+        else:
+            keywords = [rng.choice(session_entities[session_id])]
+        last[session_id] = keywords
+        log.append(("ask", session_id, keywords))
+    return log
+
+
+async def replay(log: list, use_cache: bool) -> int:
+    queries = 0
+
+    async def execute_cypher(query, params=None):
+        nonlocal queries
+        queries += 1
+        await asyncio.sleep(0)
+        return [{"entity1": k, "relationships": ["KNOWS"], "entity2": "X"} for k in params["keywords"]]
+
+    async_db.execute_cypher = execute_cypher
+    retrieval_cache.clear()
+    retrieval_cache.hits = retrieval_cache.misses = 0
+    retrieval_cache.max_entries = 1024 if use_cache else 0
+
+    for kind, session_id, payload in log:
+        if kind == "write":
+            # What create_graph_from_json does after committing
+            retrieval_cache.invalidate_for_write(session_id, touched_global=payload)
+        else:
+            await retriever.retrieve(payload, session_id)
+    return queries
+
+
+def other_worker_write(path: str, session_id: str, touched_global: bool):
+    RetrievalCache(shared=SharedGenerations(path)).invalidate_for_write(session_id, touched_global)
+
+
+def cross_worker_check() -> list:
+    """Which cached retrievals survive writes made by another process"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "generations")
+        cache = RetrievalCache(max_entries=16, ttl_seconds=300, shared=SharedGenerations(path))
+        entries = [(["Zayeem"], None), (["Friend1"], "session_1"), (["Friend2"], "session_2")]
+        for keywords, session_id in entries:
+            cache.store(keywords, session_id, {"results": [], "truncated": False}, cache.stamp(session_id))
+
+        survivors = []
+        for session_id, touched_global in (("session_1", False), ("global", True)):
+            worker = multiprocessing.Process(target=other_worker_write, args=(path, session_id, touched_global))
+            worker.start()
+            worker.join()
+            survivors.append([s for keywords, s in entries if cache.lookup(keywords, s) is not None])
+        return survivors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--write-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    log = question_log(args.sessions, args.questions, args.write_rate)
+    asks = sum(1 for entry in log if entry[0] == "ask")
+
+    with Timer() as t:
+        uncached = asyncio.run(replay(log, use_cache=False))
+    print(f"no cache:   {uncached:6d} Neo4j queries for {asks} questions ({t.elapsed * 1000:.0f}ms)")
+
+    with Timer() as t:
+        cached = asyncio.run(replay(log, use_cache=True))
+    print(f"with cache: {cached:6d} Neo4j queries for {asks} questions ({t.elapsed * 1000:.0f}ms)")
+    print(f"reduction:  {100 * (1 - cached / uncached):.1f}%  cache stats: {retrieval_cache.stats()}")
+
+    after_session_write, after_global_write = cross_worker_check()
+    print(f"other worker wrote session_1: still cached {after_session_write}; "
+          f"then the global layer: still cached {after_global_write}")
+    if after_session_write != [None, "session_2"] or after_global_write:
+        raise SystemExit("❌ A write in another worker left stale retrievals cached here")
+    print("✅ Writes in another worker invalidate exactly the affected cached retrievals")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Global-layer retrieval served from the memory-mapped CSR snapshot.
+
+Compiles a synthetic global layer (people, projects and technologies, with
+a few hub nodes every other node links to) into a snapshot file, then:
+
+  * checks the in-process expansion against a brute-force enumeration of
+    every 1-2 hop path from the same anchors (fanout caps lifted)
+  * checks anchor ranking against a brute-force ranking of every node, for
+    questions pairing a word hundreds of names start with and an exact name
+  * times GraphRetriever.retrieve for visitors without a session, which
+    never touch Neo4j, and for sessions, where only the overlay queries go
+    to a stubbed Neo4j with a fixed latency
+
+Usage:
+    python benchmarks/snapshot_retrieval.py --nodes 10000 --edges 30000 --queries 2000 --db-ms 5
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from common import percentile
+
+from cache import retrieval_cache
+from database import async_db
+from embeddings import embedding_service
+from global_snapshot import TOKEN_PATTERN, compile_snapshot, global_snapshot
+from retrieval import retriever
+
+WORDS = ["Nova", "Atlas", "Quartz", "Ember", "Delta", "Orbit", "Cedar", "Pixel", "Lumen", "Sable", "Vertex", "Harbor"]
+TYPES = ["KNOWS", "WORKS_ON", "USES", "LIVES_IN", "BUILT"]
+
+
+def synthetic_layer(nodes: int, edges: int, hubs: int, rng: random.Random) -> tuple:
+    rows = []
+    for i in range(nodes):
+        name = f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}"
+        rows.append({"id": f"4:bench:{i}", "name": name, "normalized_id": name.lower().replace(" ", "_"),
+                     "labels": [rng.choice(["Person", "Project", "Technology"]), "Entity"]})
+    rels = []
+    for j in range(edges):
+        # A fifth of all edges land on a handful of hubs
+        target = rng.randrange(hubs) if rng.random() < 0.2 else rng.randrange(nodes)
+        rels.append({"id": f"5:bench:{j}", "source": f"4:bench:{rng.randrange(nodes)}",
+                     "target": f"4:bench:{target}", "type": rng.choice(TYPES),
+                     "session_id": "global", "created_at": rng.randrange(10 ** 12)})
+    return rows, rels
+
+
+def adjacency_lists(graph) -> dict:
+    adjacency = {}
+    for r in range(graph.relationship_count):
+        a, b, t = int(graph.rel_source[r]), int(graph.rel_target[r]), graph.type_names[graph.rel_type[r]]
+        adjacency.setdefault(a, []).append((b, r, t))
+        if a != b:
+            adjacency.setdefault(b, []).append((a, r, t))
+    return adjacency
+
+
+def brute_force(graph, adjacency: dict, anchors: list) -> set:
+    """Every 1-2 hop path from the anchors, as undirected (entity1, types, entity2) keys"""
+
+    def key(x, types, y):
+        forward = (graph.name[x], tuple(types), graph.name[y])
+        return min(forward, (forward[2], forward[1][::-1], forward[0]))
+
+    paths = set()
+    for a in anchors:
+        for b, r1, t1 in adjacency.get(a, []):
+            paths.add(key(a, [t1], b))
+            for c, r2, t2 in adjacency.get(b, []):
+                if r2 != r1:
+                    paths.add(key(a, [t1, t2], c))
+    return paths
+
+
+def brute_force_anchors(graph, anchor_ids: list, keywords: list, per_keyword: int) -> list:
+    """Each keyword's best matches over every node: exact id, prefix, words only, ties by id"""
+    found = {}
+    for anchor_id, keyword in zip(anchor_ids, keywords):
+        terms = TOKEN_PATTERN.findall(keyword.lower())
+        ranked = []
+        for node in range(graph.node_count):
+            normalized_id = graph.normalized_id[node]
+            tokens = set(TOKEN_PATTERN.findall(graph.name[node].lower())) | {normalized_id}
+            if normalized_id == anchor_id:
+                ranked.append((0, normalized_id, node))
+            elif normalized_id.startswith(anchor_id):
+                ranked.append((1, normalized_id, node))
+            elif all(t in tokens for t in terms[:-1]) and any(t.startswith(terms[-1]) for t in tokens):
+                ranked.append((2, normalized_id, node))
+        for _, _, node in sorted(ranked)[:per_keyword]:
+            found[node] = None
+    return list(found)
+
+
+async def timed_retrievals(keyword_sets: list, session_id: str) -> list:
+    latencies = []
+    for keywords in keyword_sets:
+        start = time.perf_counter()
+        await retriever.retrieve(keywords, session_id)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--edges", type=int, default=30000)
+    parser.add_argument("--hubs", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--db-ms", type=float, default=5, help="stubbed Neo4j latency for the session overlay")
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    nodes, rels = synthetic_layer(args.nodes, args.edges, args.hubs, rng)
+
+    with tempfile.TemporaryDirectory() as directory:
+        global_snapshot.path = os.path.join(directory, "global.csr")
+        global_snapshot.marker_path = global_snapshot.path + ".stale"
+
+        start = time.perf_counter()
+        metadata = compile_snapshot(global_snapshot.path, nodes, rels)
+        compiled = time.perf_counter() - start
+        start = time.perf_counter()
+        graph = global_snapshot.current()
+        mapped = time.perf_counter() - start
+        print(f"{metadata['nodes']:,} nodes, {metadata['relationships']:,} relationships: compiled in "
+              f"{compiled * 1000:.0f}ms, {os.path.getsize(global_snapshot.path) / 1e6:.1f}MB, mapped in {mapped * 1000:.2f}ms")
+
+        # Equivalence with caps lifted, for questions naming one entity
+        keyword_sets = [[node["name"]] for node in rng.sample(nodes, 200)]
+        adjacency = adjacency_lists(graph)
+        checked = 0
+        for keywords in keyword_sets[:50]:
+            params = embedding_service.build_retrieval_params(keywords)
+            anchors = graph.anchors(params["anchor_ids"], keywords, 10 ** 9)
+            paths, _, _ = graph.expand(anchors, 10 ** 9, 10 ** 9)
+            actual = {min((e1, t, e2), (e2, t[::-1], e1)) for e1, t, e2, _ in paths}
+            expected = brute_force(graph, adjacency, anchors)
+            if actual != expected:
+                raise SystemExit(f"❌ {keywords}: missing {sorted(expected - actual)[:3]} extra {sorted(actual - expected)[:3]}")
+            checked += 1
+        print(f"✅ {checked} keyword sets: in-process expansion matches brute-force 1-2 hop enumeration")
+
+        # A common word must not crowd out an exact name or the other keyword
+        for node in rng.sample(nodes, 20):
+            keywords = [rng.choice(WORDS), node["name"]]
+            params = embedding_service.build_retrieval_params(keywords)
+            anchors = graph.anchors(params["anchor_ids"], keywords, params["anchor_per_keyword"])
+            expected = brute_force_anchors(graph, params["anchor_ids"], keywords, params["anchor_per_keyword"])
+            if anchors != expected:
+                raise SystemExit(f"❌ {keywords}: anchors {len(anchors)} differ from the brute-force ranking")
+            if graph.find(node["normalized_id"]) not in anchors:
+                raise SystemExit(f"❌ {keywords}: the exact name lost its anchor to '{keywords[0]}'")
+        print(f"✅ 20 keyword pairs: anchors ranked like brute force, {params['anchor_per_keyword']} per keyword, "
+              f"exact names kept")
+
+        # Every retrieval must reach the snapshot (and, for sessions, Neo4j)
+        retrieval_cache.max_entries = 0
+        neo4j_queries = 0
+
+        async def execute_cypher(query, params=None):
+            nonlocal neo4j_queries
+            neo4j_queries += 1
+            await asyncio.sleep(args.db_ms / 1000)
+            return []
+
+        async_db.execute_cypher = execute_cypher
+        queries = [rng.choice(keyword_sets) for _ in range(args.queries)]
+        for label, session_id in (("no session", None), ("session   ", "bench_session")):
+            neo4j_queries = 0
+            latencies = asyncio.run(timed_retrievals(queries, session_id))
+            print(f"{label}: p50={percentile(latencies, 50) * 1000:6.3f}ms  p95={percentile(latencies, 95) * 1000:6.3f}ms  "
+                  f"p99={percentile(latencies, 99) * 1000:6.3f}ms  Neo4j queries/retrieval={neo4j_queries / len(queries):.1f}")
+        print(f"snapshot stats: {global_snapshot.stats()}")
+
+
+if __name__ == "__main__":
+    main()
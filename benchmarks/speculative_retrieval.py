@@ -0,0 +1,160 @@
+"""
+/chat latency with retrieval started speculatively while the LLM rewrite runs.
+
+A synthetic graph of people and projects fills the entity dictionary. Every
+question in the log escalates past the local stage, so each one waits on
+the LLM:
+
+  filler    a known name next to a capitalized word that is not an entity
+            ("... on Monday"); the LLM keeps only the name (speculation hits)
+  stranger  a known name next to one the graph has never seen; the LLM adds
+            the new name (speculation misses)
+  ambiguous "he" after a turn naming two people; the LLM picks one (misses)
+
+Gemini and Neo4j are stubbed with fixed latencies. Reports the speculation
+hit rate and /chat p50/p95 with RETRIEVAL_SPECULATIVE off and on, and fails
+if any answer used results for the wrong keywords.
+
+Usage:
+    python benchmarks/speculative_retrieval.py --questions 200 --llm-ms 300 --db-ms 80
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import random
+import re
+from collections import Counter
+from types import SimpleNamespace
+
+from common import Timer, api_client, percentile
+
+from cache import answer_cache, retrieval_cache
+from config import config
+from database import async_db
+from embeddings import embedding_service, entity_dictionary
+from retrieval import retriever
+
+PEOPLE = ["Zayeem", "Alice", "Priya", "Marcus", "Lena", "Tomas", "Ingrid", "Kofi", "Mei", "Rafael"]
+PROJECTS = ["Memory Graph", "Orbit Labs", "Lake Survey", "Atlas Project"]
+FILLERS = ["Monday", "Christmas", "Spanish", "March", "Friday"]
+STRANGERS = ["Qorvane", "Telmiro", "Vasquel", "Draxby", "Ulthane"]
+
+
+class FakeModels:
+    """client.aio.models stand-in answering from the question log's expected keywords"""
+
+    def __init__(self, seconds: float, expected: dict):
+        self.seconds = seconds
+        self.expected = expected
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self.seconds)
+        if "Query Processing Engine" in contents:
+            question = re.search(r'Current Question: "(.*)"', contents).group(1)
+            rewritten, keywords = self.expected[question]
+            return SimpleNamespace(text=json.dumps({"rewritten_query": rewritten, "keywords": keywords}))
+        if "keyword extraction system" in contents:
+            question = re.findall(r'Query: "(.*)"', contents)[-1]
+            return SimpleNamespace(text=json.dumps(self.expected[question][1]))
+        return SimpleNamespace(text="Here is what I found.")
+
+
+def question_log(questions: int, rng: random.Random) -> list:
+    """[(kind, question, history, rewritten, keywords the LLM returns)]"""
+    log = []
+    for i in range(questions):
+        roll = rng.random()
+        person = rng.choice(PEOPLE)
+        if roll < 0.6:
+            q = f"What did {person} do on {rng.choice(FILLERS)} #{i}?"
+            log.append(("filler", q, [], q, [person]))
+        elif roll < 0.8:
+            q = f"Does {person} know {rng.choice(STRANGERS)} #{i}?"
+            log.append(("stranger", q, [], q, [person, q.split()[3]]))
+        else:
+            other = rng.choice([p for p in PEOPLE if p != person])
+            history = [{"role": "user", "content": f"How do {person} and {other} know each other?"},
+                       {"role": "model", "content": "They met at work."}]
+            q = f"Where does he live #{i}?"
+            log.append(("ambiguous", q, history, f"Where does {person} live?", [person]))
+    return log
+
+
+async def run(log: list, llm_seconds: float, db_seconds: float, speculative: bool) -> dict:
+    config.RETRIEVAL_SPECULATIVE = speculative
+    expected = {q: (rewritten, keywords) for _, q, _, rewritten, keywords in log}
+    embedding_service.client = SimpleNamespace(aio=SimpleNamespace(models=FakeModels(llm_seconds, expected)))
+
+    async def execute_cypher(query, params=None):
+        await asyncio.sleep(db_seconds)
+        return [{"entity1": anchor, "relationships": ["KNOWS"], "entity2": "Someone", "path_length": 1}
+                for anchor in params["anchor_ids"]]
+
+    async_db.execute_cypher = execute_cypher
+    retriever.speculation_hits = retriever.speculation_misses = retriever.speculation_skipped = 0
+
+    outcome = {"latency": {}, "speculation": Counter(), "wrong": 0}
+    async with api_client() as client:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for kind, q, history, _, keywords in log:
+                # Every question pays for retrieval and the answer, as if new
+                retrieval_cache.clear()
+                answer_cache.clear()
+                with Timer() as timer:
+                    response = await client.post("/chat", json={
+                        "message": q, "history": history, "action_type": "ask_question",
+                        "session_id": "session_1700000000000_bench",
+                    })
+                    response.raise_for_status()
+                outcome["latency"].setdefault(kind, []).append(timer.elapsed)
+                details = response.json()["details"]
+                outcome["speculation"][details["retrieval_speculation"]] += 1
+                outcome["wrong"] += details["keywords_extracted"] != keywords or details["results_count"] != len(keywords)
+    outcome["stats"] = retriever.stats()
+    return outcome
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--llm-ms", type=float, default=300, help="stubbed Gemini latency per call")
+    parser.add_argument("--db-ms", type=float, default=80, help="stubbed Neo4j latency per query")
+    args = parser.parse_args()
+
+    config.SINGLE_FLIGHT_ENABLED = False
+    config.GLOBAL_SNAPSHOT_ENABLED = False
+    for name in PEOPLE:
+        entity_dictionary.add(name, label="Person")
+    for name in PROJECTS:
+        entity_dictionary.add(name, label="Project")
+    log = question_log(args.questions, random.Random(5))
+
+    results = {}
+    for speculative in (False, True):
+        outcome = asyncio.run(run(log, args.llm_ms / 1000, args.db_ms / 1000, speculative))
+        results[speculative] = outcome
+        every = [s for samples in outcome["latency"].values() for s in samples]
+        name = "speculative" if speculative else "sequential"
+        print(f"{name:>11}: /chat p50={percentile(every, 50) * 1000:6.1f}ms p95={percentile(every, 95) * 1000:6.1f}ms  "
+              f"speculation={dict(outcome['speculation'])}")
+        for kind, samples in sorted(outcome["latency"].items()):
+            print(f"{'':>13}{kind:>9}: p50={percentile(samples, 50) * 1000:6.1f}ms "
+                  f"p95={percentile(samples, 95) * 1000:6.1f}ms  n={len(samples)}")
+
+    stats = results[True]["stats"]
+    before = [s for samples in results[False]["latency"].values() for s in samples]
+    after = [s for samples in results[True]["latency"].values() for s in samples]
+    print(f"hit rate={stats['hit_rate']:.1%} ({stats['hits']} hits, {stats['misses']} misses)  "
+          f"saved p50={(percentile(before, 50) - percentile(after, 50)) * 1000:.1f}ms "
+          f"p95={(percentile(before, 95) - percentile(after, 95)) * 1000:.1f}ms")
+
+    if any(outcome["wrong"] for outcome in results.values()):
+        raise SystemExit("❌ Some answers used results retrieved for the wrong keywords")
+    print("✅ Every answer used results for the LLM's keywords")
+
+
+if __name__ == "__main__":
+    main()
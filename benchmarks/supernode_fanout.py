@@ -0,0 +1,107 @@
+"""
+Retrieval latency around supernodes, with and without the fanout caps.
+Needs a live Neo4j (NEO4J_URI etc. from .env).
+
+Seeds hub nodes (labeled :BenchNode) with 1k, 10k and 50k neighbours, each
+neighbour linked to a few more nodes, the way global nodes like `zayeem`
+collect edges from every session. Degrees are written the way
+create_graph_from_json maintains them. For each hub the retrieval query runs
+with the configured caps (RETRIEVAL_HOP1_FANOUT, RETRIEVAL_HOP2_FANOUT,
+RETRIEVAL_SUPERNODE_DEGREE) and with every cap lifted.
+
+Usage:
+    python benchmarks/supernode_fanout.py --degrees 1000 10000 50000 --queries 10
+"""
+
+import argparse
+import time
+
+from anchor_lookup import db_hits, run_summary
+from common import summarize_ms
+
+from database import db
+from embeddings import embedding_service
+from init_global_nodes import create_indexes
+
+SESSION_ID = "bench_supernode"
+
+
+def seed_hub(hub: int, degree: int, spokes: int = 3, batch: int = 10000):
+    hub_id = f"hub_{hub}"
+    db.execute_cypher(
+        "CREATE (:Entity:BenchNode {normalized_id: $id, name: $name, session_id: 'global', degree: $degree})",
+        {"id": hub_id, "name": f"Hub {hub}", "degree": degree},
+    )
+    for start in range(0, degree, batch):
+        db.execute_cypher(
+            """
+            MATCH (h:BenchNode {normalized_id: $hub_id})
+            UNWIND range($start, $end - 1) AS i
+            CREATE (n:Entity:BenchNode {
+                normalized_id: $hub_id + '_n' + toString(i),
+                name: 'Neighbour ' + toString(i),
+                session_id: CASE WHEN i % 2 = 0 THEN 'global' ELSE $session_id END,
+                degree: 1 + $spokes
+            })
+            CREATE (n)-[:RELATED_TO {session_id: n.session_id, created_at: datetime()}]->(h)
+            WITH n, i
+            UNWIND range(1, $spokes) AS k
+            CREATE (n)-[:RELATED_TO {session_id: n.session_id, created_at: datetime()}]->(:Entity:BenchNode {
+                normalized_id: $hub_id + '_n' + toString(i) + '_' + toString(k),
+                name: 'Leaf ' + toString(i) + '.' + toString(k),
+                session_id: n.session_id,
+                degree: 1
+            })
+            """,
+            {"hub_id": hub_id, "start": start, "end": min(start + batch, degree),
+             "spokes": spokes, "session_id": SESSION_ID},
+        )
+
+
+def cleanup():
+    db.execute_cypher(
+        """
+        MATCH (n:BenchNode)
+        CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS
+        """
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--degrees", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=10)
+    args = parser.parse_args()
+
+    query = embedding_service.build_secure_cypher_query(["placeholder"])
+
+    db.connect()
+    try:
+        cleanup()
+        create_indexes()
+
+        for hub, degree in enumerate(args.degrees):
+            seed_hub(hub, degree)
+            db.execute_cypher("CALL db.awaitIndexes(300)")
+
+            capped = embedding_service.build_retrieval_params([f"Hub {hub}"])
+            capped["session_id"] = SESSION_ID
+            uncapped = dict(capped, hop1_fanout=10 ** 9, hop2_fanout=10 ** 9, supernode_degree=10 ** 9)
+
+            print(f"\nhub with {degree:,} neighbours ({degree * 4:,} relationships within 2 hops)")
+            for name, params in (("capped", capped), ("uncapped", uncapped)):
+                hits = db_hits(run_summary("PROFILE " + query, params).profile)
+                latencies, truncated = [], False
+                for _ in range(args.queries):
+                    start = time.perf_counter()
+                    rows = db.execute_cypher(query, params)
+                    latencies.append(time.perf_counter() - start)
+                    truncated = truncated or any(row["truncated"] for row in rows)
+                print(f"  {name:<9} {summarize_ms(latencies)}  db hits={hits:>12,}  truncated={truncated}")
+    finally:
+        cleanup()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
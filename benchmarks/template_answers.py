@@ -0,0 +1,153 @@
+"""
+Share of questions answered from templates without a Gemini generation, and
+the answer latency difference.
+
+Uses the synthetic social graph and undirected 1-2 hop retrieval from
+prompt_context.py. The recorded question set mixes direct one-hop questions
+("Where does X live?", "Who are X's friends?") with ones that must go to
+the LLM: multi-hop ("Where do X's friends live?", "Where does X's friend
+work?", "Where does X's brother live?", where X has a direct edge for the
+other relationship, or none at all), yes/no, reversed ("Who lives in
+Ohio?"), two-person, negated or past-tense questions, questions whose
+relationship the pattern table does not parse ("Who does X work with?"),
+and LOVES questions, whose direction undirected rows do not carry. Gemini is stubbed with a
+fixed generation latency. Fails if a templated answer states a fact the
+graph does not have.
+
+Usage:
+    python benchmarks/template_answers.py --questions 400 --llm-ms 600
+"""
+
+import argparse
+import asyncio
+import random
+import re
+from collections import Counter
+from types import SimpleNamespace
+
+from common import percentile
+from prompt_context import HOBBIES, PLACES, build_graph, retrieve
+
+from answer_templates import answer_templates
+from cache import answer_cache
+from config import config
+from embeddings import embedding_service
+
+DIRECT = [
+    ("Where does {} live?", "LIVES_IN"),
+    ("Who are {}'s friends?", "FRIEND_OF"),
+]
+ESCALATED = [
+    "Where do {}'s friends live?",
+    "Does {} love Chess?",
+    "Who lives in {place}?",
+    "Does {} know {other}?",
+    "What do {}'s friends love?",
+    "Where does {}'s friend live?",
+    "Where does {}'s friend work?",
+    "Where does {}'s brother live?",
+    "Where does the friend of {} live?",
+    "What does {} love?",
+    "Who does {} love?",
+    "Where does {} not live?",
+    "Where did {} live before?",
+    "Who does {} work with?",
+    "Where do {} and {other} live?",
+]
+
+
+class FakeModels:
+    """client.aio.models stand-in with a fixed generation latency"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.calls = 0
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        await asyncio.sleep(self.seconds)
+        return SimpleNamespace(text="Here is what I found.")
+
+
+def question_set(names: list, questions: int, rng: random.Random) -> list:
+    """[(kind, question, anchors)]"""
+    recorded = []
+    for _ in range(questions):
+        person = rng.choice(names)
+        if rng.random() < 0.6:
+            template, _ = rng.choice(DIRECT)
+            recorded.append(("direct", template.format(person), [person]))
+        else:
+            place, other = rng.choice(PLACES), rng.choice(names)
+            template = rng.choice(ESCALATED)
+            question = template.format(person, place=place, other=other)
+            anchors = [place] if "{place}" in template else [person] + ([other] if "{other}" in template else [])
+            recorded.append(("escalated", question, anchors))
+    return recorded
+
+
+def states_only_graph_facts(answer: str, edges: list) -> bool:
+    """Every object in a templated answer is linked to its subject in the graph"""
+    subject = re.match(r"(\w+)", answer).group(1)
+    neighbours = {b for a, _, b in edges if a == subject} | {a for a, _, b in edges if b == subject}
+    named = set(re.findall(r"Person\d+", answer)) - {subject}
+    named |= {w for w in re.findall(r"\w+", answer) if w in PLACES or w in HOBBIES}
+    return named <= neighbours
+
+
+async def run(recorded: list, edges: list, templates: bool, llm_seconds: float) -> dict:
+    config.ANSWER_TEMPLATES_ENABLED = templates
+    models = FakeModels(llm_seconds)
+    embedding_service.client = SimpleNamespace(aio=SimpleNamespace(models=models))
+    answer_templates.templated = answer_templates.generated = 0
+
+    outcome = {"latency_ms": {}, "sources": Counter(), "wrong": 0}
+    for kind, question, anchors in recorded:
+        answer_cache.clear()
+        results = retrieve(anchors, edges, config.RETRIEVAL_RESULT_LIMIT)
+        started = asyncio.get_running_loop().time()
+        answer, report = await embedding_service.format_query_results_cached_async(question, results)
+        outcome["latency_ms"].setdefault(kind, []).append((asyncio.get_running_loop().time() - started) * 1000)
+        templated = report["match"] == "template"
+        outcome["sources"][(kind, "template" if templated else "llm")] += 1
+        if templated and not states_only_graph_facts(answer, edges):
+            outcome["wrong"] += 1
+            print(f"   wrong: {question} -> {answer}")
+    outcome["generations"] = models.calls
+    return outcome
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--people", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=400)
+    parser.add_argument("--llm-ms", type=float, default=600, help="stubbed answer generation latency")
+    args = parser.parse_args()
+
+    rng = random.Random(9)
+    config.SINGLE_FLIGHT_ENABLED = False
+    names, edges = build_graph(args.people, rng)
+    recorded = question_set(names, args.questions, rng)
+
+    results = {}
+    for name, templates in (("LLM only", False), ("templates", True)):
+        outcome = asyncio.run(run(recorded, edges, templates, args.llm_ms / 1000))
+        results[name] = outcome
+        every = [ms for samples in outcome["latency_ms"].values() for ms in samples]
+        print(f"{name:>9}: generations={outcome['generations']:>4}/{len(recorded)}  "
+              f"answer latency p50={percentile(every, 50):6.1f}ms p95={percentile(every, 95):6.1f}ms")
+        for kind in ("direct", "escalated"):
+            sources = {source: outcome["sources"][(kind, source)] for source in ("template", "llm")}
+            print(f"{'':>11}{kind:>9}: {sources}")
+
+    templated = sum(count for (_, source), count in results["templates"]["sources"].items() if source == "template")
+    print(f"answered without a generation call: {templated / len(recorded):.1%}")
+    if results["templates"]["wrong"]:
+        raise SystemExit("❌ Templated answers stated facts the graph does not have")
+    if any(source == "template" for (kind, source) in results["templates"]["sources"] if kind == "escalated"):
+        raise SystemExit("❌ A question that must go to the LLM was templated")
+    print("✅ Templated answers only state graph facts; other questions went to the LLM")
+
+
+if __name__ == "__main__":
+    main()
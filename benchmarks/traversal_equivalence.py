@@ -0,0 +1,433 @@
+"""
+Property-based check that the hop-by-hop retrieval query returns the same
+paths as the variable-length `(a)-[*1..2]-(m)` query it replaced, plus db
+hits for both. Needs a live Neo4j (NEO4J_URI etc. from .env).
+
+Each trial seeds a random graph (labeled :BenchNode) with a random mix of
+global and per-session nodes, colliding names, parallel edges, self loops
+and short cycles, then compares both queries for random keywords and
+sessions with the result limit lifted. The old query emits paths between
+two anchors in both orientations, so rows are compared as undirected paths:
+(entity1, relationships, entity2) and its reverse are the same path.
+
+A session must never see a node from another session: every returned
+entity is also checked against the seeded sessions.
+
+--offline runs the same property check without Neo4j, against Python models
+of both queries that follow their clauses step by step (undirected
+expansion, per-node session filter, canonical orientation by elementId,
+ORDER BY path length then DISTINCT and LIMIT, ties in random order). It
+also checks the result limit: a limited result only holds paths the old
+query returns, and holds every one-hop path before any two-hop path. The
+models prove the path semantics of the new query, not how Neo4j plans it,
+and say nothing about whether the Cypher text matches them: only the live
+mode runs the Cypher.
+
+Both modes also check two mirrored anchor pairs joined through a hub whose
+hop-2 fanout cap hides the path from one end: the path must still be
+returned (live: by the query; offline: by the snapshot expansion).
+
+Usage:
+    python benchmarks/traversal_equivalence.py --trials 50 --nodes 40 --edges 80
+    python benchmarks/traversal_equivalence.py --offline --trials 500
+"""
+
+import argparse
+import os
+import random
+import re
+import tempfile
+from collections import defaultdict
+
+from anchor_lookup import db_hits, run_summary
+
+from database import db
+from embeddings import embedding_service
+from global_snapshot import GlobalSnapshot, compile_snapshot
+from init_global_nodes import create_indexes
+
+SESSIONS = ["global", "trav_session_a", "trav_session_b"]
+NAMES = [f"Travnode {word}" for word in ["Alpha", "Bravo", "Charlie", "Delta", "Echo", "Foxtrot", "Golf"]]
+TYPES = ["KNOWS", "WORKS_AT", "LIKES"]
+
+# build_secure_cypher_query before hop-by-hop expansion (with the limit lifted)
+REFERENCE_QUERY = """
+CALL {
+    UNWIND range(0, size($anchor_ids) - 1) AS k
+    CALL {
+        WITH k
+        MATCH (a:Entity) WHERE a.normalized_id STARTS WITH $anchor_ids[k]
+        RETURN a, CASE WHEN a.normalized_id = $anchor_ids[k] THEN 0 ELSE 1 END AS rank
+        UNION
+        WITH k
+        CALL db.index.fulltext.queryNodes('entity_names', $fulltext_queries[k]) YIELD node
+        RETURN node AS a, 2 AS rank
+    }
+    WITH k, a, min(rank) AS rank
+    WHERE a.session_id = 'global' OR a.session_id = $session_id
+    WITH k, a, rank
+    ORDER BY rank, a.normalized_id
+    WITH k, collect(a)[..$anchor_per_keyword] AS ranked
+    UNWIND ranked AS a
+    RETURN DISTINCT a
+}
+MATCH path = (a)-[*1..2]-(m)
+WHERE ALL(node IN nodes(path) WHERE node.session_id = 'global' OR node.session_id = $session_id)
+WITH a, m, relationships(path) as rels, length(path) as path_length
+ORDER BY path_length ASC
+RETURN DISTINCT a.name as entity1,
+       [r IN rels | type(r)] as relationships,
+       m.name as entity2,
+       path_length
+LIMIT $result_limit
+"""
+
+
+def random_graph(rng: random.Random, nodes: int, edges: int, hub_edges: int = 0) -> tuple:
+    """(node rows, relationship rows) with colliding names, parallel edges and self loops"""
+    rows = [
+        {"normalized_id": f"travnode_{i}", "name": rng.choice(NAMES), "session_id": rng.choice(SESSIONS)}
+        for i in range(nodes)
+    ]
+    links = [
+        {"from": f"travnode_{rng.randrange(nodes)}", "to": f"travnode_{rng.randrange(nodes)}", "type": rng.choice(TYPES)}
+        for _ in range(edges)
+    ]
+    # Optional supernode: node 0 linked to many others
+    links += [{"from": "travnode_0", "to": f"travnode_{rng.randrange(nodes)}", "type": "KNOWS"} for _ in range(hub_edges)]
+    return rows, links
+
+
+def seed_random_graph(rng: random.Random, nodes: int, edges: int, hub_edges: int = 0) -> dict:
+    """Returns name -> set of sessions it was written in"""
+    rows, links = random_graph(rng, nodes, edges, hub_edges)
+
+    db.execute_cypher(
+        """
+        UNWIND $rows AS row
+        CREATE (:Entity:BenchNode {normalized_id: row.normalized_id, name: row.name, session_id: row.session_id})
+        """,
+        {"rows": rows},
+    )
+    for rel_type in TYPES:
+        db.execute_cypher(
+            f"""
+            UNWIND $links AS link
+            MATCH (a:BenchNode {{normalized_id: link.from}}), (b:BenchNode {{normalized_id: link.to}})
+            CREATE (a)-[:{rel_type}]->(b)
+            """,
+            {"links": [link for link in links if link["type"] == rel_type]},
+        )
+    db.execute_cypher("CALL db.awaitIndexes(300)")
+
+    visible = {}
+    for row in rows:
+        visible.setdefault(row["name"], set()).add(row["session_id"])
+    return visible
+
+
+def cleanup():
+    db.execute_cypher("MATCH (n:BenchNode) DETACH DELETE n")
+
+
+def undirected(rows: list) -> set:
+    paths = set()
+    for row in rows:
+        forward = (row["entity1"], tuple(row["relationships"]), row["entity2"], row["path_length"])
+        backward = (row["entity2"], tuple(reversed(row["relationships"])), row["entity1"], row["path_length"])
+        paths.add(min(forward, backward))
+    return paths
+
+
+def params_for(keywords: list, session_id: str) -> dict:
+    params = embedding_service.build_retrieval_params(keywords)
+    # Lift every cap so both queries see the full expansion
+    params.update(
+        session_id=session_id, anchor_per_keyword=100000, result_limit=1000000,
+        hop1_fanout=1000000, hop2_fanout=1000000, supernode_degree=1000000,
+    )
+    return params
+
+
+class ModelGraph:
+    """A random graph in Python, with string element ids compared the way Cypher compares them"""
+
+    def __init__(self, rows: list, links: list):
+        index = {row["normalized_id"]: i for i, row in enumerate(rows)}
+        self.rows = rows
+        self.node_ids = [f"4:bench:{i}" for i in range(len(rows))]
+        self.rel_ids = [f"5:bench:{j}" for j in range(len(links))]
+        self.types = [link["type"] for link in links]
+        # MATCH (a)-[r]-(b): every relationship from both of its ends
+        self.incident = defaultdict(list)
+        for j, link in enumerate(links):
+            start, end = index[link["from"]], index[link["to"]]
+            self.incident[start].append((j, end))
+            self.incident[end].append((j, start))
+
+    def visible(self, node: int, session_id: str) -> bool:
+        return self.rows[node]["session_id"] in ("global", session_id)
+
+    def anchors(self, params: dict) -> list:
+        """The anchor CALL both queries share: normalized_id prefix or full-text match, visible"""
+        clauses = [
+            [term.replace("\\", "") for term in re.findall(r"[^\s()]+", clause) if term != "AND"]
+            for query in params["fulltext_queries"]
+            for clause in query.split(" OR ") if clause.startswith("(")
+        ]
+        found = []
+        for node, row in enumerate(self.rows):
+            tokens = set(row["name"].lower().split()) | {row["normalized_id"]}
+            prefix = any(row["normalized_id"].startswith(anchor_id) for anchor_id in params["anchor_ids"])
+            fulltext = any(
+                all(t in tokens for t in terms[:-1]) and any(token.startswith(terms[-1][:-1]) for token in tokens)
+                for terms in clauses
+            )
+            if (prefix or fulltext) and self.visible(node, params["session_id"]):
+                found.append(node)
+        return found
+
+    def row(self, a: int, rels: list, m: int) -> tuple:
+        return self.rows[a]["name"], tuple(self.types[r] for r in rels), self.rows[m]["name"], len(rels)
+
+
+def model_reference(graph: ModelGraph, params: dict, rng: random.Random) -> list:
+    """REFERENCE_QUERY: (a)-[*1..2]-(m), ALL(nodes) visible, relationships unique per path"""
+    session_id, rows = params["session_id"], []
+    for a in graph.anchors(params):
+        for r1, b in graph.incident[a]:
+            if not graph.visible(b, session_id):
+                continue
+            rows.append((graph.row(a, [r1], b), (a, b)))
+            for r2, c in graph.incident[b]:
+                if r2 != r1 and graph.visible(c, session_id):
+                    rows.append((graph.row(a, [r1, r2], c), (a, b, c)))
+    return limit_rows(rows, params["result_limit"], rng)
+
+
+def model_hop_by_hop(graph: ModelGraph, params: dict, rng: random.Random) -> list:
+    """build_secure_cypher_query with the fanout caps lifted: session check on
+    every node as it is reached, then each path kept in canonical orientation"""
+    session_id, rows = params["session_id"], []
+    anchors = graph.anchors(params)
+    anchor_set = set(anchors)
+    for a in anchors:
+        for r1, b in graph.incident[a]:
+            if not graph.visible(b, session_id):
+                continue
+            candidates = [(b, [r1], (a, b))] + [
+                (c, [r1, r2], (a, b, c)) for r2, c in graph.incident[b]
+                if r2 != r1 and graph.visible(c, session_id)
+            ]
+            for m, rels, nodes in candidates:
+                # (m IN anchors AND elementId(m) < elementId(a))
+                # OR (m = a AND elementId(rels[0]) > elementId(rels[-1])) AS turn
+                if ((m in anchor_set and graph.node_ids[m] < graph.node_ids[a])
+                        or (m == a and graph.rel_ids[rels[0]] > graph.rel_ids[rels[-1]])):
+                    rows.append((graph.row(m, rels[::-1], a), nodes[::-1]))
+                else:
+                    rows.append((graph.row(a, rels, m), nodes))
+    return limit_rows(rows, params["result_limit"], rng)
+
+
+def limit_rows(rows: list, limit: int, rng: random.Random) -> list:
+    """ORDER BY path_length (ties in any order), RETURN DISTINCT ..., LIMIT: [(row, node ids)]"""
+    rng.shuffle(rows)
+    rows.sort(key=lambda row: row[0][3])
+    distinct = {}
+    for row, nodes in rows:
+        distinct.setdefault(row, nodes)
+    return list(distinct.items())[:limit]
+
+
+def offline_check(rng: random.Random, trials: int, nodes: int, edges: int) -> dict:
+    totals = {"queries": 0, "paths": 0, "limited": 0, "old_unique": 0, "new_unique": 0}
+    for trial in range(trials):
+        graph = ModelGraph(*random_graph(rng, nodes, edges, hub_edges=rng.choice([0, 0, nodes // 2])))
+        for _ in range(5):
+            keywords = rng.sample(NAMES, rng.randint(1, 2))
+            session_id = rng.choice(SESSIONS[1:] + [None])
+            params = params_for(keywords, session_id)
+            expected = undirected([dict(zip(ROW_KEYS, row)) for row, _ in model_reference(graph, params, rng)])
+            rows = model_hop_by_hop(graph, params, rng)
+            actual = undirected([dict(zip(ROW_KEYS, row)) for row, _ in rows])
+            if actual != expected:
+                raise SystemExit(
+                    f"❌ Trial {trial}: keywords={keywords} session={session_id}\n"
+                    f"   missing: {sorted(expected - actual)[:5]}\n"
+                    f"   extra:   {sorted(actual - expected)[:5]}"
+                )
+            for row, path_nodes in rows:
+                if not all(graph.visible(node, session_id) for node in path_nodes):
+                    raise SystemExit(f"❌ Trial {trial}: {row} passes a node invisible to session {session_id}")
+            totals["queries"] += 1
+            totals["paths"] += len(expected)
+            if not rows:
+                continue
+
+            # The same question with a result limit
+            limit = rng.randint(1, len(rows))
+            params["result_limit"] = limit
+            limited = model_hop_by_hop(graph, params, rng)
+            paths = undirected([dict(zip(ROW_KEYS, row)) for row, _ in limited])
+            one_hop = {path for path in expected if path[3] == 1}
+            if len(limited) != limit or not paths <= expected:
+                raise SystemExit(f"❌ Trial {trial}: LIMIT {limit} returned {len(limited)} rows or unknown paths")
+            if any(row[3] == 2 for row, _ in limited) and not one_hop <= paths:
+                raise SystemExit(f"❌ Trial {trial}: LIMIT {limit} kept a two-hop path over a one-hop path")
+            old = undirected([dict(zip(ROW_KEYS, row)) for row, _ in model_reference(graph, params, rng)])
+            totals["limited"] += 1
+            totals["old_unique"] += len(old)
+            totals["new_unique"] += len(paths)
+    return totals
+
+
+ROW_KEYS = ("entity1", "relationships", "entity2", "path_length")
+
+# Two mirrored anchor pairs Left - Hub - Right. The hub's filler edges push
+# its older anchor edge out of a hop-2 fanout of 2, so each path is reached
+# from one end only: in one of the pairs, the end with the larger id.
+PAIR_KEYWORDS = ["Pairend"]
+PAIR_HOP2_FANOUT = 2
+
+
+def anchor_pair_graph() -> tuple:
+    """(nodes, relationships) as NODES_QUERY / RELATIONSHIPS_QUERY rows, and the paths that must be found"""
+    nodes, rels, expected = [], [], set()
+
+    def node(name):
+        nodes.append({"id": f"4:pair:{len(nodes)}", "name": name,
+                      "normalized_id": name.lower().replace(" ", "_"), "labels": ["Entity"]})
+        return nodes[-1]["id"]
+
+    def rel(source, target, created_at):
+        rels.append({"id": f"5:pair:{len(rels)}", "source": source, "target": target, "type": "KNOWS",
+                     "session_id": "global", "created_at": created_at})
+
+    for i, (left_at, right_at) in enumerate([(100, 1), (1, 100)]):
+        left, hub, right = node(f"Pairend Left {i}"), node(f"Pairhub {i}"), node(f"Pairend Right {i}")
+        rel(left, hub, left_at)
+        rel(hub, right, right_at)
+        for j in range(5):
+            rel(hub, node(f"Pairfill {i} {j}"), 50 + j)
+        expected.add((f"Pairend Left {i}", ("KNOWS", "KNOWS"), f"Pairend Right {i}", 2))
+    return nodes, rels, expected
+
+
+def offline_pair_check() -> set:
+    """Missing anchor-pair paths from the snapshot expansion (the in-process mirror of the query)"""
+    nodes, rels, expected = anchor_pair_graph()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "pairs.csr")
+        compile_snapshot(path, nodes, rels)
+        snapshot = GlobalSnapshot(path)
+        snapshot._load()
+        graph = snapshot.graph
+        params = embedding_service.build_retrieval_params(PAIR_KEYWORDS)
+        anchors = graph.anchors(params["anchor_ids"], PAIR_KEYWORDS, params["anchor_per_keyword"])
+        paths, _, _ = graph.expand(anchors, params["hop1_fanout"], PAIR_HOP2_FANOUT)
+        found = undirected([dict(zip(ROW_KEYS, path)) for path in paths])
+    return expected - found
+
+
+def live_pair_check(query: str) -> set:
+    """Missing anchor-pair paths from the retrieval query on Neo4j"""
+    nodes, rels, expected = anchor_pair_graph()
+    db.execute_cypher(
+        """
+        UNWIND $nodes AS row
+        CREATE (:Entity:BenchNode {normalized_id: row.normalized_id, name: row.name, session_id: 'global'})
+        """,
+        {"nodes": nodes},
+    )
+    ids = {row["id"]: row["normalized_id"] for row in nodes}
+    db.execute_cypher(
+        """
+        UNWIND $rels AS rel
+        MATCH (a:BenchNode {normalized_id: rel.source}), (b:BenchNode {normalized_id: rel.target})
+        CREATE (a)-[:KNOWS {session_id: 'global', created_at: datetime({epochMillis: rel.created_at})}]->(b)
+        """,
+        {"rels": [{**rel, "source": ids[rel["source"]], "target": ids[rel["target"]]} for rel in rels]},
+    )
+    db.execute_cypher("CALL db.awaitIndexes(300)")
+    params = embedding_service.build_retrieval_params(PAIR_KEYWORDS)
+    params.update(session_id=SESSIONS[1], hop2_fanout=PAIR_HOP2_FANOUT, result_limit=1000)
+    found = undirected(db.execute_cypher(query, params))
+    cleanup()
+    return expected - found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--trials", type=int, default=50)
+    parser.add_argument("--nodes", type=int, default=40)
+    parser.add_argument("--edges", type=int, default=80)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--offline", action="store_true", help="check Python models of both queries, no Neo4j")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.offline:
+        totals = offline_check(rng, args.trials, args.nodes, args.edges)
+        print(f"✅ {totals['queries']} random queries over {args.trials} graphs ({totals['paths']} paths): "
+              f"identical paths, every node on every path visible to the session")
+        print(f"✅ {totals['limited']} limited queries: shortest paths first, no unknown paths; "
+              f"unique paths within the limit: variable-length {totals['old_unique']}, "
+              f"hop-by-hop {totals['new_unique']}")
+        missing = offline_pair_check()
+        if missing:
+            raise SystemExit(f"❌ Snapshot expansion lost anchor-pair paths a fanout cap cut from one end: {missing}")
+        print("✅ Anchor-pair paths reached from one end only are kept (snapshot expansion)")
+        print("⚠️ Offline mode checks Python models and the snapshot; the Cypher itself is only checked live")
+        return
+    query = embedding_service.build_secure_cypher_query(["placeholder"])
+
+    db.connect()
+    try:
+        cleanup()
+        create_indexes()
+
+        for trial in range(args.trials):
+            visible = seed_random_graph(rng, args.nodes, args.edges)
+            for _ in range(5):
+                keywords = rng.sample(NAMES, rng.randint(1, 2))
+                session_id = rng.choice(SESSIONS[1:] + [None])
+                params = params_for(keywords, session_id)
+
+                expected = undirected(db.execute_cypher(REFERENCE_QUERY, params))
+                rows = db.execute_cypher(query, params)
+                actual = undirected(rows)
+                if actual != expected:
+                    raise SystemExit(
+                        f"❌ Trial {trial}: keywords={keywords} session={session_id}\n"
+                        f"   missing: {sorted(expected - actual)[:5]}\n"
+                        f"   extra:   {sorted(actual - expected)[:5]}"
+                    )
+
+                allowed = {"global", session_id}
+                for row in rows:
+                    for name in (row["entity1"], row["entity2"]):
+                        if not visible[name] & allowed:
+                            raise SystemExit(f"❌ Trial {trial}: {name} leaked into session {session_id}")
+            cleanup()
+        print(f"✅ {args.trials * 5} random queries over {args.trials} graphs: identical paths, no cross-session leaks")
+
+        missing = live_pair_check(query)
+        if missing:
+            raise SystemExit(f"❌ The query lost anchor-pair paths a fanout cap cut from one end: {missing}")
+        print("✅ Anchor-pair paths reached from one end only are kept")
+
+        # db hits on one larger graph with a supernode
+        seed_random_graph(rng, 2000, 6000, hub_edges=1500)
+        params = embedding_service.build_retrieval_params(NAMES[:2])
+        params["session_id"] = SESSIONS[1]
+        before = db_hits(run_summary("PROFILE " + REFERENCE_QUERY, params).profile)
+        after = db_hits(run_summary("PROFILE " + query, params).profile)
+        print(f"db hits (2000 nodes, 7500 rels): variable-length {before:,}  hop-by-hop {after:,}")
+    finally:
+        cleanup()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Recall-vs-latency benchmark for the local vector index backends.
+
+Synthetic clustered vectors are loaded into the exact (NumPy brute force) and
+HNSW backends; HNSW recall@k is measured against exact results. The HNSW
+build is pure Python, so the 1M run takes a long time; pass --sizes to
+narrow it.
+
+Usage:
+    python benchmarks/vector_search.py --sizes 10000 100000 1000000 --dim 128
+"""
+
+import argparse
+import time
+
+import numpy as np
+from common import Timer, summarize_ms
+
+from vector_index import LocalVectorSearch
+
+
+def clustered_vectors(count: int, centers: np.ndarray, rng) -> np.ndarray:
+    labels = rng.integers(0, len(centers), count)
+    return centers[labels] + 0.35 * rng.standard_normal((count, centers.shape[1])).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 128])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(3)
+    for size in args.sizes:
+        centers = rng.standard_normal((max(10, size // 1000), args.dim)).astype(np.float32)
+        vectors = clustered_vectors(size, centers, rng)
+        queries = clustered_vectors(args.queries, centers, rng)
+        records = [
+            {"id": i, "text": f"doc {i}", "created_at": None, "embedding": vectors[i]}
+            for i in range(size)
+        ]
+
+        search = LocalVectorSearch(["exact", "hnsw"])
+        with Timer() as build:
+            search.add(records)
+        print(f"\n{size:,} vectors x {args.dim} dims  (index build {build.elapsed:.1f}s)")
+
+        truth, latencies = [], []
+        for query in queries:
+            start = time.perf_counter()
+            hits = search.search("exact", query, args.top_k)
+            latencies.append(time.perf_counter() - start)
+            truth.append({hit["id"] for hit in hits})
+        print(f"  exact            recall=1.000  {summarize_ms(latencies)}")
+
+        for ef in args.ef_search:
+            search.indexes["hnsw"].ef_search = ef
+            found, latencies = 0, []
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                hits = search.search("hnsw", query, args.top_k)
+                latencies.append(time.perf_counter() - start)
+                found += len(expected & {hit["id"] for hit in hits})
+            recall = found / (len(queries) * args.top_k)
+            print(f"  hnsw ef={ef:<4}    recall={recall:.3f}  {summarize_ms(latencies)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""
+Bulk import of whole documents (resumes, wikis, chat logs) into the knowledge graph.
+
+The document is split into chunks, graph extraction runs over a bounded pool
+of concurrent Gemini calls, per-chunk graphs are merged in memory (deduplicated
+by normalized_id) and committed in batched transactions. Committed chunks are
+checkpointed so an interrupted import resumes where it stopped.
+
+Usage:
+    python bulk_import.py resume.txt wiki.md --session-id global
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent runs of one job are not detected
+    fcntl = None
+
+from config import config
+from database import async_db
+from embeddings import embedding_service
+from model_scheduler import BULK, model_scheduler
+
+
+def chunk_text(text: str, max_chars: int = None) -> list:
+    """Split text into chunks of at most max_chars, on paragraph then sentence boundaries"""
+    max_chars = max_chars or config.IMPORT_CHUNK_CHARS
+
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+            # A single sentence longer than the limit is hard-wrapped
+            while len(sentence) > max_chars:
+                pieces.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            if sentence:
+                pieces.append(sentence)
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def normalized_node_id(node: dict) -> str:
+    """Same normalization create_graph_from_json applies before MERGE"""
+    node_id = node.get("id")
+    name = node.get("properties", {}).get("name", node_id)
+    return node_id.lower() if node_id else name.lower()
+
+
+def merge_graphs(graphs: list) -> dict:
+    """Merge per-chunk graphs, deduplicating nodes by normalized_id and edges by (from, to, type)"""
+    nodes = {}
+    edges = {}
+
+    for graph in graphs:
+        local_ids = {}
+        for node in graph.get("nodes", []):
+            normalized_id = normalized_node_id(node)
+            local_ids[node.get("id")] = normalized_id
+            if normalized_id in nodes:
+                # Later chunks can only add properties, the first label wins
+                merged = nodes[normalized_id]["properties"]
+                for key, value in node.get("properties", {}).items():
+                    merged.setdefault(key, value)
+            else:
+                nodes[normalized_id] = {
+                    "id": normalized_id,
+                    "label": node.get("label", "Entity"),
+                    "properties": dict(node.get("properties", {})),
+                }
+
+        for edge in graph.get("edges", []):
+            from_id = local_ids.get(edge.get("from"))
+            to_id = local_ids.get(edge.get("to"))
+            if from_id is None or to_id is None:
+                continue
+            rel_type = edge.get("type", "RELATED_TO")
+            edges.setdefault(
+                (from_id, to_id, rel_type),
+                {
+                    "from": from_id,
+                    "to": to_id,
+                    "type": rel_type,
+                    "properties": dict(edge.get("properties") or {}),
+                },
+            )
+
+    return {"nodes": list(nodes.values()), "edges": list(edges.values())}
+
+
+JOB_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+class ImportJobError(ValueError):
+    """A job id that cannot be used for this document, or is already running"""
+
+
+def import_job_id(text: str, session_id: str = None, chunk_chars: int = None) -> str:
+    """Stable job id, so re-submitting the same document resumes its checkpoint.
+
+    The chunk size is part of the digest: checkpointed chunk indices only
+    mean something for the chunking that produced them.
+    """
+    chunk_chars = chunk_chars or config.IMPORT_CHUNK_CHARS
+    digest = hashlib.sha256(f"{session_id or 'global'}\0{chunk_chars}\0{text}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class ImportCheckpoint:
+    """Append-only log of committed chunk indices for one import job.
+
+    The first line records the digest of the document (session and chunk
+    size) the job was started for, so a job id reused for a different
+    document, or for the same one chunked differently, is refused instead of
+    skipping chunks that were never committed.
+
+    The checkpoint file is held open with an exclusive flock from creation
+    until close(), so a second run of the same job (another /import post or
+    the CLI) is refused instead of extracting every pending chunk again and
+    interleaving its appends with the first run's.
+    """
+
+    def __init__(self, job_id: str, document: str, directory: str = None):
+        if not JOB_ID_PATTERN.fullmatch(job_id or ""):
+            raise ImportJobError("job_id must be 1-64 letters, digits, '_' or '-'")
+        directory = os.path.realpath(directory or config.IMPORT_CHECKPOINT_DIR)
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.realpath(os.path.join(directory, f"{job_id}.jsonl"))
+        if os.path.dirname(self.path) != directory:
+            raise ImportJobError(f"job_id '{job_id}' resolves outside {directory}")
+        self.job_id = job_id
+        self.document = document
+
+        self._file = open(self.path, "a", encoding="utf-8")
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise ImportJobError(f"Import job '{job_id}' is already running") from None
+
+            recorded = self._recorded_document()
+            if recorded is None and os.path.getsize(self.path) == 0:
+                self._append({"document": document, "at": time.time()})
+            elif recorded != document and not (recorded is None and job_id == document):
+                # A checkpoint without its header line (torn first write) is only
+                # trusted when its job id is the document digest itself
+                raise ImportJobError(
+                    f"Import job '{job_id}' was started for a different document or chunk size; "
+                    f"use another job_id or omit it"
+                )
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        """Release the job for other runs"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _recorded_document(self):
+        with open(self.path, encoding="utf-8") as f:
+            try:
+                return json.loads(f.readline()).get("document")
+            except ValueError:
+                return None
+
+    def load(self) -> set:
+        done = set()
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    done.update(json.loads(line).get("chunks", []))
+                except ValueError:
+                    # A torn final line from a crash mid-write is ignored
+                    continue
+        return done
+
+    def mark(self, chunk_indices: list):
+        self._append({"chunks": sorted(chunk_indices), "at": time.time()})
+
+    def _append(self, entry: dict):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+
+class BulkImporter:
+    """Chunk -> extract (bounded concurrency) -> merge -> batched commit"""
+
+    def __init__(self, workers: int = None, batch_chunks: int = None, chunk_chars: int = None):
+        self.workers = workers or config.IMPORT_WORKERS
+        self.batch_chunks = batch_chunks or config.IMPORT_BATCH_CHUNKS
+        self.chunk_chars = chunk_chars or config.IMPORT_CHUNK_CHARS
+
+    def checkpoint(self, text: str, session_id: str = None, job_id: str = None) -> ImportCheckpoint:
+        """Checkpoint for the job, held until closed; raises ImportJobError
+        for an unusable job_id or a job that is already running"""
+        document = import_job_id(text, session_id, self.chunk_chars)
+        return ImportCheckpoint(job_id or document, document)
+
+    async def run(self, text: str, session_id: str = None, job_id: str = None,
+                  checkpoint: ImportCheckpoint = None):
+        """Import a document, yielding progress events as dicts. The
+        checkpoint (passed in or created here) is closed when the run ends."""
+        checkpoint = checkpoint or self.checkpoint(text, session_id, job_id)
+        try:
+            async for event in self._run(text, session_id, checkpoint):
+                yield event
+        finally:
+            checkpoint.close()
+
+    async def _run(self, text: str, session_id: str, checkpoint: ImportCheckpoint):
+        started = time.perf_counter()
+        job_id = checkpoint.job_id
+        chunks = chunk_text(text, self.chunk_chars)
+        done = checkpoint.load()
+        pending = [i for i in range(len(chunks)) if i not in done]
+
+        yield {
+            "event": "start",
+            "job_id": job_id,
+            "chunks_total": len(chunks),
+            "chunks_resumed": len(chunks) - len(pending),
+        }
+
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def extract(index: int):
+            async with semaphore:
+                try:
+                    # Imports queue behind interactive /chat traffic for Gemini slots
+                    with model_scheduler.lane(BULK):
+                        graph = await embedding_service.extract_graph_structure_async(chunks[index])
+                    return index, graph, None
+                except Exception as e:
+                    return index, None, e
+
+        stats = {"chunks_done": 0, "chunks_failed": 0, "nodes": 0, "facts": 0}
+        buffer = []
+
+        async def commit(batch: list) -> dict:
+            merged = merge_graphs([graph for _, graph in batch])
+            result = await async_db.create_graph_from_json(merged, session_id=session_id)
+            checkpoint.mark([index for index, _ in batch])
+            stats["chunks_done"] += len(batch)
+            stats["nodes"] += result["nodes_created"]
+            stats["facts"] += result["edges_created"]
+            return self._progress(stats, len(chunks), len(done), started)
+
+        tasks = [asyncio.create_task(extract(i)) for i in pending]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                index, graph, error = await finished
+                if error is not None:
+                    stats["chunks_failed"] += 1
+                    yield {"event": "chunk_failed", "chunk": index, "error": str(error)}
+                    continue
+                buffer.append((index, graph))
+                if len(buffer) >= self.batch_chunks:
+                    yield await commit(buffer)
+                    buffer = []
+            if buffer:
+                yield await commit(buffer)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        summary = self._progress(stats, len(chunks), len(done), started)
+        summary["event"] = "done"
+        summary["job_id"] = job_id
+        yield summary
+
+    @staticmethod
+    def _progress(stats: dict, chunks_total: int, chunks_resumed: int, started: float) -> dict:
+        elapsed = time.perf_counter() - started
+        return {
+            "event": "progress",
+            "chunks_total": chunks_total,
+            "chunks_completed": chunks_resumed + stats["chunks_done"],
+            "chunks_failed": stats["chunks_failed"],
+            "nodes_written": stats["nodes"],
+            "facts_written": stats["facts"],
+            "elapsed_seconds": round(elapsed, 3),
+            "facts_per_second": round(stats["facts"] / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+
+bulk_importer = BulkImporter()
+
+
+async def import_files(paths: list, session_id: str = None, workers: int = None):
+    """Import one or more files (or stdin for '-') from the command line"""
+    config.validate()
+    await async_db.connect()
+    embedding_service.initialize()
+    importer = BulkImporter(workers=workers)
+
+    try:
+        for path in paths:
+            if path == "-":
+                text = sys.stdin.read()
+            else:
+                with open(path, encoding="utf-8") as f:
+                    text = f.read()
+
+            print(f"📄 Importing {path}")
+            try:
+                checkpoint = importer.checkpoint(text, session_id)
+            except ImportJobError as e:
+                print(f"   ❌ {e}")
+                continue
+            async for event in importer.run(text, session_id=session_id, checkpoint=checkpoint):
+                if event["event"] == "start":
+                    print(f"   - {event['chunks_total']} chunks ({event['chunks_resumed']} already committed)")
+                elif event["event"] == "chunk_failed":
+                    print(f"   ⚠️  Chunk {event['chunk']} failed: {event['error']}")
+                elif event["event"] == "progress":
+                    print(
+                        f"   - {event['chunks_completed']}/{event['chunks_total']} chunks, "
+                        f"{event['facts_written']} facts, {event['facts_per_second']} facts/s"
+                    )
+                else:
+                    print(
+                        f"✅ Done in {event['elapsed_seconds']}s: {event['nodes_written']} nodes, "
+                        f"{event['facts_written']} facts ({event['facts_per_second']} facts/s)"
+                    )
+                    if event["chunks_failed"]:
+                        print(f"   Re-run to retry {event['chunks_failed']} failed chunk(s)")
+    finally:
+        await async_db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import documents into the knowledge graph")
+    parser.add_argument("paths", nargs="+", help="text files to import, or - for stdin")
+    parser.add_argument("--session-id", default=None, help="target session (default: global)")
+    parser.add_argument("--workers", type=int, default=None, help="concurrent extraction calls")
+    args = parser.parse_args()
+
+    asyncio.run(import_files(args.paths, session_id=args.session_id, workers=args.workers))
@@ -0,0 +1,348 @@
+"""
+In-process caches for the request path.
+"""
+
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+from config import config
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ttl_seconds"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def get(self, key, valid=None):
+        """Return the cached value or None, counting a hit or a miss.
+
+        An entry whose value fails valid(value) is dropped like an expired one.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic() or (valid is not None and not valid(entry[1])):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, key):
+        """Return the cached value or None without touching counters or LRU order"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop_where(self, predicate) -> int:
+        """Drop every entry whose key matches predicate, returning how many were dropped"""
+        with self._lock:
+            doomed = [key for key in self._entries if predicate(key)]
+            for key in doomed:
+                del self._entries[key]
+            return len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SharedGenerations:
+    """Write counters in a small memory-mapped file shared by every uvicorn worker.
+
+    Slot 0 counts writes that touched the global layer; every other slot
+    counts writes to the sessions that hash to it. A cached retrieval stamped
+    with the counters it was read under is stale once either has moved, in
+    whichever worker the write happened. An empty path keeps invalidation
+    in-process (single worker).
+
+    File layout:
+        u64[1 + SESSION_SLOTS], little-endian
+    """
+
+    SESSION_SLOTS = 4096
+    SLOT = struct.Struct("<Q")
+
+    def __init__(self, path: str = None):
+        self.path = config.RETRIEVAL_CACHE_SHARED_PATH if path is None else path
+        self._file = None
+        self._map = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _slot(self, session_id: str = None) -> int:
+        if session_id in (None, "none", "global"):
+            return None
+        return 1 + zlib.crc32(session_id.encode("utf-8")) % self.SESSION_SLOTS
+
+    def _open(self) -> bool:
+        if self._map is not None:
+            return True
+        if not self.enabled:
+            return False
+        with self._lock:
+            if self._map is None:
+                try:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    self._file = open(self.path, "a+b")
+                    size = (1 + self.SESSION_SLOTS) * self.SLOT.size
+                    if os.fstat(self._file.fileno()).st_size < size:
+                        self._file.truncate(size)
+                    self._map = mmap.mmap(self._file.fileno(), size)
+                except OSError as e:
+                    print(f"⚠️ Shared retrieval cache generations unavailable ({e}), invalidating in-process only")
+                    self.path = ""
+                    return False
+        return True
+
+    def read(self, session_id: str = None) -> tuple:
+        """(global writes, writes to session_id's slot)"""
+        if not self._open():
+            return 0, 0
+        slot = self._slot(session_id)
+        return (
+            self.SLOT.unpack_from(self._map, 0)[0],
+            self.SLOT.unpack_from(self._map, slot * self.SLOT.size)[0] if slot else 0,
+        )
+
+    def bump(self, session_id: str = None, touched_global: bool = False):
+        if not self._open():
+            return
+        slot = None if touched_global else self._slot(session_id)
+        offset = (slot or 0) * self.SLOT.size
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            try:
+                self.SLOT.pack_into(self._map, offset, self.SLOT.unpack_from(self._map, offset)[0] + 1)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+
+class RetrievalCache(TTLCache):
+    """Graph retrieval results keyed on (session_id, normalized keyword set).
+
+    Entries for a session are dropped whenever create_graph_from_json writes
+    to that session; writes that touch the global layer drop everything,
+    since global nodes are visible to every session. Writes handled by other
+    workers are seen through SharedGenerations: every entry carries the
+    shared counters it was stored under and is dropped on lookup once they
+    have moved.
+    """
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None, shared: SharedGenerations = None):
+        super().__init__(
+            config.RETRIEVAL_CACHE_SIZE if max_entries is None else max_entries,
+            config.RETRIEVAL_CACHE_TTL if ttl_seconds is None else ttl_seconds,
+        )
+        self.shared = shared or SharedGenerations()
+        self.invalidations = 0
+        # Bumped on every invalidation so a query that raced a write is not stored
+        self.generation = 0
+
+    @staticmethod
+    def make_key(keywords: list, session_id: str = None) -> tuple:
+        # execute_cypher treats None and 'none' alike: only the global layer is visible
+        if session_id in (None, "none"):
+            session_id = None
+        normalized = frozenset(k.strip().lower() for k in keywords or [] if k and k.strip())
+        return session_id, normalized
+
+    def lookup(self, keywords: list, session_id: str = None):
+        key = self.make_key(keywords, session_id)
+        shared = self.shared.read(key[0])
+        entry = self.get(key, valid=lambda value: value[0] == shared)
+        return entry[1] if entry is not None else None
+
+    def stamp(self, session_id: str = None) -> tuple:
+        """Generation to read before querying and pass to store()"""
+        return self.generation, self.shared.read(self.make_key([], session_id)[0])
+
+    def store(self, keywords: list, session_id: str, retrieved: dict, generation: tuple):
+        """Cache a retrieval unless an invalidation happened since generation was read"""
+        if generation != self.stamp(session_id):
+            return
+        self.set(self.make_key(keywords, session_id), (generation[1], retrieved))
+
+    def invalidate_for_write(self, session_id: str = None, touched_global: bool = False):
+        """Called after create_graph_from_json commits a write for session_id"""
+        self.generation += 1
+        self.invalidations += 1
+        self.shared.bump(session_id, touched_global or not session_id or session_id == "global")
+        if not session_id or session_id == "global" or touched_global:
+            self.clear()
+        else:
+            self.pop_where(lambda key: key[0] == session_id)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["invalidations"] = self.invalidations
+        return stats
+
+
+class AnswerCache(TTLCache):
+    """Generated answers keyed on a canonical hash of (question, triple set).
+
+    Every key is scoped to the asking session, so an answer built from one
+    session's facts is never served to another. With a similarity threshold
+    set, a question that misses exactly can still match an earlier question
+    over the *same* triple set whose embedding is close enough.
+    """
+
+    SIMILAR_PER_GROUP = 8
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None, similarity_threshold: float = None):
+        super().__init__(
+            config.ANSWER_CACHE_SIZE if max_entries is None else max_entries,
+            config.ANSWER_CACHE_TTL if ttl_seconds is None else ttl_seconds,
+        )
+        self.similarity_threshold = (
+            config.ANSWER_CACHE_SIMILARITY if similarity_threshold is None else similarity_threshold
+        )
+        # (scope, triples_digest) -> recent keys answered over that triple set
+        self._groups = OrderedDict()
+        self.similar_hits = 0
+        self.llm_calls_avoided = 0
+        self.latency_saved = 0.0
+
+    @staticmethod
+    def canonical_question(question: str) -> str:
+        return re.sub(r"\s+", " ", question.lower()).strip(" ?.!")
+
+    @staticmethod
+    def canonical_triples(results: list) -> list:
+        triples = set()
+        for record in results:
+            relationships = record.get("relationships", [])
+            if not isinstance(relationships, list):
+                relationships = [relationships]
+            triples.add((str(record.get("entity1", "")), tuple(relationships), str(record.get("entity2", ""))))
+        return sorted(triples)
+
+    def make_key(self, question: str, results: list, session_id: str = None) -> tuple:
+        scope = None if session_id in (None, "none") else session_id
+        triples_digest = hashlib.sha256(
+            json.dumps(self.canonical_triples(results)).encode("utf-8")
+        ).hexdigest()
+        question_digest = hashlib.sha256(
+            f"{self.canonical_question(question)}\0{triples_digest}".encode("utf-8")
+        ).hexdigest()
+        return scope, triples_digest, question_digest
+
+    def lookup(self, key: tuple):
+        entry = self.get(key)
+        if entry is not None:
+            self._record_hit(entry)
+        return entry
+
+    def lookup_similar(self, key: tuple, question_embedding: list):
+        """Best entry over the same (scope, triple set) above the similarity threshold"""
+        with self._lock:
+            candidates = list(self._groups.get(key[:2], ()))
+        best, best_score = None, self.similarity_threshold
+        for candidate in candidates:
+            entry = self.peek(candidate)
+            if entry is None or entry["embedding"] is None:
+                continue
+            score = cosine_similarity(question_embedding, entry["embedding"])
+            if score >= best_score:
+                best, best_score = entry, score
+        if best is not None:
+            with self._lock:
+                # The exact probe already counted this request as a miss
+                self.misses -= 1
+                self.hits += 1
+                self.similar_hits += 1
+            self._record_hit(best)
+        return best
+
+    def store(self, key: tuple, answer: str, latency: float, question_embedding: list = None):
+        self.set(key, {"answer": answer, "latency": latency, "embedding": question_embedding})
+        if question_embedding is None or not self.enabled:
+            return
+        with self._lock:
+            group = self._groups.setdefault(key[:2], deque(maxlen=self.SIMILAR_PER_GROUP))
+            self._groups.move_to_end(key[:2])
+            group.append(key)
+            while len(self._groups) > self.max_entries:
+                self._groups.popitem(last=False)
+
+    def _record_hit(self, entry: dict):
+        self.llm_calls_avoided += 1
+        self.latency_saved += entry["latency"]
+
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self._groups.clear()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["similar_hits"] = self.similar_hits
+        stats["llm_calls_avoided"] = self.llm_calls_avoided
+        stats["latency_saved_ms"] = round(self.latency_saved * 1000, 1)
+        return stats
+
+
+def cosine_similarity(a: list, b: list) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+retrieval_cache = RetrievalCache()
+answer_cache = AnswerCache()
@@ -0,0 +1,224 @@
+"""
+Record/replay of model calls, for comparing performance changes on real
+traffic without paying for (or depending on) Gemini.
+
+CASSETTE_MODE=record wraps the configured model backend: every generation,
+stream and embedding goes through as usual and is appended to CASSETTE_PATH
+as one compact JSON line {"op", "k", "r", "ms"}, where k is a hash of the
+model, prompt and generation config and ms the observed latency; embedding
+entries also say whether the vectors came from an offline backend. /chat
+and /chat/stream requests are appended to CASSETTE_CHAT_LOG at the same
+time, with the endpoint they came in on, which gives replay_chat.py a
+session log to drive the same endpoints with.
+
+CASSETTE_MODE=replay serves every call from the cassette (no API key or
+network needed) and, with CASSETTE_REPLAY_LATENCY, sleeps for the recorded
+latency first. A prompt that was recorded more than once is answered with
+its recordings in order, then the last one again. A prompt that was never
+recorded raises CassetteMiss, so drift in the prompts shows up instead of
+being papered over. A generation recorded as a stream can answer the same
+prompt asked without streaming (its chunks joined), and the other way round.
+Replayed vectors are only cached as the real embedding model's when every
+recorded embedding came from it.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+from config import config
+
+
+class CassetteMiss(KeyError):
+    """Replay was asked for a call the cassette does not have"""
+
+
+def call_key(op: str, model: str, payload, generation_config: dict = None) -> str:
+    data = json.dumps([op, model, payload, generation_config], sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:32]
+
+
+class JsonLinesWriter:
+    """Append-only JSON Lines file shared by threads and tasks"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def append(self, entry: dict):
+        line = json.dumps(entry, separators=(",", ":"), default=str) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class CassetteBackend:
+    """ModelBackend wrapper that records to, or replays from, a cassette file"""
+
+    def __init__(self, mode: str, path: str, inner=None, replay_latency: bool = None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown CASSETTE_MODE '{mode}' (expected record or replay)")
+        if mode == "record" and inner is None:
+            raise ValueError("Recording needs a model backend to record from")
+        self.mode = mode
+        self.path = path
+        self.inner = inner
+        self.replay_latency = config.CASSETTE_REPLAY_LATENCY if replay_latency is None else replay_latency
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self.writer = JsonLinesWriter(path) if mode == "record" else None
+        self.entries = defaultdict(deque)
+        self._synthetic = False
+        if mode == "replay":
+            self._load()
+
+    @property
+    def synthetic_embeddings(self) -> bool:
+        if self.mode == "replay":
+            return self._synthetic
+        return getattr(self.inner, "synthetic_embeddings", False)
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.entries[(entry["op"], entry["k"])].append(entry)
+                    # Embeddings recorded without the flag may be from anywhere
+                    if entry["op"] == "embed" and entry.get("synthetic", True):
+                        self._synthetic = True
+        print(f"📼 Loaded {sum(len(q) for q in self.entries.values())} recorded model calls from {self.path}")
+
+    def _next(self, op: str, key: str) -> dict:
+        recordings = self.entries.get((op, key))
+        if not recordings:
+            self.misses += 1
+            raise CassetteMiss(f"No recorded {op} call for key {key} in {self.path}")
+        self.replayed += 1
+        return recordings.popleft() if len(recordings) > 1 else recordings[0]
+
+    def _next_generation(self, op: str, model: str, prompt: str, generation_config: dict = None) -> dict:
+        """Recorded "generate" or "stream" call for the prompt, preferring op.
+        The entry is returned in op's shape: text for generate, chunks for stream."""
+        other = "stream" if op == "generate" else "generate"
+        key = call_key(op, model, prompt, generation_config)
+        other_key = call_key(other, model, prompt, generation_config)
+        if self.entries.get((op, key)) or not self.entries.get((other, other_key)):
+            return self._next(op, key)
+        entry = self._next(other, other_key)
+        if op == "generate":
+            return {**entry, "r": "".join(entry["r"] or [])}
+        return {**entry, "r": [entry["r"]], "first_ms": entry["ms"]}
+
+    def _record(self, op: str, key: str, response, started: float, **extra):
+        self.recorded += 1
+        self.writer.append({"op": op, "k": key, "r": response,
+                            "ms": round((time.perf_counter() - started) * 1000, 1), **extra})
+
+    def generate(self, model: str, prompt: str, generation_config: dict = None) -> str:
+        key = call_key("generate", model, prompt, generation_config)
+        if self.mode == "replay":
+            entry = self._next_generation("generate", model, prompt, generation_config)
+            if self.replay_latency:
+                time.sleep(entry["ms"] / 1000)
+            return entry["r"]
+        started = time.perf_counter()
+        text = self.inner.generate(model, prompt, generation_config)
+        self._record("generate", key, text, started)
+        return text
+
+    async def generate_async(self, model: str, prompt: str, generation_config: dict = None) -> str:
+        key = call_key("generate", model, prompt, generation_config)
+        if self.mode == "replay":
+            entry = self._next_generation("generate", model, prompt, generation_config)
+            if self.replay_latency:
+                await asyncio.sleep(entry["ms"] / 1000)
+            return entry["r"]
+        started = time.perf_counter()
+        text = await self.inner.generate_async(model, prompt, generation_config)
+        self._record("generate", key, text, started)
+        return text
+
+    async def generate_stream_async(self, model: str, prompt: str, generation_config: dict = None):
+        key = call_key("stream", model, prompt, generation_config)
+        if self.mode == "replay":
+            entry = self._next_generation("stream", model, prompt, generation_config)
+            return self._replay_stream(entry)
+
+        started = time.perf_counter()
+        stream = await self.inner.generate_stream_async(model, prompt, generation_config)
+
+        async def texts():
+            chunks, first = [], None
+            async for text in stream:
+                if first is None:
+                    first = round((time.perf_counter() - started) * 1000, 1)
+                chunks.append(text)
+                yield text
+            # Only complete streams are recorded
+            self._record("stream", key, chunks, started, first_ms=first)
+
+        return texts()
+
+    async def _replay_stream(self, entry: dict):
+        chunks = entry["r"] or [""]
+        if self.replay_latency:
+            first = entry.get("first_ms") or 0.0
+            await asyncio.sleep(first / 1000)
+            gap = max(0.0, entry["ms"] - first) / 1000 / max(1, len(chunks) - 1)
+        for i, text in enumerate(chunks):
+            if i and self.replay_latency:
+                await asyncio.sleep(gap)
+            yield text
+
+    def embed(self, model: str, contents) -> list:
+        key = call_key("embed", model, contents)
+        if self.mode == "replay":
+            entry = self._next("embed", key)
+            if self.replay_latency:
+                time.sleep(entry["ms"] / 1000)
+            return entry["r"]
+        started = time.perf_counter()
+        vectors = [list(v) for v in self.inner.embed(model, contents)]
+        self._record("embed", key, vectors, started, synthetic=self.synthetic_embeddings)
+        return vectors
+
+    async def embed_async(self, model: str, contents) -> list:
+        key = call_key("embed", model, contents)
+        if self.mode == "replay":
+            entry = self._next("embed", key)
+            if self.replay_latency:
+                await asyncio.sleep(entry["ms"] / 1000)
+            return entry["r"]
+        started = time.perf_counter()
+        vectors = [list(v) for v in await self.inner.embed_async(model, contents)]
+        self._record("embed", key, vectors, started, synthetic=self.synthetic_embeddings)
+        return vectors
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "path": self.path, "recorded": self.recorded,
+                "replayed": self.replayed, "misses": self.misses}
+
+
+class ChatLog:
+    """Session log of /chat and /chat/stream requests captured while recording"""
+
+    def __init__(self):
+        self.writer = None
+
+    def record(self, request: dict, endpoint: str = "/chat"):
+        if config.CASSETTE_MODE != "record":
+            return
+        if self.writer is None:
+            self.writer = JsonLinesWriter(config.CASSETTE_CHAT_LOG)
+        self.writer.append({"t": round(time.time(), 3), "endpoint": endpoint, **request})
+
+
+chat_log = ChatLog()
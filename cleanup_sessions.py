@@ -1,46 +1,39 @@
 """
-Optional: Clean up old session nodes (run periodically via cron job)
+Optional: Clean up expired session data (run periodically via cron job).
+
+The API already does this every SESSION_CLEANUP_INTERVAL seconds; use this
+script when that is disabled (SESSION_CLEANUP_INTERVAL=0) or to clear a
+backlog by hand.
 """
 
-from database import db
-from datetime import datetime, timedelta
+import asyncio
+
+from database import async_db
+from session_cleanup import session_cleaner
+
 
-def cleanup_old_sessions(days_old=1):
+async def cleanup_old_sessions() -> dict:
     """
-    Remove nodes from sessions older than specified days.
-    Only removes session nodes, never touches global nodes.
+    Remove session nodes and relationships whose expires_at has passed.
+    Only removes session data, never touches global nodes.
     """
-    db.connect()
-    
+    await async_db.connect()
+
     try:
-        # Calculate cutoff timestamp
-        # Session IDs contain timestamp: session_<timestamp>_<random>
-        cutoff_time = datetime.now() - timedelta(days=days_old)
-        cutoff_timestamp = int(cutoff_time.timestamp() * 1000)
-        
-        # Find and delete old session nodes
-        query = """
-        MATCH (n)
-        WHERE n.session_id <> 'global' 
-          AND n.session_id IS NOT NULL
-          AND toInteger(split(n.session_id, '_')[1]) < $cutoff_timestamp
-        DETACH DELETE n
-        RETURN count(n) as deleted_count
-        """
-        
-        result = db.execute_cypher(query, {"cutoff_timestamp": cutoff_timestamp})
-        deleted = result[0]['deleted_count'] if result else 0
-        
+        report = await session_cleaner.run(async_db)
+
         print(f"✅ Cleanup complete!")
-        print(f"   - Deleted {deleted} old session nodes")
-        print(f"   - Cutoff: {days_old} day(s) old")
-        
+        print(f"   - Deleted {report['nodes_deleted']} nodes from {report['sessions']} expired sessions")
+        print(f"   - Deleted {report['relationships_deleted']} session relationships")
+        print(f"   - Deleted {report['global_relationships_deleted']} orphaned relationships on global nodes")
+        print(f"   - Took {report['duration_seconds']:.2f}s")
+        return report
+
     except Exception as e:
         print(f"❌ Error during cleanup: {e}")
         raise
     finally:
-        db.close()
+        await async_db.close()
 
 if __name__ == "__main__":
-    # Clean up sessions older than 1 day
-    cleanup_old_sessions(days_old=1)
+    asyncio.run(cleanup_old_sessions())
@@ -1,15 +1,34 @@
 import { useState, useRef, useEffect } from 'react';
-import axios from 'axios';
 
 const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:5001';
 const API_KEY = import.meta.env.VITE_API_SECRET || "default-dev-secret";
 
-const api = axios.create({
-    baseURL: API_BASE_URL,
-    headers: {
-        'x-api-key': API_KEY
+// Parse a Server-Sent Events response body, calling onEvent(event, data) per event
+const readEventStream = async (response, onEvent) => {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            for (const line of block.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            if (data) onEvent(event, JSON.parse(data));
+        }
     }
-});
+};
 
 // Generate unique session ID
 const generateSessionId = () => {
@@ -22,6 +41,7 @@ function ChatInterface({ onGraphUpdate, sessionId }) {
     const [isLoading, setIsLoading] = useState(false);
     const messagesEndRef = useRef(null);
     const [streamingMessage, setStreamingMessage] = useState(null);
+    const [loadingStage, setLoadingStage] = useState(null);
 
     const scrollToBottom = () => {
         messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -31,30 +51,6 @@ function ChatInterface({ onGraphUpdate, sessionId }) {
         scrollToBottom();
     }, [messages, streamingMessage]);
 
-    const typewriterEffect = (text, callback) => {
-        let index = 0;
-        const tempMessage = {
-            id: Date.now(),
-            type: 'assistant',
-            content: '',
-            isStreaming: true
-        };
-
-        setStreamingMessage(tempMessage);
-
-        const interval = setInterval(() => {
-            if (index < text.length) {
-                tempMessage.content += text[index];
-                setStreamingMessage({ ...tempMessage });
-                index++;
-            } else {
-                clearInterval(interval);
-                setStreamingMessage(null);
-                callback(tempMessage);
-            }
-        }, 20);
-    };
-
     const [actionType, setActionType] = useState('add_fact'); 
 
     const handleSend = async (overrideActionType = null) => {
@@ -81,40 +77,79 @@ function ChatInterface({ onGraphUpdate, sessionId }) {
                 content: msg.content
             }));
 
-            const response = await api.post('/chat', {
-                message: input,
-                action_type: selectedAction,
-                history: history,
-                session_id: sessionId
+            const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'x-api-key': API_KEY
+                },
+                body: JSON.stringify({
+                    message: input,
+                    action_type: selectedAction,
+                    history: history,
+                    session_id: sessionId
+                })
             });
 
-            const { action, response: aiResponse, details } = response.data;
+            if (!response.ok) {
+                const body = await response.json().catch(() => ({}));
+                throw new Error(body.detail || `Request failed with status ${response.status}`);
+            }
 
-            // ... rest of the typewriter effect logic stays the same ...
-            typewriterEffect(aiResponse, (completedMessage) => {
-                setMessages(prev => [...prev, {
-                    ...completedMessage,
-                    isStreaming: false,
-                    action,
-                    details
-                }]);
+            // Render answer tokens as the server streams them
+            const liveMessage = {
+                id: Date.now(),
+                type: 'assistant',
+                content: '',
+                isStreaming: true
+            };
+            let result = null;
 
-                if (action === 'add_fact' && onGraphUpdate) {
-                    onGraphUpdate();
+            await readEventStream(response, (event, data) => {
+                if (event === 'rewritten') {
+                    setLoadingStage(selectedAction === 'add_fact' ? 'Adding fact...' : `Searching for "${data.rewritten_query}"...`);
+                } else if (event === 'retrieved') {
+                    setLoadingStage(`Found ${data.results_count} facts, writing answer...`);
+                } else if (event === 'token') {
+                    liveMessage.content += data.text;
+                    setStreamingMessage({ ...liveMessage });
+                } else if (event === 'done') {
+                    result = data;
+                } else if (event === 'error') {
+                    throw new Error(data.detail);
                 }
             });
 
+            if (!result) {
+                throw new Error('Connection closed before the answer finished');
+            }
+
+            const { action, response: aiResponse, details } = result;
+            setStreamingMessage(null);
+            setMessages(prev => [...prev, {
+                ...liveMessage,
+                content: aiResponse,
+                isStreaming: false,
+                action,
+                details
+            }]);
+
+            if (action === 'add_fact' && onGraphUpdate) {
+                onGraphUpdate();
+            }
+
         } catch (error) {
-            // ... error handling stays the same ...
+            setStreamingMessage(null);
             const errorMessage = {
                 id: Date.now(),
                 type: 'assistant',
-                content: `Error: ${error.response?.data?.detail || error.message}`,
+                content: `Error: ${error.message}`,
                 isError: true
             };
             setMessages(prev => [...prev, errorMessage]);
         } finally {
             setIsLoading(false);
+            setLoadingStage(null);
         }
     };
 
@@ -179,7 +214,7 @@ function ChatInterface({ onGraphUpdate, sessionId }) {
                     <div style={styles.loaderContainer}>
                         <div style={styles.loader}>⏳</div>
                         <div style={styles.loaderText}>
-                            {actionType === 'add_fact' ? 'Adding fact...' : 'Searching...'}
+                            {loadingStage || (actionType === 'add_fact' ? 'Adding fact...' : 'Searching...')}
                         </div>
                     </div>
                 )}
@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -9,6 +10,27 @@ class Config:
     
     # Gemini API
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+    # Model backend: "gemini", or "fake" for an offline deterministic model
+    # (benchmarks / load tests without network or API key)
+    MODEL_BACKEND = os.getenv("MODEL_BACKEND", "gemini")
+    GENERATION_MODEL = os.getenv("GENERATION_MODEL", "gemini-2.5-flash")
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "gemini-embedding-001")
+    # Fake backend latency per call kind as JSON, each one of
+    # {"dist": "fixed", "ms"}, {"dist": "uniform", "low_ms", "high_ms"},
+    # {"dist": "lognormal", "median_ms", "sigma"}
+    FAKE_MODEL_LATENCY = json.loads(os.getenv(
+        "FAKE_MODEL_LATENCY",
+        '{"generate": {"dist": "lognormal", "median_ms": 400, "sigma": 0.3}, "embed": {"dist": "fixed", "ms": 40}}',
+    ))
+    FAKE_MODEL_ERROR_RATE = float(os.getenv("FAKE_MODEL_ERROR_RATE", 0))
+    FAKE_MODEL_SEED = int(os.getenv("FAKE_MODEL_SEED", 0))
+    FAKE_EMBEDDING_DIM = int(os.getenv("FAKE_EMBEDDING_DIM", 768))
+    # Record model calls to / replay them from a cassette: "off", "record", "replay"
+    CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()
+    CASSETTE_PATH = os.getenv("CASSETTE_PATH", ".cassettes/model_calls.jsonl")
+    CASSETTE_CHAT_LOG = os.getenv("CASSETTE_CHAT_LOG", ".cassettes/chat.jsonl")
+    CASSETTE_REPLAY_LATENCY = os.getenv("CASSETTE_REPLAY_LATENCY", "true").lower() == "true"
     
     # Neo4j Database
     NEO4J_URI = os.getenv("NEO4J_URI", "neo4j://127.0.0.1:7687")
@@ -20,12 +42,121 @@ class Config:
     PORT = int(os.getenv("PORT", 5001))
     HOST = os.getenv("HOST", "0.0.0.0")
     
+    # Graph ingestion: one UNWIND statement per label / relationship type
+    # instead of one MERGE per node and edge
+    GRAPH_BULK_INGEST = os.getenv("GRAPH_BULK_INGEST", "true").lower() == "true"
+
+    # Start retrieval from locally matched names while the LLM rewrite runs;
+    # the result is kept when the LLM keywords match
+    RETRIEVAL_SPECULATIVE = os.getenv("RETRIEVAL_SPECULATIVE", "true").lower() == "true"
+
+    # Retrieval result cache (0 disables)
+    RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", 1024))
+    RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", 300))
+    # Write counters shared by every worker so cached retrievals go stale
+    # across processes ("" invalidates in-process only: single worker)
+    RETRIEVAL_CACHE_SHARED_PATH = os.getenv("RETRIEVAL_CACHE_SHARED_PATH", ".retrieval_cache/generations")
+    # Most anchor nodes (index hits for the question keywords) expanded per
+    # query, split evenly between the keywords; each keyword's exact match
+    # ranks first, then id prefixes, then full-text hits
+    RETRIEVAL_ANCHOR_LIMIT = int(os.getenv("RETRIEVAL_ANCHOR_LIMIT", 50))
+    # Most paths returned to the answer prompt
+    RETRIEVAL_RESULT_LIMIT = int(os.getenv("RETRIEVAL_RESULT_LIMIT", 20))
+    # Supernode guards: most edges followed per anchor / per hop-1 node, and the
+    # degree above which a hop-1 node's edges are taken unsorted
+    RETRIEVAL_HOP1_FANOUT = int(os.getenv("RETRIEVAL_HOP1_FANOUT", 100))
+    RETRIEVAL_HOP2_FANOUT = int(os.getenv("RETRIEVAL_HOP2_FANOUT", 20))
+    RETRIEVAL_SUPERNODE_DEGREE = int(os.getenv("RETRIEVAL_SUPERNODE_DEGREE", 1000))
+    # Recent-activity feed for questions without keywords: how far back to
+    # look for session activity (the global layer is not cut off), most
+    # recently active nodes read per layer, newest facts per node
+    RETRIEVAL_RECENT_LOOKBACK_DAYS = int(os.getenv("RETRIEVAL_RECENT_LOOKBACK_DAYS", 30))
+    RETRIEVAL_RECENT_NODES = int(os.getenv("RETRIEVAL_RECENT_NODES", 20))
+    RETRIEVAL_RECENT_PER_NODE = int(os.getenv("RETRIEVAL_RECENT_PER_NODE", 5))
+
+    # Memory-mapped CSR snapshot of the global layer shared by all workers;
+    # rebuilt within GLOBAL_SNAPSHOT_REFRESH seconds of a global write
+    GLOBAL_SNAPSHOT_ENABLED = os.getenv("GLOBAL_SNAPSHOT_ENABLED", "true").lower() == "true"
+    GLOBAL_SNAPSHOT_PATH = os.getenv("GLOBAL_SNAPSHOT_PATH", ".graph_snapshot/global.csr")
+    GLOBAL_SNAPSHOT_REFRESH = float(os.getenv("GLOBAL_SNAPSHOT_REFRESH", 2))
+
+    # In-process session overlay: /chat add_fact keeps session facts in this
+    # worker's memory (until promoted) instead of writing them to Neo4j
+    SESSION_OVERLAY_ENABLED = os.getenv("SESSION_OVERLAY_ENABLED", "false").lower() == "true"
+    SESSION_OVERLAY_MAX_SESSIONS = int(os.getenv("SESSION_OVERLAY_MAX_SESSIONS", 10000))
+    SESSION_OVERLAY_TTL = float(os.getenv("SESSION_OVERLAY_TTL", 3600))
+    SESSION_OVERLAY_MAX_EDGES = int(os.getenv("SESSION_OVERLAY_MAX_EDGES", 500))
+
+    # Session data expires SESSION_TTL_HOURS after its last write; expired
+    # sessions are deleted every SESSION_CLEANUP_INTERVAL seconds (0 = never,
+    # run cleanup_sessions.py instead) in transactions of SESSION_CLEANUP_BATCH rows
+    SESSION_TTL_HOURS = float(os.getenv("SESSION_TTL_HOURS", 24))
+    SESSION_CLEANUP_INTERVAL = float(os.getenv("SESSION_CLEANUP_INTERVAL", 3600))
+    SESSION_CLEANUP_BATCH = int(os.getenv("SESSION_CLEANUP_BATCH", 10000))
+
+    # Gemini call scheduler (see model_scheduler.py): concurrent calls and
+    # requests per minute per model (0 = no rate limit), retries with jittered
+    # exponential backoff on 429/503; MODEL_LIMITS overrides per model as JSON
+    MODEL_CONCURRENCY = int(os.getenv("MODEL_CONCURRENCY", 8))
+    MODEL_RATE_PER_MINUTE = float(os.getenv("MODEL_RATE_PER_MINUTE", 0))
+    MODEL_BURST = int(os.getenv("MODEL_BURST", 10))
+    MODEL_MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", 4))
+    MODEL_BACKOFF_BASE = float(os.getenv("MODEL_BACKOFF_BASE", 0.5))
+    MODEL_BACKOFF_MAX = float(os.getenv("MODEL_BACKOFF_MAX", 8))
+    MODEL_LIMITS = json.loads(os.getenv("MODEL_LIMITS") or "{}")
+
+    # Identical concurrent Gemini / Neo4j read calls share one upstream call
+    SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+    # Answer prompt context: mirrored paths dropped, triples grouped by
+    # subject, cut to about ANSWER_CONTEXT_TOKENS tokens (0 = no limit)
+    ANSWER_CONTEXT_COMPACT = os.getenv("ANSWER_CONTEXT_COMPACT", "true").lower() == "true"
+    ANSWER_CONTEXT_TOKENS = int(os.getenv("ANSWER_CONTEXT_TOKENS", 300))
+
+    # Answer direct one-hop results from templates instead of Gemini
+    ANSWER_TEMPLATES_ENABLED = os.getenv("ANSWER_TEMPLATES_ENABLED", "true").lower() == "true"
+
+    # Generated answer cache; ANSWER_CACHE_SIMILARITY > 0 also matches
+    # near-duplicate questions by embedding cosine similarity
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 1024))
+    ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 600))
+    ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0))
+
+    # Persistent embedding cache shared by all workers (EMBEDDING_CACHE_MAX_MB=0 disables)
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".embedding_cache/embeddings.f32")
+    EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", 256))
+    EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", 2048))
+
+    # POST /embed/batch
+    EMBED_BATCH_MAX_TEXTS = int(os.getenv("EMBED_BATCH_MAX_TEXTS", 5000))
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 100))
+    EMBED_BATCH_CONCURRENCY = int(os.getenv("EMBED_BATCH_CONCURRENCY", 4))
+
+    # Local vector search: comma-separated backends to load at startup
+    # ("exact", "hnsw"); /search?backend= picks one per request
+    LOCAL_VECTOR_INDEX = os.getenv("LOCAL_VECTOR_INDEX", "")
+    LOCAL_VECTOR_INDEX_REFRESH = float(os.getenv("LOCAL_VECTOR_INDEX_REFRESH", 30))
+    HNSW_M = int(os.getenv("HNSW_M", 16))
+    HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", 100))
+    HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", 64))
+
+    # Local keyword/pronoun stage in front of Gemini (the "Layer 1 speed gate")
+    LOCAL_KEYWORDS_ENABLED = os.getenv("LOCAL_KEYWORDS_ENABLED", "true").lower() == "true"
+    LOCAL_KEYWORDS_FUZZY_CUTOFF = float(os.getenv("LOCAL_KEYWORDS_FUZZY_CUTOFF", 0.85))
+    LOCAL_KEYWORDS_REFRESH = float(os.getenv("LOCAL_KEYWORDS_REFRESH", 300))
+
+    # Bulk document import
+    IMPORT_CHUNK_CHARS = int(os.getenv("IMPORT_CHUNK_CHARS", 1200))
+    IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", 4))
+    IMPORT_BATCH_CHUNKS = int(os.getenv("IMPORT_BATCH_CHUNKS", 8))
+    IMPORT_CHECKPOINT_DIR = os.getenv("IMPORT_CHECKPOINT_DIR", ".import_checkpoints")
+
     VITE_API_SECRET = os.getenv("VITE_API_SECRET", "default-dev-secret")
 
     @classmethod
     def validate(cls):
         """Validate required configuration"""
-        if not cls.GEMINI_API_KEY:
+        if cls.MODEL_BACKEND == "gemini" and cls.CASSETTE_MODE != "replay" and not cls.GEMINI_API_KEY:
             raise ValueError("GEMINI_API_KEY environment variable is required")
         if not cls.NEO4J_PASSWORD:
             raise ValueError("NEO4J_PASSWORD environment variable is required")
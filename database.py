@@ -1,5 +1,12 @@
-from neo4j import GraphDatabase
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from neo4j import AsyncGraphDatabase, GraphDatabase
+from cache import retrieval_cache
 from config import config
+from embeddings import entity_dictionary
+from global_snapshot import global_snapshot
+from single_flight import SingleFlight
 
 
 class Neo4jDatabase:
@@ -65,73 +72,47 @@ class Neo4jDatabase:
         result = tx.run(query, query_vector=query_vector, top_k=top_k)
         return list(result)
 
-    def create_graph_from_json(self, graph_data: dict, session_id: str = None) -> dict:
-        """Create nodes and relationships from structured JSON data without duplicates"""
+    def create_graph_from_json(self, graph_data: dict, session_id: str = None, bulk: bool = None) -> dict:
+        """Create nodes and relationships from structured JSON data without duplicates.
+
+        bulk selects the UNWIND ingestion mode (defaults to config.GRAPH_BULK_INGEST).
+        """
+        if bulk is None:
+            bulk = config.GRAPH_BULK_INGEST
+        transaction = self._create_graph_bulk_transaction if bulk else self._create_graph_transaction
         with self.driver.session(database=config.NEO4J_DATABASE) as session:
-            return session.execute_write(self._create_graph_transaction, graph_data, session_id)
+            result = session.execute_write(transaction, graph_data, session_id)
+        retrieval_cache.invalidate_for_write(session_id, result["touched_global"])
+        entity_dictionary.add_graph(graph_data, session_id)
+        # The snapshot holds global nodes and the edges between them only; a
+        # session fact hanging off a global node does not change it
+        if session_id == "global" or result["touched_global_edges"]:
+            global_snapshot.mark_stale()
+        return result
 
     @staticmethod
     def _create_graph_transaction(tx, graph_data: dict, session_id: str = None):
         """Transaction function to create nodes and edges using MERGE to avoid duplicates"""
         created_nodes = []
         created_edges = []
+        touched_global = False
+        touched_global_edges = False
+        global_ids = set()
         
         # Default to 'global' if no session provided
         session_id = session_id or "global"
 
         # --- 1. CREATE NODES ---
         for node in graph_data.get("nodes", []):
-            node_id = node.get("id")  # Already lowercase from extract_graph_structure
-            label = node.get("label", "Entity")
-            properties = node.get("properties", {})
-            name = properties.get("name", node_id)
-            
-            # CRITICAL FIX: Normalize ID to lowercase for case-insensitive matching
-            # This ensures "Zayeem", "zayeem", "ZAYEEM" all map to the same node
-            normalized_id = node_id.lower() if node_id else name.lower()
-
-            # MERGE on normalized_id (guaranteed lowercase) instead of name
-            params = {
-                "normalized_id": normalized_id,
-                "name": name,  # Display name (Title Case)
-                "session_id": session_id
-            }
-            
-            # Build dynamic property setting
-            set_clauses = []
-            for key, value in properties.items():
-                if key not in ["name"]:
-                    param_key = f"prop_{key}"
-                    set_clauses.append(f"n.{key} = ${param_key}")
-                    params[param_key] = value
-            
-            set_clause_str = ", ".join(set_clauses)
-            if set_clause_str:
-                set_clause_str = ", " + set_clause_str
-
-            merge_query = f"""
-            MERGE (n:{label} {{normalized_id: $normalized_id}})
-            ON CREATE SET 
-                n.name = $name,
-                n.session_id = $session_id,
-                n.created_at = datetime(),
-                n.updated_at = datetime()
-                {set_clause_str}
-            ON MATCH SET 
-                n.name = $name,
-                n.session_id = CASE
-                    WHEN n.session_id = 'global' THEN 'global'
-                    ELSE $session_id
-                END,
-                n.updated_at = datetime()
-            RETURN elementId(n) as element_id, n.name as name
-            """
-
+            merge_query, params = Neo4jDatabase._node_merge_statement(node, session_id)
             result = tx.run(merge_query, **params)
             record = result.single()
+            touched_global = touched_global or record["session_id"] == "global"
+            if record["session_id"] == "global":
+                global_ids.add(node.get("id"))
             created_nodes.append(
                 {
-                    "id": node_id,
+                    "id": node.get("id"),
                     "element_id": record["element_id"],
                     "name": record["name"],
                 }
@@ -141,84 +122,336 @@ class Neo4jDatabase:
 
         # --- 2. CREATE RELATIONSHIPS ---
         for edge in graph_data.get("edges", []):
+            statement = Neo4jDatabase._edge_merge_statement(edge, node_map, session_id)
+            if statement is None:
+                continue
+
+            merge_rel_query, rel_params = statement
+            result = tx.run(merge_rel_query, **rel_params)
+            record = result.single()
+            touched_global_edges = touched_global_edges or (
+                edge.get("from") in global_ids and edge.get("to") in global_ids
+            )
+            created_edges.append(
+                {
+                    "from": edge.get("from"),
+                    "to": edge.get("to"),
+                    "type": edge.get("type", "RELATED_TO"),
+                    "element_id": record["element_id"],
+                }
+            )
+
+        return {
+            "nodes_created": len(created_nodes),
+            "edges_created": len(created_edges),
+            "nodes": created_nodes,
+            "edges": created_edges,
+            # True when any node written is part of the global layer
+            "touched_global": touched_global,
+            # True when an edge written joins two global nodes
+            "touched_global_edges": touched_global_edges,
+        }
+
+    @staticmethod
+    def _create_graph_bulk_transaction(tx, graph_data: dict, session_id: str = None):
+        """Transaction function that writes each label / relationship type group
+        with a single UNWIND statement. Returns the same shape as
+        _create_graph_transaction."""
+        session_id = session_id or "global"
+        expires_at = Neo4jDatabase._session_expiry(session_id)
+
+        node_records = []
+        for query, rows in Neo4jDatabase._bulk_node_statements(graph_data, session_id):
+            node_records.extend(tx.run(query, rows=rows, session_id=session_id, expires_at=expires_at).data())
+        created_nodes = Neo4jDatabase._collect_bulk_nodes(graph_data, node_records)
+
+        node_map = {n["id"]: n["element_id"] for n in created_nodes}
+
+        edge_records = []
+        for query, rows in Neo4jDatabase._bulk_edge_statements(graph_data, node_map):
+            edge_records.extend(tx.run(query, rows=rows, session_id=session_id, expires_at=expires_at).data())
+
+        return Neo4jDatabase._bulk_result(graph_data, node_records, created_nodes, edge_records)
+
+    @staticmethod
+    def _bulk_node_statements(graph_data: dict, session_id: str) -> list:
+        """Group nodes by label into (UNWIND query, rows) pairs.
+
+        Each row carries its position in graph_data["nodes"] as idx so results
+        can be put back in input order.
+        """
+        groups = {}
+        for idx, node in enumerate(graph_data.get("nodes", [])):
+            node_id = node.get("id")
+            properties = node.get("properties", {})
+            name = properties.get("name", node_id)
+            groups.setdefault(node.get("label", "Entity"), []).append(
+                {
+                    "idx": idx,
+                    "normalized_id": node_id.lower() if node_id else name.lower(),
+                    "name": name,
+                    "properties": {k: v for k, v in properties.items() if k != "name"},
+                }
+            )
+
+        statements = []
+        for label, rows in groups.items():
+            query = f"""
+            UNWIND $rows AS row
+            MERGE (n:{label} {{normalized_id: row.normalized_id}})
+            ON CREATE SET 
+                n.name = row.name,
+                n.session_id = $session_id,
+                n.created_at = datetime(),
+                n.updated_at = datetime(),
+                n.expires_at = $expires_at,
+                n += row.properties
+            ON MATCH SET 
+                n.name = row.name,
+                n.session_id = CASE
+                    WHEN n.session_id = 'global' THEN 'global'
+                    ELSE $session_id
+                END,
+                n.updated_at = datetime(),
+                n.expires_at = CASE WHEN n.session_id = 'global' THEN null ELSE $expires_at END
+            SET n:Entity
+            RETURN row.idx as idx, elementId(n) as element_id, n.name as name,
+                   n.session_id as session_id
+            """
+            statements.append((query, rows))
+        return statements
+
+    @staticmethod
+    def _bulk_edge_statements(graph_data: dict, node_map: dict) -> list:
+        """Group edges by relationship type into (UNWIND query, rows) pairs"""
+        groups = {}
+        for idx, edge in enumerate(graph_data.get("edges", [])):
             from_id = edge.get("from")
             to_id = edge.get("to")
-            rel_type = edge.get("type", "RELATED_TO")
-            properties = edge.get("properties", {})
-
             if from_id not in node_map or to_id not in node_map:
-                continue 
-
-            from_element_id = node_map[from_id]
-            to_element_id = node_map[to_id]
+                continue
+            groups.setdefault(edge.get("type", "RELATED_TO"), []).append(
+                {
+                    "idx": idx,
+                    "from_element_id": node_map[from_id],
+                    "to_element_id": node_map[to_id],
+                    "properties": edge.get("properties") or {},
+                }
+            )
 
-            # We also tag the RELATIONSHIP with the session_id
-            merge_rel_query = f"""
-            MATCH (from) WHERE elementId(from) = $from_element_id
-            MATCH (to) WHERE elementId(to) = $to_element_id
+        statements = []
+        for rel_type, rows in groups.items():
+            query = f"""
+            UNWIND $rows AS row
+            MATCH (from) WHERE elementId(from) = row.from_element_id
+            MATCH (to) WHERE elementId(to) = row.to_element_id
             MERGE (from)-[r:{rel_type}]->(to)
             ON CREATE SET 
                 r.session_id = $session_id,
-                r.created_at = datetime()
+                r.created_at = datetime(),
+                r.expires_at = $expires_at,
+                r += row.properties,
+                from.degree = coalesce(from.degree, 0) + 1,
+                to.degree = coalesce(to.degree, 0) + 1,
+                from.last_fact_at = CASE WHEN from.session_id = $session_id THEN datetime() ELSE from.last_fact_at END,
+                to.last_fact_at = CASE WHEN to.session_id = $session_id THEN datetime() ELSE to.last_fact_at END
             ON MATCH SET
                 r.session_id = CASE
                     WHEN r.session_id = 'global' THEN 'global'
                     ELSE $session_id
-                END
-            RETURN elementId(r) as element_id
+                END,
+                r.expires_at = CASE WHEN r.session_id = 'global' THEN null ELSE $expires_at END
+            RETURN row.idx as idx, elementId(r) as element_id
             """
+            statements.append((query, rows))
+        return statements
 
-            rel_params = {
-                "from_element_id": from_element_id,
-                "to_element_id": to_element_id,
-                "session_id": session_id
+    @staticmethod
+    def _collect_bulk_nodes(graph_data: dict, records: list) -> list:
+        """Turn UNWIND node records back into created_nodes, in input order"""
+        nodes = graph_data.get("nodes", [])
+        return [
+            {
+                "id": nodes[record["idx"]].get("id"),
+                "element_id": record["element_id"],
+                "name": record["name"],
             }
+            for record in sorted(records, key=lambda r: r["idx"])
+        ]
 
-            # Add edge properties
-            if properties:
-                prop_sets = []
-                for key, value in properties.items():
-                    param_key = f"rel_prop_{key}"
-                    prop_sets.append(f"r.{key} = ${param_key}")
-                    rel_params[param_key] = value
-                
-                if prop_sets:
-                    merge_rel_query = merge_rel_query.replace(
-                        "r.created_at = datetime()",
-                        "r.created_at = datetime(), " + ", ".join(prop_sets)
-                    )
-
-            result = tx.run(merge_rel_query, **rel_params)
-            record = result.single()
+    @staticmethod
+    def _bulk_result(graph_data: dict, node_records: list, created_nodes: list, edge_records: list) -> dict:
+        """Assemble the create_graph_from_json result from UNWIND edge records"""
+        edges = graph_data.get("edges", [])
+        created_edges = []
+        for record in sorted(edge_records, key=lambda r: r["idx"]):
+            edge = edges[record["idx"]]
             created_edges.append(
                 {
-                    "from": from_id,
-                    "to": to_id,
-                    "type": rel_type,
+                    "from": edge.get("from"),
+                    "to": edge.get("to"),
+                    "type": edge.get("type", "RELATED_TO"),
                     "element_id": record["element_id"],
                 }
             )
 
+        nodes = graph_data.get("nodes", [])
+        global_ids = {nodes[r["idx"]].get("id") for r in node_records if r["session_id"] == "global"}
         return {
             "nodes_created": len(created_nodes),
             "edges_created": len(created_edges),
             "nodes": created_nodes,
             "edges": created_edges,
+            # True when any node written is part of the global layer
+            "touched_global": bool(global_ids),
+            # True when an edge written joins two global nodes
+            "touched_global_edges": any(
+                edge["from"] in global_ids and edge["to"] in global_ids for edge in created_edges
+            ),
         }
 
+    @staticmethod
+    def _session_expiry(session_id: str):
+        """When session data written now may be removed by session_cleanup
+        (None for the global layer, which never expires). Every write pushes
+        it back by SESSION_TTL_HOURS."""
+        if session_id == "global":
+            return None
+        return datetime.now(timezone.utc) + timedelta(hours=config.SESSION_TTL_HOURS)
+
+    @staticmethod
+    def _node_merge_statement(node: dict, session_id: str) -> tuple:
+        """Build the MERGE query and parameters for a single extracted node"""
+        node_id = node.get("id")  # Already lowercase from extract_graph_structure
+        label = node.get("label", "Entity")
+        properties = node.get("properties", {})
+        name = properties.get("name", node_id)
+        
+        # CRITICAL FIX: Normalize ID to lowercase for case-insensitive matching
+        # This ensures "Zayeem", "zayeem", "ZAYEEM" all map to the same node
+        normalized_id = node_id.lower() if node_id else name.lower()
+
+        # MERGE on normalized_id (guaranteed lowercase) instead of name.
+        # Every node also gets the shared :Entity label, which the retrieval
+        # indexes (see init_global_nodes.create_indexes) are defined on.
+        params = {
+            "normalized_id": normalized_id,
+            "name": name,  # Display name (Title Case)
+            "session_id": session_id,
+            "expires_at": Neo4jDatabase._session_expiry(session_id),
+        }
+        
+        # Build dynamic property setting
+        set_clauses = []
+        for key, value in properties.items():
+            if key not in ["name"]:
+                param_key = f"prop_{key}"
+                set_clauses.append(f"n.{key} = ${param_key}")
+                params[param_key] = value
+        
+        set_clause_str = ", ".join(set_clauses)
+        if set_clause_str:
+            set_clause_str = ", " + set_clause_str
+
+        merge_query = f"""
+        MERGE (n:{label} {{normalized_id: $normalized_id}})
+        ON CREATE SET 
+            n.name = $name,
+            n.session_id = $session_id,
+            n.created_at = datetime(),
+            n.updated_at = datetime(),
+            n.expires_at = $expires_at
+            {set_clause_str}
+        ON MATCH SET 
+            n.name = $name,
+            n.session_id = CASE
+                WHEN n.session_id = 'global' THEN 'global'
+                ELSE $session_id
+            END,
+            n.updated_at = datetime(),
+            n.expires_at = CASE WHEN n.session_id = 'global' THEN null ELSE $expires_at END
+        SET n:Entity
+        RETURN elementId(n) as element_id, n.name as name, n.session_id as session_id
+        """
+        return merge_query, params
+
+    @staticmethod
+    def _edge_merge_statement(edge: dict, node_map: dict, session_id: str):
+        """Build the MERGE query and parameters for a single extracted edge.
+
+        Returns None when either endpoint was not created in this transaction.
+        """
+        from_id = edge.get("from")
+        to_id = edge.get("to")
+        rel_type = edge.get("type", "RELATED_TO")
+        properties = edge.get("properties", {})
+
+        if from_id not in node_map or to_id not in node_map:
+            return None
+
+        # We also tag the RELATIONSHIP with the session_id, keep both
+        # endpoints' degree current for supernode-aware retrieval, and stamp
+        # last_fact_at on endpoints owned by this session for the recent feed
+        merge_rel_query = f"""
+        MATCH (from) WHERE elementId(from) = $from_element_id
+        MATCH (to) WHERE elementId(to) = $to_element_id
+        MERGE (from)-[r:{rel_type}]->(to)
+        ON CREATE SET 
+            r.session_id = $session_id,
+            r.created_at = datetime(),
+            r.expires_at = $expires_at,
+            from.degree = coalesce(from.degree, 0) + 1,
+            to.degree = coalesce(to.degree, 0) + 1,
+            from.last_fact_at = CASE WHEN from.session_id = $session_id THEN datetime() ELSE from.last_fact_at END,
+            to.last_fact_at = CASE WHEN to.session_id = $session_id THEN datetime() ELSE to.last_fact_at END
+        ON MATCH SET
+            r.session_id = CASE
+                WHEN r.session_id = 'global' THEN 'global'
+                ELSE $session_id
+            END,
+            r.expires_at = CASE WHEN r.session_id = 'global' THEN null ELSE $expires_at END
+        RETURN elementId(r) as element_id
+        """
+
+        rel_params = {
+            "from_element_id": node_map[from_id],
+            "to_element_id": node_map[to_id],
+            "session_id": session_id,
+            "expires_at": Neo4jDatabase._session_expiry(session_id),
+        }
+
+        # Add edge properties
+        if properties:
+            prop_sets = []
+            for key, value in properties.items():
+                param_key = f"rel_prop_{key}"
+                prop_sets.append(f"r.{key} = ${param_key}")
+                rel_params[param_key] = value
+            
+            if prop_sets:
+                merge_rel_query = merge_rel_query.replace(
+                    "r.created_at = datetime(),",
+                    "r.created_at = datetime(), " + ", ".join(prop_sets) + ","
+                )
+
+        return merge_rel_query, rel_params
+
     def execute_cypher(self, query: str, params: dict = None) -> list:
         """Execute a raw Cypher query with safe session_id handling"""
-        import uuid
-        
+        safe_params = self._safe_params(params)
+        with self.driver.session(database=config.NEO4J_DATABASE) as session:
+            result = session.run(query, safe_params)
+            return [record.data() for record in result]
+
+    @staticmethod
+    def _safe_params(params: dict = None) -> dict:
+        """Replace a missing session_id with one that can never match a real session"""
         # CRITICAL FIX: Ensure session_id is never None or a dangerous default
         safe_params = params or {}
         if 'session_id' in safe_params and (safe_params['session_id'] is None or safe_params['session_id'] == 'none'):
             # Use a UUID that will never match a real session
             safe_params['session_id'] = f'_nonexistent_{uuid.uuid4()}'
-        
-        with self.driver.session(database=config.NEO4J_DATABASE) as session:
-            result = session.run(query, safe_params)
-            return [record.data() for record in result]
+        return safe_params
 
     def get_schema(self) -> str:
         """Fetch the current graph schema"""
@@ -235,4 +468,239 @@ class Neo4jDatabase:
             - Relationship Types: {', '.join(rels)}
             """
 
-db = Neo4jDatabase()
\ No newline at end of file
+
+class AsyncNeo4jDatabase:
+    """Async Neo4j connection manager used by the API routes.
+
+    Mirrors Neo4jDatabase on top of AsyncGraphDatabase so request handlers
+    await the database instead of blocking the event loop. Query text is
+    shared with the sync class.
+    """
+
+    def __init__(self):
+        self.driver = None
+        self.read_flight = SingleFlight("neo4j")
+
+    async def connect(self):
+        """Initialize async Neo4j driver"""
+        self.driver = AsyncGraphDatabase.driver(
+            config.NEO4J_URI, auth=(config.NEO4J_USERNAME, config.NEO4J_PASSWORD)
+        )
+        # Verify connectivity
+        await self.driver.verify_connectivity()
+
+    async def close(self):
+        """Close async Neo4j driver"""
+        if self.driver:
+            await self.driver.close()
+
+    async def online_indexes(self) -> set:
+        """Names of the indexes that are ONLINE"""
+        rows = await self.execute_cypher("SHOW INDEXES YIELD name, state WHERE state = 'ONLINE' RETURN name")
+        return {row["name"] for row in rows}
+
+    async def create_embedding_node(self, text: str, embedding: list) -> dict:
+        """Create a node with text and embedding in Neo4j"""
+        async with self.driver.session(database=config.NEO4J_DATABASE) as session:
+            return await session.execute_write(self._create_node_transaction, text, embedding)
+
+    @staticmethod
+    async def _create_node_transaction(tx, text: str, embedding: list):
+        """Transaction function to create embedding node"""
+        query = """
+        CREATE (e:Embedding {text: $text, embedding: $embedding, created_at: datetime()})
+        RETURN id(e) as id
+        """
+        result = await tx.run(query, text=text, embedding=embedding)
+        return await result.single()
+
+    async def create_embedding_nodes(self, texts: list, embeddings: list) -> list:
+        """Create one Embedding node per (text, embedding) pair with a single UNWIND.
+
+        Returns the new node ids in input order.
+        """
+        rows = [
+            {"idx": i, "text": text, "embedding": embedding}
+            for i, (text, embedding) in enumerate(zip(texts, embeddings))
+        ]
+        async with self.driver.session(database=config.NEO4J_DATABASE) as session:
+            records = await session.execute_write(self._create_nodes_transaction, rows)
+        return [record["id"] for record in sorted(records, key=lambda r: r["idx"])]
+
+    @staticmethod
+    async def _create_nodes_transaction(tx, rows: list):
+        """Transaction function to create embedding nodes in bulk"""
+        query = """
+        UNWIND $rows AS row
+        CREATE (e:Embedding {text: row.text, embedding: row.embedding, created_at: datetime()})
+        RETURN row.idx as idx, id(e) as id
+        """
+        result = await tx.run(query, rows=rows)
+        return await result.data()
+
+    async def get_all_embeddings(self) -> list:
+        """Get all stored embeddings"""
+        async with self.driver.session(database=config.NEO4J_DATABASE) as session:
+            result = await session.run(
+                """
+                MATCH (e:Embedding)
+                RETURN id(e) as id, e.text as text, e.created_at as created_at
+                ORDER BY e.created_at DESC
+            """
+            )
+            return [record async for record in result]
+
+    async def get_embedding_vectors(self, since=None) -> list:
+        """Get stored embeddings with their vectors, optionally only those created after since"""
+        async with self.driver.session(database=config.NEO4J_DATABASE) as session:
+            result = await session.run(
+                """
+                MATCH (e:Embedding)
+                WHERE $since IS NULL OR e.created_at > $since
+                RETURN id(e) as id, e.text as text, e.created_at as created_at,
+                       e.embedding as embedding
+            """,
+                since=since,
+            )
+            return [record.data() async for record in result]
+
+    async def search_embeddings(self, query_vector: list, top_k: int = 5) -> list:
+        """Search for top_k similar embeddings using a query vector"""
+        async with self.driver.session(database=config.NEO4J_DATABASE) as session:
+            return await session.execute_read(self._search_transaction, query_vector, top_k)
+
+    @staticmethod
+    async def _search_transaction(tx, query_vector: list, top_k: int):
+        """Transaction function to search for embeddings"""
+        query = """
+            CALL db.index.vector.queryNodes('embedding-index', $top_k, $query_vector)
+            YIELD node, score
+            RETURN node.text AS text, node.created_at AS created_at, score, id(node) AS id
+        """
+        result = await tx.run(query, query_vector=query_vector, top_k=top_k)
+        return [record async for record in result]
+
+    async def create_graph_from_json(self, graph_data: dict, session_id: str = None, bulk: bool = None) -> dict:
+        """Create nodes and relationships from structured JSON data without duplicates"""
+        if bulk is None:
+            bulk = config.GRAPH_BULK_INGEST
+        transaction = self._create_graph_bulk_transaction if bulk else self._create_graph_transaction
+        async with self.driver.session(database=config.NEO4J_DATABASE) as session:
+            result = await session.execute_write(transaction, graph_data, session_id)
+        retrieval_cache.invalidate_for_write(session_id, result["touched_global"])
+        entity_dictionary.add_graph(graph_data, session_id)
+        # The snapshot holds global nodes and the edges between them only; a
+        # session fact hanging off a global node does not change it
+        if session_id == "global" or result["touched_global_edges"]:
+            global_snapshot.mark_stale()
+        return result
+
+    @staticmethod
+    async def _create_graph_transaction(tx, graph_data: dict, session_id: str = None):
+        """Async counterpart of Neo4jDatabase._create_graph_transaction"""
+        created_nodes = []
+        created_edges = []
+        touched_global = False
+        touched_global_edges = False
+        global_ids = set()
+        session_id = session_id or "global"
+
+        for node in graph_data.get("nodes", []):
+            merge_query, params = Neo4jDatabase._node_merge_statement(node, session_id)
+            result = await tx.run(merge_query, **params)
+            record = await result.single()
+            touched_global = touched_global or record["session_id"] == "global"
+            if record["session_id"] == "global":
+                global_ids.add(node.get("id"))
+            created_nodes.append(
+                {
+                    "id": node.get("id"),
+                    "element_id": record["element_id"],
+                    "name": record["name"],
+                }
+            )
+
+        node_map = {n["id"]: n["element_id"] for n in created_nodes}
+
+        for edge in graph_data.get("edges", []):
+            statement = Neo4jDatabase._edge_merge_statement(edge, node_map, session_id)
+            if statement is None:
+                continue
+
+            merge_rel_query, rel_params = statement
+            result = await tx.run(merge_rel_query, **rel_params)
+            record = await result.single()
+            touched_global_edges = touched_global_edges or (
+                edge.get("from") in global_ids and edge.get("to") in global_ids
+            )
+            created_edges.append(
+                {
+                    "from": edge.get("from"),
+                    "to": edge.get("to"),
+                    "type": edge.get("type", "RELATED_TO"),
+                    "element_id": record["element_id"],
+                }
+            )
+
+        return {
+            "nodes_created": len(created_nodes),
+            "edges_created": len(created_edges),
+            "nodes": created_nodes,
+            "edges": created_edges,
+            # True when any node written is part of the global layer
+            "touched_global": touched_global,
+            # True when an edge written joins two global nodes
+            "touched_global_edges": touched_global_edges,
+        }
+
+    @staticmethod
+    async def _create_graph_bulk_transaction(tx, graph_data: dict, session_id: str = None):
+        """Async counterpart of Neo4jDatabase._create_graph_bulk_transaction"""
+        session_id = session_id or "global"
+        expires_at = Neo4jDatabase._session_expiry(session_id)
+
+        node_records = []
+        for query, rows in Neo4jDatabase._bulk_node_statements(graph_data, session_id):
+            result = await tx.run(query, rows=rows, session_id=session_id, expires_at=expires_at)
+            node_records.extend(await result.data())
+        created_nodes = Neo4jDatabase._collect_bulk_nodes(graph_data, node_records)
+
+        node_map = {n["id"]: n["element_id"] for n in created_nodes}
+
+        edge_records = []
+        for query, rows in Neo4jDatabase._bulk_edge_statements(graph_data, node_map):
+            result = await tx.run(query, rows=rows, session_id=session_id, expires_at=expires_at)
+            edge_records.extend(await result.data())
+
+        return Neo4jDatabase._bulk_result(graph_data, node_records, created_nodes, edge_records)
+
+    async def execute_cypher(self, query: str, params: dict = None) -> list:
+        """Execute a raw Cypher query with safe session_id handling"""
+        safe_params = Neo4jDatabase._safe_params(params)
+        async with self.driver.session(database=config.NEO4J_DATABASE) as session:
+            result = await session.run(query, safe_params)
+            return [record.data() async for record in result]
+
+    async def read_cypher(self, query: str, params: dict = None, generation: tuple = None) -> list:
+        """execute_cypher for read-only queries, joining an identical query
+        already in flight for the same session visibility scope.
+
+        generation is the retrieval_cache.stamp() the caller will store its
+        result under; reads only join a flight started under the same stamp,
+        so a read begun before a write cannot be cached as current after it.
+        """
+        params = dict(params or {})
+        # None and 'none' see the same (global-only) data; key them together
+        # before _safe_params gives each call its own random session_id
+        scope = params.get("session_id")
+        scope = None if scope in (None, "none") else scope
+        key = SingleFlight.make_key(
+            query, scope, generation, {k: v for k, v in params.items() if k != "session_id"}
+        )
+        rows = await self.read_flight.run(key, lambda: self.execute_cypher(query, params))
+        # Callers may edit their rows; the shared result stays intact
+        return [dict(row) for row in rows]
+
+
+db = Neo4jDatabase()
+async_db = AsyncNeo4jDatabase()
\ No newline at end of file
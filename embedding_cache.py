@@ -0,0 +1,326 @@
+"""
+Content-addressed embedding cache shared by every uvicorn worker.
+
+Vectors live in a memory-mapped float32 file laid out as a set-associative
+table: a key hashes to a bucket of WAYS consecutive slots, and when the
+bucket is full the least recently used slot in it is overwritten. The file
+size (and therefore the eviction point) is fixed by EMBEDDING_CACHE_MAX_MB.
+Each worker keeps a small in-memory LRU in front of the file. The file is
+guarded by flock across workers, so async callers use get_async/put_async,
+which run the disk side in a worker thread instead of on the event loop.
+get_many_async/put_many_async do the same for a batch of texts, taking the
+file lock once for the whole batch.
+
+File layout:
+    header  MAGIC | version u32 | dim u32 | capacity u32 | clock u64
+    slot    key digest (16 bytes, all zero = empty) | last_used u64 | float32[dim]
+"""
+
+import asyncio
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+from config import config
+
+MAGIC = b"AIMEMEMB"
+VERSION = 1
+HEADER = struct.Struct("<8sIIIxxxxQ")
+SLOT_META = struct.Struct("<16sQ")
+EMPTY_KEY = bytes(16)
+WAYS = 8
+
+
+class EmbeddingCache:
+    """In-memory LRU backed by a shared, persistent memory-mapped store"""
+
+    def __init__(self, path: str = None, max_bytes: int = None, memory_entries: int = None):
+        self.path = path or config.EMBEDDING_CACHE_PATH
+        self.max_bytes = max_bytes if max_bytes is not None else int(config.EMBEDDING_CACHE_MAX_MB * 1024 * 1024)
+        self.memory_entries = memory_entries if memory_entries is not None else config.EMBEDDING_CACHE_MEMORY_ENTRIES
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # Held while waiting on flock; kept apart from _lock so memory hits
+        # never queue behind another worker's disk access
+        self._file_mutex = threading.Lock()
+        self._file = None
+        self._lock_file = None
+        self._map = None
+        self.dim = None
+        self.capacity = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(model: str, text: str) -> bytes:
+        digest = hashlib.blake2b(f"{model}\0{text}".encode("utf-8"), digest_size=16).digest()
+        # Reserve the all-zero digest for empty slots
+        return digest if digest != EMPTY_KEY else b"\x01" + digest[1:]
+
+    def get(self, model: str, text: str):
+        """Return the cached vector as a list of floats, or None"""
+        if not self.enabled:
+            return None
+        key = self.make_key(model, text)
+        vector = self._memory_get(key)
+        return vector if vector is not None else self._disk_lookup(key)
+
+    async def get_async(self, model: str, text: str):
+        """get() with the disk lookup run off the event loop"""
+        if not self.enabled:
+            return None
+        key = self.make_key(model, text)
+        vector = self._memory_get(key)
+        return vector if vector is not None else await asyncio.to_thread(self._disk_lookup, key)
+
+    async def get_many_async(self, model: str, texts: list) -> list:
+        """get_async() for many texts: memory is checked under one lock and
+        the misses are read from disk in one worker thread. Returns a list
+        aligned with texts holding the vector or None."""
+        if not self.enabled:
+            return [None] * len(texts)
+        keys = [self.make_key(model, text) for text in texts]
+        with self._lock:
+            vectors = [self._memory_lookup(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            found = await asyncio.to_thread(self._disk_lookup_many, [keys[i] for i in missing])
+            for i, vector in zip(missing, found):
+                vectors[i] = vector
+        return vectors
+
+    def put(self, model: str, text: str, vector: list):
+        if not self.enabled:
+            return
+        key, packed = self._remember_packed(model, text, vector)
+        self._disk_put(key, packed)
+
+    async def put_async(self, model: str, text: str, vector: list):
+        """put() with the disk write run off the event loop"""
+        if not self.enabled:
+            return
+        key, packed = self._remember_packed(model, text, vector)
+        await asyncio.to_thread(self._disk_put, key, packed)
+
+    async def put_many_async(self, model: str, texts: list, vectors: list):
+        """put_async() for many texts, written under one file lock"""
+        if not self.enabled:
+            return
+        items = [self._remember_packed(model, text, vector) for text, vector in zip(texts, vectors)]
+        await asyncio.to_thread(self._disk_put_many, items)
+
+    def _memory_get(self, key: bytes):
+        with self._lock:
+            return self._memory_lookup(key)
+
+    def _memory_lookup(self, key: bytes):
+        """Must be called with _lock held"""
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+        return vector
+
+    def _disk_lookup(self, key: bytes):
+        return self._disk_lookup_many([key])[0]
+
+    def _disk_lookup_many(self, keys: list) -> list:
+        vectors = self._disk_get_many(keys)
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self.disk_hits += 1
+                    self._remember(key, vector)
+        return vectors
+
+    def _remember_packed(self, model: str, text: str, vector: list) -> tuple:
+        """Keep the float32-rounded vector in memory; returns (key, packed)"""
+        key = self.make_key(model, text)
+        packed = array("f", vector)
+        with self._lock:
+            self._remember(key, packed.tolist())
+        return key, packed
+
+    def _remember(self, key: bytes, vector: list):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    # --- memory-mapped store -------------------------------------------------
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialize access across threads (_file_mutex) and worker processes (flock)"""
+        with self._file_mutex:
+            if self._lock_file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._lock_file = open(self.path + ".lock", "a+b")
+            if fcntl is not None:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _slot_size(self) -> int:
+        return SLOT_META.size + 4 * self.dim
+
+    def _open(self, dim: int = None) -> bool:
+        """Map the store, creating it once the vector dimension is known.
+
+        Must be called with _file_lock held.
+        """
+        if self._map is not None:
+            return True
+
+        header = b""
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                header = f.read(HEADER.size)
+        if len(header) == HEADER.size:
+            magic, version, stored_dim, capacity, _ = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION or (dim is not None and stored_dim != dim):
+                # Different layout or embedding model: start a fresh store
+                header = b""
+
+        if len(header) != HEADER.size:
+            if dim is None:
+                return False
+            stored_dim = dim
+            capacity = (self.max_bytes - HEADER.size) // (SLOT_META.size + 4 * dim)
+            if capacity < WAYS:
+                return False
+            # Build the new store aside and swap it in, so workers still
+            # mapping an old file never see it shrink underneath them
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION, stored_dim, capacity, 0))
+                f.truncate(HEADER.size + capacity * (SLOT_META.size + 4 * dim))
+            os.replace(tmp_path, self.path)
+
+        self._file = open(self.path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self.dim = stored_dim
+        self.capacity = capacity
+        return True
+
+    def _tick(self) -> int:
+        magic, version, dim, capacity, clock = HEADER.unpack_from(self._map, 0)
+        clock += 1
+        HEADER.pack_into(self._map, 0, magic, version, dim, capacity, clock)
+        return clock
+
+    def _bucket(self, key: bytes) -> list:
+        start = int.from_bytes(key[:8], "little") % self.capacity
+        return [(start + i) % self.capacity for i in range(WAYS)]
+
+    def _disk_get_many(self, keys: list) -> list:
+        vectors = [None] * len(keys)
+        try:
+            with self._file_lock():
+                if not self._open():
+                    return vectors
+                for i, key in enumerate(keys):
+                    vectors[i] = self._read_slot(key)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Embedding cache read error: {e}")
+        return vectors
+
+    def _read_slot(self, key: bytes):
+        """Must be called with _file_lock held and the store open"""
+        slot_size = self._slot_size()
+        for slot in self._bucket(key):
+            offset = HEADER.size + slot * slot_size
+            slot_key, _ = SLOT_META.unpack_from(self._map, offset)
+            if slot_key == key:
+                SLOT_META.pack_into(self._map, offset, key, self._tick())
+                start = offset + SLOT_META.size
+                vector = array("f")
+                vector.frombytes(self._map[start:start + 4 * self.dim])
+                return vector.tolist()
+        return None
+
+    def _disk_put(self, key: bytes, packed: array):
+        self._disk_put_many([(key, packed)])
+
+    def _disk_put_many(self, items: list):
+        """items: (key, packed) pairs"""
+        if not items:
+            return
+        try:
+            with self._file_lock():
+                if not self._open(len(items[0][1])):
+                    return
+                for key, packed in items:
+                    if len(packed) == self.dim:
+                        self._write_slot(key, packed)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Embedding cache write error: {e}")
+
+    def _write_slot(self, key: bytes, packed: array):
+        """Must be called with _file_lock held and the store open"""
+        slot_size = self._slot_size()
+        victim, victim_used = None, None
+        for slot in self._bucket(key):
+            offset = HEADER.size + slot * slot_size
+            slot_key, last_used = SLOT_META.unpack_from(self._map, offset)
+            if slot_key == key or slot_key == EMPTY_KEY:
+                victim, victim_used = offset, None
+                break
+            if victim is None or last_used < victim_used:
+                victim, victim_used = offset, last_used
+        if victim_used is not None:
+            self.evictions += 1
+        # Empty the slot before overwriting its vector, so a crash
+        # mid-write leaves a miss rather than a key over a torn vector
+        SLOT_META.pack_into(self._map, victim, EMPTY_KEY, 0)
+        start = victim + SLOT_META.size
+        self._map[start:start + 4 * self.dim] = packed.tobytes()
+        SLOT_META.pack_into(self._map, victim, key, self._tick())
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "disk_capacity": self.capacity,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._file_mutex:
+            if self._map is not None:
+                self._map.flush()
+                self._map.close()
+                self._map = None
+            for handle in (self._file, self._lock_file):
+                if handle is not None:
+                    handle.close()
+            self._file = None
+            self._lock_file = None
+
+
+embedding_cache = EmbeddingCache()
@@ -1,31 +1,42 @@
-from google import genai
+from answer_context import build_answer_context, legacy_context
+from answer_templates import answer_templates
+from cache import answer_cache
 from config import config
+from embedding_cache import embedding_cache
+from model_backends import GeminiBackend, create_backend
+from model_scheduler import BULK, model_scheduler
+from single_flight import SingleFlight
+from collections import defaultdict
+import asyncio
+import contextvars
+import difflib
 import json
+import re
+import threading
+import time
 
 
-class EmbeddingService:
-    """Service for generating embeddings using Gemini API"""
-
-    def __init__(self):
-        self.client = None
-
-    def initialize(self):
-        """Initialize Gemini client"""
-        self.client = genai.Client(api_key=config.GEMINI_API_KEY)
-
-    def generate_embedding(self, text: str) -> list:
-        """Generate embedding vector for given text"""
-        result = self.client.models.embed_content(
-            model="gemini-embedding-001", contents=text
-        )
-        return result.embeddings[0].values
+# Words that never start an entity on their own
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be been before being but by can could did do does doing
+for from had has have having how i if in into is it's know like me more most my no not now of on or our
+please say should so some tell than that the then there these this those to too up us was we were what
+when where which while who whom whose why will with would you your
+""".split())
 
-    def extract_graph_structure(self, text: str) -> dict:
-        """Extract structured graph data (nodes and edges) from text using Gemini"""
+# Pronoun -> which kind of entity it can refer to
+PRONOUNS = {
+    "he": "person", "him": "person", "his": "person",
+    "she": "person", "her": "person", "hers": "person",
+    "it": "thing", "its": "thing",
+    "they": "any", "them": "any", "their": "any", "theirs": "any",
+}
+POSSESSIVE_PRONOUNS = frozenset({"his", "hers", "its", "their", "theirs"})
 
-        prompt = f"""You are a knowledge graph extraction system. Extract entities (nodes) and relationships (edges) from the text.
+TOKEN_PATTERN = re.compile(r"\w+(?:[-.'’]\w+)*")
 
-CRITICAL: Follow these DATA STANDARDS exactly. Violating these rules will break the database.
+# Shared by the graph extraction prompts
+GRAPH_EXTRACTION_STANDARDS = """CRITICAL: Follow these DATA STANDARDS exactly. Violating these rules will break the database.
 
 ===== MANDATORY FORMAT RULES =====
 
@@ -49,29 +60,537 @@ CRITICAL: Follow these DATA STANDARDS exactly. Violating these rules will break
 
 Input: "Zayeem lives in Ohio"
 Output:
-{{
+{
   "nodes": [
-    {{"id": "zayeem", "label": "Person", "properties": {{"name": "Zayeem"}}}},
-    {{"id": "ohio", "label": "Location", "properties": {{"name": "Ohio"}}}}
+    {"id": "zayeem", "label": "Person", "properties": {"name": "Zayeem"}},
+    {"id": "ohio", "label": "Location", "properties": {"name": "Ohio"}}
   ],
   "edges": [
-    {{"from": "zayeem", "to": "ohio", "type": "LIVES_IN", "properties": {{}}}}
+    {"from": "zayeem", "to": "ohio", "type": "LIVES_IN", "properties": {}}
   ]
-}}
+}
 
 Input: "Alice works at Google"
 Output:
-{{
+{
   "nodes": [
-    {{"id": "alice", "label": "Person", "properties": {{"name": "Alice"}}}},
-    {{"id": "google", "label": "Company", "properties": {{"name": "Google"}}}}
+    {"id": "alice", "label": "Person", "properties": {"name": "Alice"}},
+    {"id": "google", "label": "Company", "properties": {"name": "Google"}}
   ],
   "edges": [
-    {{"from": "alice", "to": "google", "type": "WORKS_AT", "properties": {{}}}}
+    {"from": "alice", "to": "google", "type": "WORKS_AT", "properties": {}}
   ]
-}}
+}
+
+"""
+
+# Gemini generations made by the current request (see track_llm_usage)
+llm_usage = contextvars.ContextVar("llm_usage", default=None)
+
+# Characters with a meaning in Lucene query syntax (full-text index queries)
+LUCENE_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+
+
+class EntityDictionary:
+    """
+    In-memory dictionary of known node names and normalized_ids: the local
+    "speed gate" that extracts keywords and resolves pronouns without Gemini.
+
+    Entries remember which scopes (global or session ids) they were written
+    in, so one session's entity names are never offered to another session.
+    The global layer is loaded at startup and on every refresh; a session's
+    names are loaded the first time the session is used (and again once the
+    load is older than the refresh interval), and sessions idle for a whole
+    interval are dropped, so memory follows active sessions rather than every
+    visitor's data.
+    """
+
+    GLOBAL_NAMES_QUERY = """
+        MATCH (n:Entity {session_id: 'global'}) WHERE n.name IS NOT NULL
+        RETURN n.name as name, n.normalized_id as normalized_id, labels(n)[0] as label
+    """
+
+    SESSION_NAMES_QUERY = """
+        MATCH (n:Entity {session_id: $session_id}) WHERE n.name IS NOT NULL
+        RETURN n.name as name, n.normalized_id as normalized_id, labels(n)[0] as label
+    """
+
+    MAX_PHRASE_WORDS = 4
+
+    def __init__(self, fuzzy_cutoff: float = None):
+        self.fuzzy_cutoff = config.LOCAL_KEYWORDS_FUZZY_CUTOFF if fuzzy_cutoff is None else fuzzy_cutoff
+        self._entries = {}  # normalized phrase -> {"name", "label", "scopes"}
+        self._by_initial = defaultdict(set)  # first letter -> single-word phrases, for fuzzy matching
+        self._lock = threading.Lock()
+        self._db = None
+        self._sessions = {}  # session id -> monotonic time its names were loaded
+        self.served_locally = 0
+        self.escalated = 0
+        self.latency_saved = 0.0
+        self._llm_latency = None  # moving average of the LLM calls the local stage replaces
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.lower().replace("_", " ").split())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, name: str, normalized_id: str = None, label: str = None, session_id: str = None):
+        if not name:
+            return
+        scope = session_id or "global"
+        with self._lock:
+            self._add(self._entries, self._by_initial, name, normalized_id, label, scope)
+
+    @classmethod
+    def _add(cls, entries: dict, by_initial: dict, name: str, normalized_id: str, label: str, scope: str):
+        for phrase in {cls.normalize(name), cls.normalize(normalized_id or "")}:
+            if not phrase or phrase in STOPWORDS or len(phrase.split()) > cls.MAX_PHRASE_WORDS:
+                continue
+            entry = entries.setdefault(phrase, {"name": name, "label": label, "scopes": set()})
+            entry["scopes"].add(scope)
+            if " " not in phrase:
+                by_initial[phrase[0]].add(phrase)
+
+    def add_graph(self, graph_data: dict, session_id: str = None):
+        """Register the nodes create_graph_from_json just wrote"""
+        for node in graph_data.get("nodes", []):
+            node_id = node.get("id")
+            name = node.get("properties", {}).get("name", node_id)
+            self.add(name, node_id, node.get("label"), session_id)
+
+    async def load(self, db):
+        """Reload the global layer's names, keeping the names of sessions
+        loaded within the last refresh interval"""
+        self._db = db
+        records = await db.execute_cypher(self.GLOBAL_NAMES_QUERY)
+        cutoff = time.monotonic() - config.LOCAL_KEYWORDS_REFRESH
+
+        def build():
+            with self._lock:
+                self._sessions = {s: at for s, at in self._sessions.items() if at >= cutoff}
+                entries, by_initial = {}, defaultdict(set)
+                for phrase, entry in self._entries.items():
+                    scopes = {scope for scope in entry["scopes"] if scope in self._sessions}
+                    if scopes:
+                        entries[phrase] = {**entry, "scopes": scopes}
+                        if " " not in phrase:
+                            by_initial[phrase[0]].add(phrase)
+                for r in records:
+                    self._add(entries, by_initial, r["name"], r["normalized_id"], r["label"], "global")
+                self._entries, self._by_initial = entries, by_initial
+                return len(entries)
+
+        names = await asyncio.to_thread(build)
+        print(f"📖 Entity dictionary loaded: {names} names ({len(self._sessions)} sessions)")
+
+    async def load_session(self, session_id: str = None):
+        """Load a session's names from Neo4j on its first use, and again once
+        that load is older than the refresh interval (picking up names other
+        workers wrote). Names this worker writes arrive through add_graph."""
+        if self._db is None or session_id in (None, "none", "global"):
+            return
+        interval = config.LOCAL_KEYWORDS_REFRESH
+        loaded_at = self._sessions.get(session_id)
+        if loaded_at is not None and (interval <= 0 or time.monotonic() - loaded_at < interval):
+            return
+        # Marked before the read so concurrent requests don't repeat it
+        self._sessions[session_id] = time.monotonic()
+        try:
+            records = await self._db.execute_cypher(self.SESSION_NAMES_QUERY, {"session_id": session_id})
+        except Exception as e:
+            self._sessions.pop(session_id, None)
+            print(f"⚠️ Entity dictionary session load failed: {e}")
+            return
+        for r in records:
+            self.add(r["name"], r["normalized_id"], r["label"], session_id)
+
+    async def refresh_periodically(self, db, interval: float = None):
+        """Background task: reload so names written by other workers become known"""
+        interval = config.LOCAL_KEYWORDS_REFRESH if interval is None else interval
+        while interval > 0:
+            await asyncio.sleep(interval)
+            try:
+                await self.load(db)
+            except Exception as e:
+                print(f"⚠️ Entity dictionary refresh failed: {e}")
+
+    def _lookup(self, phrase: str, session_id: str):
+        entry = self._entries.get(phrase)
+        if entry and ("global" in entry["scopes"] or (session_id and session_id in entry["scopes"])):
+            return entry
+        return None
+
+    def _fuzzy_lookup(self, word: str, session_id: str):
+        """Closest known single-word phrase, or None if there is no clear winner"""
+        if len(word) < 4 or self.fuzzy_cutoff >= 1:
+            return None
+        candidates = [c for c in self._by_initial.get(word[0], ()) if abs(len(c) - len(word)) <= 2]
+        scored = []
+        for candidate in difflib.get_close_matches(word, candidates, n=3, cutoff=self.fuzzy_cutoff):
+            entry = self._lookup(candidate, session_id)
+            if entry:
+                scored.append((difflib.SequenceMatcher(None, word, candidate).ratio(), entry))
+        if not scored or (len(scored) > 1 and scored[0][0] - scored[1][0] < 0.05):
+            return None
+        return scored[0][1]
+
+    def match(self, text: str, session_id: str = None) -> tuple:
+        """
+        Longest-phrase exact matching, then fuzzy matching of single words.
+
+        Returns (matches, unknown) where matches is [(entry, start, end)] and
+        unknown lists capitalized words (likely proper nouns) nothing matched,
+        plus lowercase words whose only match is a capitalized name ("go"
+        next to a Go node is far more likely the verb): both mean the LLM
+        should decide.
+        """
+        tokens = [(m.group(), m.start(), m.end()) for m in TOKEN_PATTERN.finditer(text)]
+        words = [re.sub(r"['’]s$", "", t.lower()) for t, _, _ in tokens]
+        matches, unknown = [], []
+
+        with self._lock:
+            i = 0
+            while i < len(tokens):
+                found = None
+                for n in range(min(self.MAX_PHRASE_WORDS, len(tokens) - i), 0, -1):
+                    if n == 1 and (words[i] in STOPWORDS or words[i] in PRONOUNS):
+                        break
+                    entry = self._lookup(" ".join(words[i:i + n]), session_id)
+                    if entry:
+                        found = (entry, n)
+                        break
+                # Like fuzzy matches, a single lowercase word is only trusted
+                # as a name that is itself lowercase
+                if (found and found[1] == 1 and not tokens[i][0][0].isupper()
+                        and (found[0]["name"] or "")[:1].isupper()):
+                    unknown.append(tokens[i][0])
+                    i += 1
+                    continue
+                # Only capitalized words are fuzzy matched: lowercase words are
+                # far more likely to be ordinary vocabulary than misspelled names
+                if found is None and tokens[i][0][0].isupper() and words[i] not in STOPWORDS:
+                    entry = self._fuzzy_lookup(words[i], session_id)
+                    if entry:
+                        found = (entry, 1)
+
+                if found:
+                    entry, n = found
+                    matches.append((entry, tokens[i][1], tokens[i + n - 1][2]))
+                    i += n
+                    continue
+                # The first word is capitalized anyway, so it says nothing
+                if i > 0 and tokens[i][0][0].isupper() and words[i] not in STOPWORDS:
+                    unknown.append(tokens[i][0])
+                i += 1
+
+        return matches, unknown
+
+    def extract_keywords(self, text: str, session_id: str = None):
+        """Known entity names in text, or None when the LLM should decide"""
+        matches, unknown = self.match(text, session_id)
+        if not matches or unknown:
+            return None
+        keywords = []
+        for entry, _, _ in matches:
+            if entry["name"] not in keywords:
+                keywords.append(entry["name"])
+        return keywords
+
+    def resolve_pronouns(self, query: str, history: list, session_id: str = None):
+        """
+        Replace pronouns with the entity the recent turns were about.
+
+        Returns the rewritten query, or None if a pronoun has no single
+        unambiguous referent in the last turns.
+        """
+        tokens = [(m.group(), m.start(), m.end()) for m in TOKEN_PATTERN.finditer(query)]
+        pronouns = [(i, t) for i, t in enumerate(tokens) if t[0].lower() in PRONOUNS]
+        if not pronouns:
+            return query
+        if not history:
+            return None
+
+        recent = [self.match(msg.get("content", ""), session_id)[0] for msg in reversed(history[-4:])]
+        replacements = []
+        for i, (word, start, end) in pronouns:
+            kind = PRONOUNS[word.lower()]
+            referent = None
+            for matches in recent:
+                names = {
+                    entry["name"] for entry, _, _ in matches
+                    if kind == "any" or (kind == "person") == ((entry["label"] or "").lower() == "person")
+                }
+                if len(names) > 1:
+                    return None  # "he" with two people in the same turn: let the LLM decide
+                if names:
+                    referent = names.pop()
+                    break
+            if referent is None:
+                return None
+
+            possessive = word.lower() in POSSESSIVE_PRONOUNS or (
+                # "her job" vs. "ask her": possessive when a content word follows
+                word.lower() == "her" and i + 1 < len(tokens) and tokens[i + 1][0].lower() not in STOPWORDS
+            )
+            replacements.append((start, end, f"{referent}'s" if possessive else referent))
+
+        rewritten = query
+        for start, end, text in reversed(replacements):
+            rewritten = rewritten[:start] + text + rewritten[end:]
+        return rewritten
+
+    def speculative_keywords(self, query: str, history: list, session_id: str = None) -> list:
+        """
+        Best-guess keywords for a question the local stage may escalate:
+        every known name in it (unknown words are ignored) plus, for a
+        pronoun, the names in the most recent turn that mentions any.
+        Used to start retrieval before the LLM answers; may be empty.
+        """
+        keywords = [entry["name"] for entry, _, _ in self.match(query, session_id)[0]]
+        if history and any(m.group().lower() in PRONOUNS for m in TOKEN_PATTERN.finditer(query)):
+            for msg in reversed(history[-4:]):
+                names = [entry["name"] for entry, _, _ in self.match(msg.get("content", ""), session_id)[0]]
+                if names:
+                    keywords.extend(names)
+                    break
+        return list(dict.fromkeys(keywords))
+
+    def process_query(self, query: str, history: list, session_id: str = None):
+        """Local rewrite + keyword extraction, or None to escalate to the LLM"""
+        rewritten = self.resolve_pronouns(query, history, session_id)
+        if rewritten is None:
+            return None
+        keywords = self.extract_keywords(rewritten, session_id)
+        if keywords is None:
+            return None
+        return {"rewritten_query": rewritten, "keywords": keywords}
+
+    def record(self, served_locally: bool, llm_latency: float = None):
+        """Count a request; llm_latency is the duration of an escalated LLM call"""
+        with self._lock:
+            if served_locally:
+                self.served_locally += 1
+                self.latency_saved += self._llm_latency or 0.0
+            else:
+                self.escalated += 1
+                if llm_latency is not None:
+                    self._llm_latency = (
+                        llm_latency if self._llm_latency is None else 0.9 * self._llm_latency + 0.1 * llm_latency
+                    )
+
+    def stats(self) -> dict:
+        total = self.served_locally + self.escalated
+        return {
+            "entries": len(self._entries),
+            "served_locally": self.served_locally,
+            "escalated": self.escalated,
+            "local_rate": round(self.served_locally / total, 4) if total else 0.0,
+            "latency_saved_ms": round(self.latency_saved * 1000, 1),
+        }
+
+
+class EmbeddingService:
+    """Service for generating embeddings using Gemini API"""
+
+    def __init__(self):
+        self.backend = None
+        # Identical concurrent generations / embeddings share one Gemini call.
+        # Keys are the full prompt (or text), which already carries everything
+        # the output depends on, including the session's retrieved triples.
+        self.generate_flight = SingleFlight("llm")
+        self.embed_flight = SingleFlight("embeddings")
+        # Whether retrieval anchors also come from the entity_names full-text
+        # index; off when the index is missing (see check_anchor_indexes)
+        self.fulltext_anchors = True
 
-===== YOUR TASK =====
+    def initialize(self):
+        """Initialize the model backend (MODEL_BACKEND)"""
+        self.backend = create_backend()
+
+    async def check_anchor_indexes(self, db):
+        """Check the indexes retrieval anchors are looked up in (created by
+        init_global_nodes.py); without entity_names, anchor on normalized_id
+        prefixes only instead of failing every question"""
+        try:
+            online = await db.online_indexes()
+        except Exception as e:
+            print(f"⚠️ Could not list Neo4j indexes: {e}")
+            return
+        self.fulltext_anchors = "entity_names" in online
+        if not self.fulltext_anchors:
+            self.disable_fulltext_anchors("it is not online")
+        if "node_normalized_id" not in online:
+            print("⚠️ Index 'node_normalized_id' is not online: retrieval anchor lookups scan every :Entity node. "
+                  "Run init_global_nodes.py to create it.")
+
+    def disable_fulltext_anchors(self, reason: str):
+        self.fulltext_anchors = False
+        print(f"❌ Full-text index 'entity_names' unavailable ({reason}): retrieval anchors use normalized_id "
+              f"prefixes only, so keywords that are not a node id prefix find nothing. "
+              f"Run init_global_nodes.py to create it and restart.")
+
+    @property
+    def client(self):
+        """The genai client when running on the Gemini backend"""
+        return getattr(self.backend, "client", None)
+
+    @client.setter
+    def client(self, client):
+        # Scripts that swap in their own genai-style client keep working
+        self.backend = GeminiBackend(client)
+
+    @property
+    def embedding_cache_model(self) -> str:
+        """Embedding cache namespace; vectors from an offline backend must
+        never be served as the real model's"""
+        if getattr(self.backend, "synthetic_embeddings", False):
+            return f"fake:{config.EMBEDDING_MODEL}"
+        return config.EMBEDDING_MODEL
+
+    @staticmethod
+    def track_llm_usage() -> dict:
+        """Count the generations made from here on in the current request
+        (task); returns the live counters for the /chat details payload.
+        Generations the request joined while another request's identical
+        call was in flight count as coalesced_calls, not llm_calls."""
+        usage = {"llm_calls": 0, "llm_latency_ms": 0.0, "coalesced_calls": 0}
+        llm_usage.set(usage)
+        return usage
+
+    @staticmethod
+    def _record_llm_call(started: float, coalesced: bool = False):
+        usage = llm_usage.get()
+        if usage is not None and coalesced:
+            usage["coalesced_calls"] += 1
+        elif usage is not None:
+            usage["llm_calls"] += 1
+            usage["llm_latency_ms"] = round(usage["llm_latency_ms"] + (time.perf_counter() - started) * 1000, 1)
+
+    def _generate(self, prompt: str, generation_config: dict = None) -> str:
+        """Run a single GENERATION_MODEL generation and return the response text"""
+        model = config.GENERATION_MODEL
+        started = time.perf_counter()
+        try:
+            return model_scheduler.call_sync(
+                model, lambda: self.backend.generate(model, prompt, generation_config)
+            )
+        finally:
+            self._record_llm_call(started)
+
+    async def _generate_async(self, prompt: str, generation_config: dict = None) -> str:
+        """Awaitable _generate built on the client's aio surface; joins an
+        identical generation already in flight"""
+        key = SingleFlight.make_key(prompt, generation_config)
+        led = self.generate_flight.leads(key)
+        started = time.perf_counter()
+        try:
+            return await self.generate_flight.run(key, lambda: self._model_generate_async(prompt, generation_config))
+        finally:
+            self._record_llm_call(started, coalesced=not led)
+
+    async def _model_generate_async(self, prompt: str, generation_config: dict = None) -> str:
+        model = config.GENERATION_MODEL
+        return await model_scheduler.call(
+            model, lambda: self.backend.generate_async(model, prompt, generation_config)
+        )
+
+    async def _generate_stream_async(self, prompt: str, generation_config: dict = None):
+        """Streaming _generate_async: yields response text chunks as the model produces them"""
+        model = config.GENERATION_MODEL
+        stream = model_scheduler.stream(
+            model, lambda: self.backend.generate_stream_async(model, prompt, generation_config)
+        )
+        started = time.perf_counter()
+        try:
+            async for text in stream:
+                if text:
+                    yield text
+        finally:
+            self._record_llm_call(started)
+
+    def generate_embedding(self, text: str) -> list:
+        """Generate embedding vector for given text (served from embedding_cache when possible)"""
+        model = config.EMBEDDING_MODEL
+        cached = embedding_cache.get(self.embedding_cache_model, text)
+        if cached is not None:
+            return cached
+        vector = model_scheduler.call_sync(model, lambda: self.backend.embed(model, text))[0]
+        embedding_cache.put(self.embedding_cache_model, text, vector)
+        return vector
+
+    async def generate_embedding_async(self, text: str) -> list:
+        """Awaitable generate_embedding"""
+        cached = await embedding_cache.get_async(self.embedding_cache_model, text)
+        if cached is not None:
+            return cached
+        return await self.embed_flight.run(SingleFlight.make_key(text), lambda: self._model_embed_async(text))
+
+    async def _model_embed_async(self, text: str) -> list:
+        model = config.EMBEDDING_MODEL
+        vectors = await model_scheduler.call(model, lambda: self.backend.embed_async(model, text))
+        await embedding_cache.put_async(self.embedding_cache_model, text, vectors[0])
+        return vectors[0]
+
+    async def generate_embeddings_batch_async(self, texts: list) -> list:
+        """
+        Embed many texts with batched embed_content calls.
+
+        Cache misses are split into chunks of EMBED_BATCH_SIZE (the API's
+        per-request limit) and up to EMBED_BATCH_CONCURRENCY chunks run at
+        once. Returns a list aligned with texts holding either the vector
+        or the Exception that chunk failed with.
+        """
+        model = config.EMBEDDING_MODEL
+        vectors = await embedding_cache.get_many_async(self.embedding_cache_model, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        chunks = [
+            missing[i:i + config.EMBED_BATCH_SIZE]
+            for i in range(0, len(missing), config.EMBED_BATCH_SIZE)
+        ]
+        semaphore = asyncio.Semaphore(config.EMBED_BATCH_CONCURRENCY)
+
+        async def embed_chunk(indices: list):
+            async with semaphore:
+                try:
+                    # Batch embedding yields to interactive calls
+                    with model_scheduler.lane(BULK):
+                        embeddings = await model_scheduler.call(
+                            model, lambda: self.backend.embed_async(model, [texts[i] for i in indices])
+                        )
+                    if len(embeddings) != len(indices):
+                        raise ValueError(
+                            f"Expected {len(indices)} embeddings, got {len(embeddings)}"
+                        )
+                except Exception as e:
+                    for i in indices:
+                        vectors[i] = e
+                    return
+                for i, vector in zip(indices, embeddings):
+                    vectors[i] = vector
+                await embedding_cache.put_many_async(
+                    self.embedding_cache_model, [texts[i] for i in indices], embeddings
+                )
+
+        await asyncio.gather(*(embed_chunk(chunk) for chunk in chunks))
+        return vectors
+
+    def extract_graph_structure(self, text: str) -> dict:
+        """Extract structured graph data (nodes and edges) from text using Gemini"""
+        response_text = self._generate(self._graph_extraction_prompt(text))
+        return self._parse_graph_structure(response_text)
+
+    async def extract_graph_structure_async(self, text: str) -> dict:
+        """Awaitable extract_graph_structure"""
+        response_text = await self._generate_async(self._graph_extraction_prompt(text))
+        return self._parse_graph_structure(response_text)
+
+    @staticmethod
+    def _graph_extraction_prompt(text: str) -> str:
+        return f"""You are a knowledge graph extraction system. Extract entities (nodes) and relationships (edges) from the text.
+
+{GRAPH_EXTRACTION_STANDARDS}===== YOUR TASK =====
 
 Text: {text}
 
@@ -79,12 +598,10 @@ Return ONLY valid JSON. No explanations.
 
 JSON:"""
 
-        response = self.client.models.generate_content(
-            model="gemini-2.5-flash", contents=prompt
-        )
-
+    @staticmethod
+    def _parse_graph_structure(response_text: str) -> dict:
         # Extract JSON from response
-        response_text = response.text.strip()
+        response_text = response_text.strip()
 
         # Remove markdown code blocks if present
         if response_text.startswith("```json"):
@@ -106,11 +623,138 @@ JSON:"""
 
         return graph_data
 
+    def process_fact(self, message: str, history: list) -> dict:
+        """
+        Single LLM call for add_fact: resolve pronouns from history AND
+        extract the graph in one structured response. Falls back to
+        rewrite_query + extract_graph_structure only when that response does
+        not validate.
+
+        Returns:
+        {
+            "rewritten_fact": "standalone fact",
+            "graph": {"nodes": [...], "edges": [...]},
+            "source": "extract" | "combined" | "two_step"
+        }
+        """
+        if not history:
+            # Nothing to resolve: extraction alone is a single call already
+            return {"rewritten_fact": message, "graph": self.extract_graph_structure(message), "source": "extract"}
+        try:
+            response_text = self._generate(
+                self._fact_processing_prompt(message, history),
+                {"response_mime_type": "application/json"},
+            )
+            return {**self._parse_processed_fact(response_text), "source": "combined"}
+        except ValueError as e:
+            print(f"⚠️ Combined fact processing returned invalid output: {e}. Falling back to two calls.")
+        rewritten = self.rewrite_query(message, history)
+        return {"rewritten_fact": rewritten, "graph": self.extract_graph_structure(rewritten), "source": "two_step"}
+
+    async def process_fact_async(self, message: str, history: list) -> dict:
+        """Awaitable process_fact"""
+        if not history:
+            graph = await self.extract_graph_structure_async(message)
+            return {"rewritten_fact": message, "graph": graph, "source": "extract"}
+        try:
+            response_text = await self._generate_async(
+                self._fact_processing_prompt(message, history),
+                {"response_mime_type": "application/json"},
+            )
+            return {**self._parse_processed_fact(response_text), "source": "combined"}
+        except ValueError as e:
+            print(f"⚠️ Combined fact processing returned invalid output: {e}. Falling back to two calls.")
+        rewritten = await self.rewrite_query_async(message, history)
+        graph = await self.extract_graph_structure_async(rewritten)
+        return {"rewritten_fact": rewritten, "graph": graph, "source": "two_step"}
+
+    @staticmethod
+    def _fact_processing_prompt(message: str, history: list) -> str:
+        history_text = "\n".join(
+            [f"{msg['role']}: {msg['content']}" for msg in history[-4:]]
+        )
+
+        return f"""You are a Fact Processing Engine. Perform TWO tasks in ONE response:
+
+Task 1 - Fact Rewriting:
+Rewrite the current message to be a standalone fact by replacing pronouns (he, she, it, they, etc.) with the specific names they refer to in the chat history. If it is already standalone, keep it as-is. Do NOT answer or add information.
+
+Task 2 - Graph Extraction:
+Extract entities (nodes) and relationships (edges) from the REWRITTEN fact.
+
+{GRAPH_EXTRACTION_STANDARDS}===== YOUR TASK =====
+
+Chat History:
+{history_text}
+
+Current Message: "{message}"
+
+Example:
+History: "user: Zayeem is my friend"
+Message: "he lives in Ohio"
+Output:
+{{
+  "rewritten_fact": "Zayeem lives in Ohio",
+  "graph": {{
+    "nodes": [
+      {{"id": "zayeem", "label": "Person", "properties": {{"name": "Zayeem"}}}},
+      {{"id": "ohio", "label": "Location", "properties": {{"name": "Ohio"}}}}
+    ],
+    "edges": [
+      {{"from": "zayeem", "to": "ohio", "type": "LIVES_IN", "properties": {{}}}}
+    ]
+  }}
+}}
+
+Return ONLY valid JSON with these two fields:
+{{
+  "rewritten_fact": "...",
+  "graph": {{"nodes": [...], "edges": [...]}}
+}}
+
+JSON:"""
+
+    @staticmethod
+    def _parse_processed_fact(response_text: str) -> dict:
+        """Validate the combined response; any problem raises ValueError"""
+        result = json.loads(response_text.strip())
+        if not isinstance(result, dict):
+            raise ValueError("Response is not a JSON object")
+
+        rewritten = result.get("rewritten_fact")
+        graph = result.get("graph")
+        if not isinstance(rewritten, str) or not rewritten.strip():
+            raise ValueError("Missing rewritten_fact")
+        if not isinstance(graph, dict) or not isinstance(graph.get("nodes"), list) or not isinstance(graph.get("edges"), list):
+            raise ValueError("Invalid graph structure: missing nodes or edges")
+
+        node_ids = set()
+        for node in graph["nodes"]:
+            if not isinstance(node, dict) or not isinstance(node.get("id"), str) or not node["id"]:
+                raise ValueError("Node without an id")
+            node_ids.add(node["id"])
+        for edge in graph["edges"]:
+            if not isinstance(edge, dict) or edge.get("from") not in node_ids or edge.get("to") not in node_ids:
+                raise ValueError("Edge endpoint is not an extracted node")
+            if not isinstance(edge.get("type"), str) or not edge["type"]:
+                raise ValueError("Edge without a type")
+
+        return {"rewritten_fact": rewritten.strip(), "graph": graph}
+
     def generate_cypher_query(self, question: str, schema_context: str = None) -> str:
+        response_text = self._generate(self._cypher_prompt(question))
+        return response_text.replace("```cypher", "").replace("```", "").strip()
+
+    async def generate_cypher_query_async(self, question: str, schema_context: str = None) -> str:
+        response_text = await self._generate_async(self._cypher_prompt(question))
+        return response_text.replace("```cypher", "").replace("```", "").strip()
+
+    @staticmethod
+    def _cypher_prompt(question: str) -> str:
         # We simplify the prompt to use flexible "CONTAINS" matching
         # instead of strict relationship types.
         
-        prompt = f"""
+        return f"""
         You are a Neo4j Expert. Write a Cypher query to answer the question.
 
         SECURITY RULE:
@@ -135,37 +779,143 @@ JSON:"""
         
         Return ONLY the Cypher string.
         """
-        
-        response = self.client.models.generate_content(
-            model="gemini-2.5-flash", 
-            contents=prompt
-        )
-        
-        return response.text.replace("```cypher", "").replace("```", "").strip()
 
     def format_query_results(self, question: str, results: list) -> str:
         if not results:
             return "I couldn't find that information in your memory."
-        
-        # 1. Structure the data with semantic awareness
-        # Keep entity-relationship-entity triples for better context
-        structured_data = []
-        for record in results:
-            entity1 = record.get('entity1', '')
-            relationships = record.get('relationships', [])
-            entity2 = record.get('entity2', '')
-            
-            # Format as structured triples
-            if isinstance(relationships, list):
-                rel_chain = ' -> '.join(relationships)
-                structured_data.append(f"{entity1} --[{rel_chain}]--> {entity2}")
-            else:
-                structured_data.append(f"{entity1} --[{relationships}]--> {entity2}")
-        
-        context_text = "\n".join(structured_data)
+        answer = self._template_answer(question, results)
+        if answer is not None:
+            return answer
+        started = time.perf_counter()
+        answer = self._generate(self._answer_prompt(question, results)).strip()
+        answer_templates.record(False, time.perf_counter() - started)
+        return answer
+
+    async def format_query_results_async(self, question: str, results: list) -> str:
+        if not results:
+            return "I couldn't find that information in your memory."
+        answer = self._template_answer(question, results)
+        if answer is not None:
+            return answer
+        return await self._generate_answer_async(question, results)
+
+    async def _generate_answer_async(self, question: str, results: list) -> str:
+        started = time.perf_counter()
+        response_text = await self._generate_async(self._answer_prompt(question, results))
+        answer_templates.record(False, time.perf_counter() - started)
+        return response_text.strip()
+
+    @staticmethod
+    def _template_answer(question: str, results: list):
+        """Deterministic answer for direct one-hop results, or None"""
+        if not config.ANSWER_TEMPLATES_ENABLED:
+            return None
+        answer = answer_templates.answer(question, results)
+        if answer is not None:
+            answer_templates.record(True)
+        return answer
+
+    @staticmethod
+    def _template_report() -> dict:
+        return {
+            "hit": False,
+            "match": "template",
+            "llm_calls_avoided": 1,
+            "latency_saved_ms": answer_templates.latency_saved_ms(),
+        }
+
+    async def format_query_results_cached_async(self, question: str, results: list, session_id: str = None) -> tuple:
+        """
+        format_query_results_async behind the session-scoped answer cache.
+
+        Returns (answer_text, report) where report is surfaced in the /chat
+        details payload:
+        {"hit": bool, "match": "exact" | "similar" | "template" | None,
+         "llm_calls_avoided": int, "latency_saved_ms": float}
+        """
+        answer = self._template_answer(question, results)
+        if answer is not None:
+            return answer, self._template_report()
+
+        key = answer_cache.make_key(question, results, session_id)
+        entry, report, question_embedding = await self._lookup_answer_async(key, question)
+        if entry is not None:
+            return entry["answer"], report
+
+        started = time.perf_counter()
+        answer = await self._generate_answer_async(question, results)
+        answer_cache.store(key, answer, time.perf_counter() - started, question_embedding)
+        return answer, report
+
+    async def format_query_results_stream_async(self, question: str, results: list,
+                                                session_id: str = None, report: dict = None):
+        """
+        Streaming format_query_results_cached_async: yields answer text chunks.
+
+        A cached or templated answer is yielded whole. The answer cache report
+        is written into `report` (if given) before the first chunk.
+        """
+        answer = self._template_answer(question, results)
+        if answer is not None:
+            if report is not None:
+                report.update(self._template_report())
+            yield answer
+            return
+
+        key = answer_cache.make_key(question, results, session_id)
+        entry, cache_report, question_embedding = await self._lookup_answer_async(key, question)
+        if report is not None:
+            report.update(cache_report)
+        if entry is not None:
+            yield entry["answer"]
+            return
+
+        started = time.perf_counter()
+        parts = []
+        async for text in self._generate_stream_async(self._answer_prompt(question, results)):
+            # Hold back leading whitespace the way .strip() does for the non-streaming answer
+            if not parts:
+                text = text.lstrip()
+                if not text:
+                    continue
+            parts.append(text)
+            yield text
+        answer_templates.record(False, time.perf_counter() - started)
+        answer_cache.store(key, "".join(parts).strip(), time.perf_counter() - started, question_embedding)
+
+    async def _lookup_answer_async(self, key: tuple, question: str) -> tuple:
+        """Exact then (if enabled) similarity lookup; returns (entry, report, question_embedding)"""
+        entry = answer_cache.lookup(key)
+        match = "exact" if entry is not None else None
+
+        question_embedding = None
+        if entry is None and answer_cache.similarity_threshold > 0:
+            try:
+                question_embedding = await self.generate_embedding_async(question)
+                entry = answer_cache.lookup_similar(key, question_embedding)
+                match = "similar" if entry is not None else None
+            except Exception as e:
+                print(f"⚠️ Answer cache embedding error: {e}. Skipping similarity lookup.")
+
+        if entry is None:
+            return None, {"hit": False, "match": None, "llm_calls_avoided": 0, "latency_saved_ms": 0.0}, question_embedding
+        return entry, {
+            "hit": True,
+            "match": match,
+            "llm_calls_avoided": 1,
+            "latency_saved_ms": round(entry["latency"] * 1000, 1),
+        }, question_embedding
+
+    @staticmethod
+    def _answer_prompt(question: str, results: list) -> str:
+        # 1. Structure the data: deduplicated, grouped and cut to the token budget
+        if config.ANSWER_CONTEXT_COMPACT:
+            context_text = build_answer_context(question, results)
+        else:
+            context_text = legacy_context(results)
 
         # 2. The "Semantic Sniper" Prompt
-        prompt = f"""
+        return f"""
         You are a precise Knowledge Graph Answer Engine with semantic understanding.
         
         User Question: "{question}"
@@ -200,12 +950,6 @@ JSON:"""
         Answer: "I don't have information about where Alice lives. I only know her friend Bob lives in Ohio."
         
         Answer:"""
-        
-        response = self.client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt
-        )
-        return response.text.strip()
     
     # Add this method to EmbeddingService class
     def rewrite_query(self, original_query: str, chat_history: list) -> str:
@@ -214,13 +958,25 @@ JSON:"""
         """
         if not chat_history:
             return original_query
+        return self._generate(self._rewrite_prompt(original_query, chat_history)).strip()
 
+    async def rewrite_query_async(self, original_query: str, chat_history: list) -> str:
+        """Awaitable rewrite_query"""
+        if not chat_history:
+            return original_query
+        response_text = await self._generate_async(
+            self._rewrite_prompt(original_query, chat_history)
+        )
+        return response_text.strip()
+
+    @staticmethod
+    def _rewrite_prompt(original_query: str, chat_history: list) -> str:
         # Format history for the prompt
         history_text = "\n".join(
             [f"{msg['role']}: {msg['content']}" for msg in chat_history[-4:]]
         )
 
-        prompt = f"""
+        return f"""
         You are a query rewriting assistant. Your job is to rewrite the "Current Question" to be a standalone question that contains all necessary context from the "Chat History".
         
         Rules:
@@ -235,36 +991,101 @@ JSON:"""
         
         Standalone Question:"""
 
-        response = self.client.models.generate_content(
-            model="gemini-2.5-flash", contents=prompt
-        )
-
-        return response.text.strip()
-
-    def process_query_optimized(self, query: str, history: list) -> dict:
+    def process_query_optimized(self, query: str, history: list, session_id: str = None) -> dict:
         """
         PERFORMANCE OPTIMIZATION: Single LLM call replacing 3 sequential calls.
         Combines: rewrite_query + extract_keywords into one structured output.
+        Questions the local entity dictionary can handle skip the LLM entirely.
         
         Returns:
         {
             "rewritten_query": "standalone question",
-            "keywords": ["Entity1", "Entity2"]
+            "keywords": ["Entity1", "Entity2"],
+            "source": "local" | "llm"
         }
         """
+        local = self._process_query_locally(query, history, session_id)
+        if local is not None:
+            return local
+
+        started = time.perf_counter()
+        result = self._process_query_llm(query, history)
+        entity_dictionary.record(False, time.perf_counter() - started)
+        result["source"] = "llm"
+        return result
+
+    def _process_query_locally(self, query: str, history: list, session_id: str = None):
+        if not config.LOCAL_KEYWORDS_ENABLED:
+            return None
+        local = entity_dictionary.process_query(query, history, session_id)
+        if local is not None:
+            entity_dictionary.record(True)
+            local["source"] = "local"
+        return local
+
+    def _process_query_llm(self, query: str, history: list) -> dict:
         if not history:
             # No history means no rewriting needed, just extract keywords
             return {
                 "rewritten_query": query,
-                "keywords": self.extract_keywords(query)
+                "keywords": self._extract_keywords_llm(query)
             }
         
+        try:
+            response_text = self._generate(
+                self._process_query_prompt(query, history),
+                {"response_mime_type": "application/json"},
+            )
+            return self._parse_processed_query(response_text)
+        except Exception as e:
+            print(f"⚠️ Optimized query processing error: {e}. Falling back to original.")
+            return {
+                "rewritten_query": query,
+                "keywords": []
+            }
+
+    async def process_query_optimized_async(self, query: str, history: list, session_id: str = None) -> dict:
+        """Awaitable process_query_optimized"""
+        if config.LOCAL_KEYWORDS_ENABLED:
+            await entity_dictionary.load_session(session_id)
+        local = self._process_query_locally(query, history, session_id)
+        if local is not None:
+            return local
+
+        started = time.perf_counter()
+        result = await self._process_query_llm_async(query, history)
+        entity_dictionary.record(False, time.perf_counter() - started)
+        result["source"] = "llm"
+        return result
+
+    async def _process_query_llm_async(self, query: str, history: list) -> dict:
+        if not history:
+            return {
+                "rewritten_query": query,
+                "keywords": await self._extract_keywords_llm_async(query)
+            }
+
+        try:
+            response_text = await self._generate_async(
+                self._process_query_prompt(query, history),
+                {"response_mime_type": "application/json"},
+            )
+            return self._parse_processed_query(response_text)
+        except Exception as e:
+            print(f"⚠️ Optimized query processing error: {e}. Falling back to original.")
+            return {
+                "rewritten_query": query,
+                "keywords": []
+            }
+
+    @staticmethod
+    def _process_query_prompt(query: str, history: list) -> str:
         # Format history for context
         history_text = "\n".join(
             [f"{msg['role']}: {msg['content']}" for msg in history[-4:]]
         )
         
-        prompt = f"""
+        return f"""
         You are a Query Processing Engine. Perform TWO tasks in ONE response:
         
         Task 1 - Query Rewriting:
@@ -301,41 +1122,78 @@ JSON:"""
         }}
         
         JSON:"""
+
+    @staticmethod
+    def _parse_processed_query(response_text: str) -> dict:
+        result = json.loads(response_text.strip())
         
-        try:
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt,
-                config={
-                    "response_mime_type": "application/json"
-                }
-            )
-            
-            result = json.loads(response.text.strip())
-            
-            # Validate structure
-            if "rewritten_query" not in result or "keywords" not in result:
-                raise ValueError("Missing required fields in response")
-            
-            # Ensure keywords is a list
-            if not isinstance(result["keywords"], list):
-                result["keywords"] = []
-            
-            return result
-            
-        except Exception as e:
-            print(f"⚠️ Optimized query processing error: {e}. Falling back to original.")
-            return {
-                "rewritten_query": query,
-                "keywords": []
-            }
+        # Validate structure
+        if "rewritten_query" not in result or "keywords" not in result:
+            raise ValueError("Missing required fields in response")
+        
+        # Ensure keywords is a list
+        if not isinstance(result["keywords"], list):
+            result["keywords"] = []
+        
+        return result
 
-    def extract_keywords(self, query: str) -> list:
+    def extract_keywords(self, query: str, session_id: str = None) -> list:
         """
         Extracts important keywords/entities from the query using AI.
         These keywords will be used for deterministic Cypher query building.
+        Known entity names are matched locally first.
         """
-        prompt = f"""
+        keywords = self._extract_keywords_locally(query, session_id)
+        if keywords is not None:
+            return keywords
+        started = time.perf_counter()
+        keywords = self._extract_keywords_llm(query)
+        entity_dictionary.record(False, time.perf_counter() - started)
+        return keywords
+
+    def _extract_keywords_locally(self, query: str, session_id: str = None):
+        if not config.LOCAL_KEYWORDS_ENABLED:
+            return None
+        keywords = entity_dictionary.extract_keywords(query, session_id)
+        if keywords is not None:
+            entity_dictionary.record(True)
+        return keywords
+
+    def _extract_keywords_llm(self, query: str) -> list:
+        try:
+            response_text = self._generate(
+                self._keywords_prompt(query), {"response_mime_type": "application/json"}
+            )
+            return self._parse_keywords(response_text)
+        except Exception as e:
+            print(f"⚠️ Keyword Extraction Error: {e}. Returning empty list.")
+            return []
+
+    async def extract_keywords_async(self, query: str, session_id: str = None) -> list:
+        """Awaitable extract_keywords"""
+        if config.LOCAL_KEYWORDS_ENABLED:
+            await entity_dictionary.load_session(session_id)
+        keywords = self._extract_keywords_locally(query, session_id)
+        if keywords is not None:
+            return keywords
+        started = time.perf_counter()
+        keywords = await self._extract_keywords_llm_async(query)
+        entity_dictionary.record(False, time.perf_counter() - started)
+        return keywords
+
+    async def _extract_keywords_llm_async(self, query: str) -> list:
+        try:
+            response_text = await self._generate_async(
+                self._keywords_prompt(query), {"response_mime_type": "application/json"}
+            )
+            return self._parse_keywords(response_text)
+        except Exception as e:
+            print(f"⚠️ Keyword Extraction Error: {e}. Returning empty list.")
+            return []
+
+    @staticmethod
+    def _keywords_prompt(query: str) -> str:
+        return f"""
         You are a keyword extraction system. Extract the most important entities and concepts from the query.
         
         Rules:
@@ -359,76 +1217,344 @@ JSON:"""
         
         Output:"""
 
-        try:
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt,
-                config={
-                    "response_mime_type": "application/json"
-                }
-            )
-            
-            keywords = json.loads(response.text.strip())
-            
-            # Validate it's a list
-            if not isinstance(keywords, list):
-                return []
-            
-            # Filter out empty strings and return
-            return [k.strip() for k in keywords if k and k.strip()]
-            
-        except Exception as e:
-            print(f"⚠️ Keyword Extraction Error: {e}. Returning empty list.")
+    @staticmethod
+    def _parse_keywords(response_text: str) -> list:
+        keywords = json.loads(response_text.strip())
+        
+        # Validate it's a list
+        if not isinstance(keywords, list):
             return []
+        
+        # Filter out empty strings and return
+        return [k.strip() for k in keywords if k and k.strip()]
 
-    def build_secure_cypher_query(self, keywords: list) -> str:
+    def build_secure_cypher_query(self, keywords: list, session_anchors_only: bool = False) -> str:
         """
         Builds a deterministic, secure Cypher query with hardcoded security filters.
         Uses TWO-HOP SEARCH for better connectivity (finds nodes up to 2 steps away).
+        With session_anchors_only, only the session's own nodes are anchors
+        (the global anchors are expanded from the global snapshot instead).
         
         This function is MATHEMATICALLY IMPOSSIBLE to leak data because:
         1. The security filter is hardcoded in Python (not AI-generated)
         2. The session_id check is always present on ALL nodes in the path
+           (applied hop by hop, before a node is expanded)
         3. Keywords are passed as parameters, not interpolated as strings
         4. The query structure is FIXED and cannot be manipulated by AI
         """
         if not keywords:
-            # If no keywords, return a broad query that shows recent activity
-            # Use variable-length path [*1..2] for two-hop connectivity
+            # No keywords: the recent-activity feed. Instead of expanding and
+            # sorting every path in the database, read the most recently
+            # active nodes of this session (within a bounded lookback) and of
+            # the global layer straight off the (session_id, last_fact_at)
+            # index, newest first. n.last_fact_at is stamped on write when a
+            # relationship is created by the node's own session. The global
+            # layer is seeded once and may be older than the lookback, so it
+            # is bounded by $recent_nodes alone. Then take each node's newest
+            # visible facts; a supernode's edges are taken unsorted and
+            # flagged as truncated.
             return """
-            MATCH path = (n)-[*1..2]-(m)
-            WHERE ALL(node IN nodes(path) WHERE node.session_id = 'global' OR node.session_id = $session_id)
-            WITH n, m, relationships(path) as rels, n.created_at as created
-            RETURN DISTINCT n.name as entity1, 
-                   [r IN rels | type(r)] as relationships, 
-                   m.name as entity2
-            ORDER BY created DESC
-            LIMIT 20
+            WITH datetime() - duration({days: $recent_lookback_days}) AS since
+            CALL {
+                WITH since
+                MATCH (n:Entity)
+                WHERE n.session_id = $session_id AND n.last_fact_at >= since
+                RETURN n
+                ORDER BY n.last_fact_at DESC
+                LIMIT $recent_nodes
+                UNION
+                MATCH (n:Entity)
+                WHERE n.session_id = 'global' AND n.last_fact_at IS NOT NULL
+                RETURN n
+                ORDER BY n.last_fact_at DESC
+                LIMIT $recent_nodes
+            }
+            CALL {
+                WITH n
+                MATCH (n)-[r]-(m)
+                WHERE coalesce(n.degree, 0) <= $supernode_degree
+                  AND (m.session_id = 'global' OR m.session_id = $session_id)
+                RETURN r, false AS capped
+                ORDER BY r.created_at DESC
+                LIMIT $recent_per_node
+                UNION
+                WITH n
+                MATCH (n)-[r]-(m)
+                WHERE coalesce(n.degree, 0) > $supernode_degree
+                  AND (m.session_id = 'global' OR m.session_id = $session_id)
+                RETURN r, true AS capped
+                LIMIT $recent_per_node
+            }
+            WITH r, max(CASE WHEN capped THEN 1 ELSE 0 END) > 0 AS capped
+            ORDER BY r.created_at DESC
+            LIMIT $result_limit
+            RETURN startNode(r).name as entity1,
+                   [type(r)] as relationships,
+                   endNode(r).name as entity2,
+                   1 as path_length,
+                   capped as truncated
             """
         
-        # THE SECURITY FIX + TWO-HOP SEARCH (with semantic priority)
-        # MATCH (n)-[*1..2]-(m) finds paths of length 1 OR 2
-        # This means if Guitar -> Hobby -> Zayeem, we'll find it!
-        # ALL(node IN nodes(path) ...) ensures EVERY node in the path is security-checked
+        # THE SECURITY FIX + ANCHOR-FIRST TWO-HOP SEARCH
+        # Anchors are resolved through indexes only (see build_retrieval_params):
+        #   - prefix seek on the normalized_id range index (covers exact ids too)
+        #   - the entity_names full-text index over name and normalized_id
+        #     (left out while the index is missing, see check_anchor_indexes)
+        # Each keyword keeps its best $anchor_per_keyword visible matches,
+        # ranked exact normalized_id, then prefix, then full-text only (ties
+        # by normalized_id), so a common word cannot crowd out an exact name
+        # or another keyword's anchors. GlobalSnapshot.anchors ranks the same.
+        # Expansion then goes ONE HOP AT A TIME from the anchors, and the
+        # session check runs on every node as it is reached: the anchor, the
+        # hop-1 node before anything is expanded from it, and the hop-2 node.
+        # A node that fails the check is never expanded, so EVERY node in an
+        # emitted path is security-checked, exactly as ALL(node IN nodes(path))
+        # did, without materializing paths through invisible nodes first.
+        #
+        # Each path is emitted once, in canonical orientation: a path between
+        # two anchors is found from both ends, so it is turned to start at the
+        # end with the smaller elementId (and a 2-hop cycle back to its own
+        # anchor to one relationship order) and the copies collapse in
+        # RETURN DISTINCT. Turning instead of dropping keeps a path a fanout
+        # cap cut from its smaller end.
+        #
+        # SUPERNODES: fanout is capped per anchor ($hop1_fanout) and per hop-1
+        # node ($hop2_fanout), keeping the most relevant edges: other anchors
+        # and the session's own facts first, then the newest. A hop-1 node with
+        # more than $supernode_degree relationships (n.degree is maintained on
+        # write) is expanded without sorting its edges (one more than the cap
+        # is read, to tell whether it was hit). The truncated column flags
+        # results where a cap dropped edges the caller could see; edges to
+        # other sessions' nodes do not count.
         # ORDER BY path length to prioritize direct connections
         query = """
-        MATCH path = (n)-[*1..2]-(m)
-        WHERE (
-            ANY(kw IN $keywords WHERE toLower(n.name) CONTAINS toLower(kw))
-            OR ANY(kw IN $keywords WHERE toLower(m.name) CONTAINS toLower(kw))
-        )
-        AND ALL(node IN nodes(path) WHERE node.session_id = 'global' OR node.session_id = $session_id)
-        WITH n, m, relationships(path) as rels, length(path) as path_length
+        {anchor_call}
+        WITH collect(a) AS anchors
+        UNWIND anchors AS a
+        CALL {
+            WITH a, anchors
+            MATCH (a)-[r1]-(b)
+            WHERE b.session_id = 'global' OR b.session_id = $session_id
+            WITH r1, b, anchors
+            ORDER BY b IN anchors DESC, b.session_id = $session_id DESC,
+                     coalesce(r1.created_at, datetime('1970-01-01T00:00:00Z')) DESC
+            WITH collect({r1: r1, b: b}) AS visible
+            UNWIND visible[..$hop1_fanout] AS hop
+            RETURN hop.r1 AS r1, hop.b AS b, size(visible) > $hop1_fanout AS capped1
+        }
+        CALL {
+            WITH r1, b
+            RETURN b AS m, [r1] AS rels, false AS capped2
+            UNION
+            WITH r1, b
+            MATCH (b)-[r2]-(c)
+            WHERE coalesce(b.degree, 0) <= $supernode_degree
+              AND r2 <> r1
+              AND (c.session_id = 'global' OR c.session_id = $session_id)
+            WITH r1, r2, c
+            ORDER BY c.session_id = $session_id DESC,
+                     coalesce(r2.created_at, datetime('1970-01-01T00:00:00Z')) DESC
+            WITH r1, collect({r2: r2, c: c}) AS visible
+            UNWIND visible[..$hop2_fanout] AS hop
+            RETURN hop.c AS m, [r1, hop.r2] AS rels, size(visible) > $hop2_fanout AS capped2
+            UNION
+            WITH r1, b
+            MATCH (b)-[r2]-(c)
+            WHERE coalesce(b.degree, 0) > $supernode_degree
+              AND r2 <> r1
+              AND (c.session_id = 'global' OR c.session_id = $session_id)
+            WITH r1, r2, c
+            LIMIT $hop2_fanout + 1
+            WITH r1, collect({r2: r2, c: c}) AS visible
+            UNWIND visible[..$hop2_fanout] AS hop
+            RETURN hop.c AS m, [r1, hop.r2] AS rels, size(visible) > $hop2_fanout AS capped2
+        }
+        WITH a, m, rels,
+             capped1 OR capped2 AS capped,
+             (m IN anchors AND elementId(m) < elementId(a))
+             OR (m = a AND elementId(rels[0]) > elementId(rels[-1])) AS turn
+        WITH CASE WHEN turn THEN m ELSE a END AS a,
+             CASE WHEN turn THEN a ELSE m END AS m,
+             CASE WHEN turn THEN reverse(rels) ELSE rels END AS rels,
+             capped
+        WITH collect({a: a, m: m, rels: rels}) AS paths, sum(CASE WHEN capped THEN 1 ELSE 0 END) > 0 AS truncated
+        UNWIND paths AS path
+        WITH path.a AS a, path.m AS m, path.rels AS rels, size(path.rels) as path_length, truncated
         ORDER BY path_length ASC
-        RETURN DISTINCT n.name as entity1, 
+        RETURN DISTINCT a.name as entity1, 
                [r IN rels | type(r)] as relationships, 
                m.name as entity2,
-               path_length
-        LIMIT 20
+               path_length,
+               truncated
+        LIMIT $result_limit
         """
-        
-        return query
+        anchor_filter = (
+            "a.session_id = $session_id" if session_anchors_only
+            else "a.session_id = 'global' OR a.session_id = $session_id"
+        )
+        return query.replace("{anchor_call}", self._anchor_call(anchor_filter))
+
+    def _anchor_call(self, anchor_filter: str) -> str:
+        """The ranked anchor lookup of build_secure_cypher_query: a CALL
+        returning each keyword's best $anchor_per_keyword visible anchors as a"""
+        fulltext_anchors = """
+                UNION
+                WITH k
+                CALL db.index.fulltext.queryNodes('entity_names', $fulltext_queries[k]) YIELD node
+                RETURN node AS a, 2 AS rank""" if self.fulltext_anchors else ""
+        return """CALL {
+            UNWIND range(0, size($anchor_ids) - 1) AS k
+            CALL {
+                WITH k
+                MATCH (a:Entity) WHERE a.normalized_id STARTS WITH $anchor_ids[k]
+                RETURN a, CASE WHEN a.normalized_id = $anchor_ids[k] THEN 0 ELSE 1 END AS rank{fulltext_anchors}
+            }
+            WITH k, a, min(rank) AS rank
+            WHERE {anchor_filter}
+            WITH k, a, rank
+            ORDER BY rank, a.normalized_id
+            WITH k, collect(a)[..$anchor_per_keyword] AS ranked
+            UNWIND ranked AS a
+            RETURN DISTINCT a
+        }""".replace("{anchor_filter}", anchor_filter).replace("{fulltext_anchors}", fulltext_anchors)
+
+    def build_overlay_neighbourhood_query(self) -> str:
+        """
+        The part of the global layer an in-process session overlay needs when
+        the global snapshot is not available: the global anchors (ranked like
+        build_secure_cypher_query's) and the global nodes the overlay links to
+        ($overlay_ids), each with its newest $neighbourhood_fanout global
+        edges (unsorted for a supernode) plus one, so SessionGraph.paths can
+        tell a fanout cap was hit. The anchors come off the same indexes as
+        the retrieval query and the overlay's nodes off the normalized_id
+        index.
+        """
+        return """
+        {anchor_call}
+        WITH collect(a) AS anchors
+        CALL {
+            WITH anchors
+            UNWIND anchors AS g
+            RETURN g
+            UNION
+            UNWIND $overlay_ids AS overlay_id
+            MATCH (g:Entity) WHERE g.normalized_id = overlay_id AND g.session_id = 'global'
+            RETURN g
+        }
+        CALL {
+            WITH g
+            MATCH (g)-[r]-(n)
+            WHERE coalesce(g.degree, 0) <= $supernode_degree AND n.session_id = 'global'
+            RETURN r, n
+            ORDER BY coalesce(r.created_at, datetime('1970-01-01T00:00:00Z')) DESC
+            LIMIT $neighbourhood_fanout + 1
+            UNION
+            WITH g
+            MATCH (g)-[r]-(n)
+            WHERE coalesce(g.degree, 0) > $supernode_degree AND n.session_id = 'global'
+            RETURN r, n
+            LIMIT $neighbourhood_fanout + 1
+        }
+        WITH anchors, g, collect({
+            normalized_id: n.normalized_id, name: n.name, degree: coalesce(n.degree, 0),
+            rel_id: elementId(r), type: type(r)
+        }) AS edges
+        RETURN g.normalized_id AS normalized_id, g.name AS name, coalesce(g.degree, 0) AS degree,
+               [i IN range(0, size(anchors) - 1) WHERE anchors[i] = g][0] AS anchor_rank,
+               edges
+        """.replace("{anchor_call}", self._anchor_call("a.session_id = 'global'"))
+
+    def build_frontier_overlay_query(self) -> str:
+        """
+        Session overlay for retrieval served from the global snapshot: paths
+        that leave the global layer into this session's nodes.
+
+        $frontier maps the element id of every global anchor and hop-1 node
+        the snapshot expanded to the path prefixes ending there
+        ({entity1, types}). The query starts from the session's own nodes
+        (session_id index), so a global hub's other sessions are never
+        scanned, and keeps the edges that reach the frontier: one more hop
+        after a hop-1 node, up to two after an anchor. The same hardcoded
+        session filter as build_secure_cypher_query runs on every node.
+        """
+        return """
+        MATCH (s:Entity)
+        WHERE s.session_id = $session_id
+        MATCH (s)-[r]-(g)
+        WHERE g.session_id = 'global' AND elementId(g) IN $frontier_ids
+        WITH g, r, s
+        ORDER BY coalesce(r.created_at, datetime('1970-01-01T00:00:00Z')) DESC
+        WITH g, collect({r: r, s: s}) AS hits
+        UNWIND $frontier[elementId(g)] AS prefix
+        WITH prefix, hits,
+             CASE WHEN size(prefix.types) = 0 THEN $hop1_fanout ELSE $hop2_fanout END AS fanout
+        UNWIND hits[..fanout] AS hit
+        WITH prefix, hit.r AS r, hit.s AS s, size(hits) > fanout AS capped
+        CALL {
+            WITH prefix, r, s
+            RETURN prefix.types + [type(r)] AS relationships, s AS m
+            UNION
+            WITH prefix, r, s
+            MATCH (s)-[r2]-(c)
+            WHERE size(prefix.types) = 0
+              AND r2 <> r
+              AND (c.session_id = 'global' OR c.session_id = $session_id)
+            RETURN prefix.types + [type(r), type(r2)] AS relationships, c AS m
+            ORDER BY coalesce(r2.created_at, datetime('1970-01-01T00:00:00Z')) DESC
+            LIMIT $hop2_fanout
+        }
+        RETURN prefix.entity1 as entity1,
+               relationships,
+               m.name as entity2,
+               size(relationships) as path_length,
+               capped as truncated
+        """
+
+    @staticmethod
+    def build_retrieval_params(keywords: list) -> dict:
+        """
+        Parameters for build_secure_cypher_query (session_id is added by the caller).
+        Without keywords these are the recent-activity feed's bounds.
+
+        Each keyword becomes a normalized_id prefix ("AI Memory" -> "ai_memory")
+        and a full-text query matching it as a phrase, or as its words with
+        the last one as a prefix ("ai AND memory*"). RETRIEVAL_ANCHOR_LIMIT is
+        split evenly between the keywords (at least one anchor each).
+        """
+        if not keywords:
+            return {
+                "keywords": [],
+                "recent_lookback_days": config.RETRIEVAL_RECENT_LOOKBACK_DAYS,
+                "recent_nodes": config.RETRIEVAL_RECENT_NODES,
+                "recent_per_node": config.RETRIEVAL_RECENT_PER_NODE,
+                "result_limit": config.RETRIEVAL_RESULT_LIMIT,
+                "supernode_degree": config.RETRIEVAL_SUPERNODE_DEGREE,
+            }
+
+        anchor_ids, fulltext_queries = [], []
+        for keyword in keywords or []:
+            words = keyword.lower().split()
+            if not words:
+                continue
+            anchor_ids.append("_".join(words))
+            terms = [LUCENE_SPECIAL.sub(r"\\\1", w) for w in words]
+            # Only the last word is a prefix: a prefix on every word would
+            # expand common words ("entity*") to huge term sets
+            fulltext_queries.append(
+                '"' + " ".join(terms) + '" OR (' + " AND ".join(terms[:-1] + [f"{terms[-1]}*"]) + ")"
+            )
+        return {
+            "keywords": keywords,
+            "anchor_ids": anchor_ids,
+            "fulltext_queries": fulltext_queries,
+            "anchor_per_keyword": max(1, config.RETRIEVAL_ANCHOR_LIMIT // max(1, len(anchor_ids))),
+            "result_limit": config.RETRIEVAL_RESULT_LIMIT,
+            "hop1_fanout": config.RETRIEVAL_HOP1_FANOUT,
+            "hop2_fanout": config.RETRIEVAL_HOP2_FANOUT,
+            "supernode_degree": config.RETRIEVAL_SUPERNODE_DEGREE,
+        }
 
 
 # Global embedding service instance
 embedding_service = EmbeddingService()
+entity_dictionary = EntityDictionary()
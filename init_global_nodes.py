@@ -6,37 +6,102 @@ These nodes will always be visible to all users
 from database import db
 from config import config
 
+# Range indexes need a label, so they are defined on the :Entity label that
+# create_graph_from_json puts on every node. Relationship range indexes would
+# need a relationship type, so relationships have none.
+INDEXES = [
+    # Index on session_id for fast session filtering
+    ("node_session_id", "CREATE INDEX node_session_id IF NOT EXISTS FOR (n:Entity) ON (n.session_id)"),
+    # Index on name for fast name lookups
+    ("node_name", "CREATE INDEX node_name IF NOT EXISTS FOR (n:Entity) ON (n.name)"),
+    # Index on normalized_id for exact and prefix (STARTS WITH) anchor lookups
+    ("node_normalized_id", "CREATE INDEX node_normalized_id IF NOT EXISTS FOR (n:Entity) ON (n.normalized_id)"),
+    # Composite index for the recent-activity feed: equality on session_id,
+    # newest-first order on last_fact_at
+    (
+        "node_session_last_fact",
+        "CREATE INDEX node_session_last_fact IF NOT EXISTS FOR (n:Entity) ON (n.session_id, n.last_fact_at)",
+    ),
+    # Range index for session cleanup (global nodes have no expires_at)
+    ("node_expires_at", "CREATE INDEX node_expires_at IF NOT EXISTS FOR (n:Entity) ON (n.expires_at)"),
+    # Full-text index for keyword anchor resolution in build_secure_cypher_query
+    (
+        "entity_names",
+        "CREATE FULLTEXT INDEX entity_names IF NOT EXISTS FOR (n:Entity) ON EACH [n.name, n.normalized_id]",
+    ),
+]
+
+
 def create_indexes():
     """Create database indexes for performance optimization"""
     print("📊 Creating database indexes...")
-    
+
     try:
-        # Index on session_id for fast session filtering
+        # Nodes written before the :Entity label existed
         db.execute_cypher("""
-        CREATE INDEX node_session_id IF NOT EXISTS FOR (n) ON (n.session_id)
+        MATCH (n) WHERE n.normalized_id IS NOT NULL AND NOT n:Entity
+        CALL { WITH n SET n:Entity } IN TRANSACTIONS OF 10000 ROWS
         """)
-        print("   ✅ Created index: node_session_id")
-        
-        # Index on name for fast name lookups
+        print("   ✅ Labeled existing nodes as :Entity")
+    except Exception as e:
+        print(f"   ⚠️  Entity label backfill warning: {e}")
+
+    try:
+        # Degrees for nodes written before they were maintained on write
         db.execute_cypher("""
-        CREATE INDEX node_name IF NOT EXISTS FOR (n) ON (n.name)
+        MATCH (n:Entity) WHERE n.degree IS NULL
+        CALL { WITH n SET n.degree = size([(n)--() | 1]) } IN TRANSACTIONS OF 10000 ROWS
         """)
-        print("   ✅ Created index: node_name")
-        
-        # Index on normalized_id for case-insensitive matching
+        print("   ✅ Backfilled node degrees")
+    except Exception as e:
+        print(f"   ⚠️  Degree backfill warning: {e}")
+
+    try:
+        # Recent-feed timestamps for nodes written before they were stamped
         db.execute_cypher("""
-        CREATE INDEX node_normalized_id IF NOT EXISTS FOR (n) ON (n.normalized_id)
+        MATCH (n:Entity) WHERE n.last_fact_at IS NULL AND n.degree > 0
+        CALL {
+            WITH n
+            MATCH (n)-[r]-()
+            WITH n, max(r.created_at) AS latest
+            SET n.last_fact_at = latest
+        } IN TRANSACTIONS OF 10000 ROWS
         """)
-        print("   ✅ Created index: node_normalized_id")
-        
-        # Index on relationship session_id
+        print("   ✅ Backfilled last_fact_at")
+    except Exception as e:
+        print(f"   ⚠️  last_fact_at backfill warning: {e}")
+
+    try:
+        # Session expiry for data written before it was stamped on write
         db.execute_cypher("""
-        CREATE INDEX rel_session_id IF NOT EXISTS FOR ()-[r]-() ON (r.session_id)
-        """)
-        print("   ✅ Created index: rel_session_id")
-        
+        MATCH (n:Entity) WHERE n.session_id <> 'global' AND n.expires_at IS NULL
+        CALL {
+            WITH n
+            SET n.expires_at = coalesce(n.updated_at, n.created_at, datetime()) + duration({hours: $ttl})
+        } IN TRANSACTIONS OF 10000 ROWS
+        """, {"ttl": config.SESSION_TTL_HOURS})
+        db.execute_cypher("""
+        MATCH (:Entity)-[r]->() WHERE r.session_id <> 'global' AND r.expires_at IS NULL
+        CALL {
+            WITH r
+            SET r.expires_at = coalesce(r.created_at, datetime()) + duration({hours: $ttl})
+        } IN TRANSACTIONS OF 10000 ROWS
+        """, {"ttl": config.SESSION_TTL_HOURS})
+        print("   ✅ Backfilled session expires_at")
+    except Exception as e:
+        print(f"   ⚠️  expires_at backfill warning: {e}")
+
+    for name, statement in INDEXES:
+        try:
+            db.execute_cypher(statement)
+            print(f"   ✅ Created index: {name}")
+        except Exception as e:
+            print(f"   ⚠️  Index creation warning ({name}): {e}")
+
+    try:
+        db.execute_cypher("CALL db.awaitIndexes(300)")
     except Exception as e:
-        print(f"   ⚠️  Index creation warning: {e}")
+        print(f"   ⚠️  Index population warning: {e}")
 
 def init_global_nodes():
     """Create global nodes that are visible to all sessions"""
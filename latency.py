@@ -0,0 +1,13 @@
+"""
+Latency summaries shared by the scheduler stats, replay_chat.py and the
+benchmark scripts.
+"""
+
+
+def percentile(samples, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
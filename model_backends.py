@@ -0,0 +1,288 @@
+"""
+Model backends behind EmbeddingService.
+
+EmbeddingService talks to a ModelBackend (generate / generate_async /
+generate_stream_async / embed / embed_async) instead of a genai.Client, and
+the model names come from config (GENERATION_MODEL, EMBEDDING_MODEL), so the
+service can run against something other than the live Gemini API.
+MODEL_BACKEND picks the implementation:
+
+  gemini  GeminiBackend, the google-genai client (production)
+  fake    FakeBackend, a deterministic offline model for benchmarks and
+          load tests on a machine with no network or API key
+
+Either can be recorded to, or replaced by, a cassette (see cassette.py).
+
+FakeBackend answers every prompt EmbeddingService sends with valid output
+(rule-based graph extraction, pronoun rewriting, keywords, answers from the
+graph paths), embeds text as stable hash-seeded unit vectors, and draws
+latencies from FAKE_MODEL_LATENCY. FAKE_MODEL_ERROR_RATE of the calls fail
+with a 429 or 503 that the model scheduler retries. Outputs depend only on
+the prompt; latencies and errors come from a generator seeded with
+FAKE_MODEL_SEED, so a sequential run is reproducible.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from typing import AsyncIterator, Protocol
+
+from cassette import CassetteBackend
+from config import config
+
+
+class ModelBackend(Protocol):
+    def generate(self, model: str, prompt: str, generation_config: dict = None) -> str: ...
+
+    async def generate_async(self, model: str, prompt: str, generation_config: dict = None) -> str: ...
+
+    async def generate_stream_async(self, model: str, prompt: str,
+                                    generation_config: dict = None) -> AsyncIterator[str]: ...
+
+    def embed(self, model: str, contents) -> list: ...
+
+    async def embed_async(self, model: str, contents) -> list: ...
+
+
+class GeminiBackend:
+    """google-genai client; contents is a text or a list of texts for embed"""
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_config(cls):
+        from google import genai
+        return cls(genai.Client(api_key=config.GEMINI_API_KEY))
+
+    def generate(self, model: str, prompt: str, generation_config: dict = None) -> str:
+        return self.client.models.generate_content(model=model, contents=prompt, config=generation_config).text
+
+    async def generate_async(self, model: str, prompt: str, generation_config: dict = None) -> str:
+        response = await self.client.aio.models.generate_content(
+            model=model, contents=prompt, config=generation_config
+        )
+        return response.text
+
+    async def generate_stream_async(self, model: str, prompt: str, generation_config: dict = None):
+        stream = await self.client.aio.models.generate_content_stream(
+            model=model, contents=prompt, config=generation_config
+        )
+
+        async def texts():
+            async for chunk in stream:
+                yield chunk.text
+
+        return texts()
+
+    def embed(self, model: str, contents) -> list:
+        result = self.client.models.embed_content(model=model, contents=contents)
+        return [embedding.values for embedding in result.embeddings]
+
+    async def embed_async(self, model: str, contents) -> list:
+        result = await self.client.aio.models.embed_content(model=model, contents=contents)
+        return [embedding.values for embedding in result.embeddings]
+
+
+class FakeModelError(Exception):
+    """Injected failure; .code is what the model scheduler checks for retries"""
+
+    def __init__(self, code: int):
+        super().__init__(f"{code} injected fake model error")
+        self.code = code
+
+
+PRONOUN_PATTERN = re.compile(r"\b(he|she|they|him|her|them|it)\b", re.IGNORECASE)
+POSSESSIVE_PATTERN = re.compile(r"\b(his|her|their|its)\b(?=\s+[a-z])", re.IGNORECASE)
+NAME_PATTERN = re.compile(r"\b[A-Z][\w'-]*(?:\s+[A-Z][\w'-]*)*")
+LEADING_WORDS = {"The", "A", "An", "My", "I", "What", "Where", "Who", "Which", "When", "How", "Why",
+                 "Does", "Do", "Did", "Is", "Are", "Tell", "He", "She", "They", "It", "His", "Her", "Their"}
+FILLER_WORDS = {"is", "are", "was", "were", "a", "an", "the", "my", "his", "her", "their", "also", "now"}
+
+
+def _node_id(name: str) -> str:
+    return re.sub(r"\W+", "_", name.strip().lower()).strip("_")
+
+
+class RuleBasedModel:
+    """Prompt-shape-aware responses for the prompts EmbeddingService builds"""
+
+    @staticmethod
+    def names(text: str) -> list:
+        found = []
+        for match in NAME_PATTERN.finditer(text):
+            words = match.group().split()
+            while words and words[0] in LEADING_WORDS:
+                words = words[1:]
+            if words:
+                found.append((" ".join(words), match.end() - len(" ".join(words)), match.end()))
+        return found
+
+    def extract_graph(self, text: str) -> dict:
+        """One edge per sentence: first name -[words between]-> last name (or last word)"""
+        nodes, edges = {}, []
+        for sentence in re.split(r"[.!?\n]+", text):
+            entities = self.names(sentence)
+            if not entities:
+                continue
+            subject, _, subject_end = entities[0]
+            if len(entities) > 1:
+                obj, obj_start, _ = entities[-1]
+            else:
+                tail = sentence[subject_end:].split()
+                if len(tail) < 2:
+                    continue
+                obj = tail[-1].strip(",;:").title()
+                obj_start = subject_end + sentence[subject_end:].rfind(tail[-1])
+            relation = [w for w in re.findall(r"[a-z]+", sentence[subject_end:obj_start].lower())
+                        if w not in FILLER_WORDS]
+            if not relation:
+                continue
+            rel_type = "_".join(relation).upper()
+            label = "Location" if relation[-1] in ("in", "from") else "Organization" if relation[-1] == "at" else "Entity"
+            nodes.setdefault(_node_id(subject), {"id": _node_id(subject), "label": "Person", "properties": {"name": subject}})
+            nodes.setdefault(_node_id(obj), {"id": _node_id(obj), "label": label, "properties": {"name": obj}})
+            edges.append({"from": _node_id(subject), "to": _node_id(obj), "type": rel_type, "properties": {}})
+        return {"nodes": list(nodes.values()), "edges": edges}
+
+    def rewrite(self, message: str, history_text: str) -> str:
+        """Replace pronouns with the last name mentioned in the history"""
+        referents = self.names(history_text)
+        if not referents:
+            return message
+        name = referents[-1][0]
+        message = POSSESSIVE_PATTERN.sub(f"{name}'s", message)
+        return PRONOUN_PATTERN.sub(name, message)
+
+    def keywords(self, text: str) -> list:
+        return list(dict.fromkeys(re.sub(r"'s$", "", name) for name, _, _ in self.names(text)))
+
+    @staticmethod
+    def _section(prompt: str, start: str, end: str) -> str:
+        match = re.search(re.escape(start) + r"(.*?)" + re.escape(end), prompt, re.DOTALL)
+        return match.group(1).strip() if match else ""
+
+    def respond(self, prompt: str) -> str:
+        if "Fact Processing Engine" in prompt:
+            message = re.search(r'Current Message: "(.*)"', prompt).group(1)
+            rewritten = self.rewrite(message, self._section(prompt, "Chat History:", "Current Message:"))
+            return json.dumps({"rewritten_fact": rewritten, "graph": self.extract_graph(rewritten)})
+        if "knowledge graph extraction system" in prompt:
+            return json.dumps(self.extract_graph(self._section(prompt, "\nText:", "Return ONLY valid JSON")))
+        if "Query Processing Engine" in prompt:
+            question = re.search(r'Current Question: "(.*)"', prompt).group(1)
+            rewritten = self.rewrite(question, self._section(prompt, "Chat History:", "Current Question:"))
+            return json.dumps({"rewritten_query": rewritten, "keywords": self.keywords(rewritten)})
+        if "keyword extraction system" in prompt:
+            return json.dumps(self.keywords(re.findall(r'Query: "(.*)"', prompt)[-1]))
+        if "query rewriting assistant" in prompt:
+            question = re.search(r'Current Question: "(.*)"', prompt).group(1)
+            return self.rewrite(question, self._section(prompt, "Chat History:", "Current Question:"))
+        if "Answer Engine" in prompt:
+            paths = self._section(prompt, "Graph Paths Found:", "CRITICAL RULES").splitlines()
+            match = re.match(r"\s*(.+?) --\[(.+?)\]--> (.+)", paths[0]) if paths else None
+            if not match:
+                return "I don't have that information."
+            subject, relation, objects = match.groups()
+            return f"{subject} {relation.split(' -> ')[-1].lower().replace('_', ' ')} {objects}."
+        if "Neo4j Expert" in prompt:
+            return "MATCH (n)-[r]-(m) WHERE (n.session_id = 'global' OR n.session_id = $session_id) RETURN n.name, type(r), m.name LIMIT 20"
+        return "OK"
+
+
+class FakeBackend:
+    """Deterministic offline model with configurable latency and injected errors"""
+
+    synthetic_embeddings = True
+
+    def __init__(self, latency: dict = None, error_rate: float = None, seed: int = None, dimension: int = None):
+        self.latency = latency if latency is not None else config.FAKE_MODEL_LATENCY
+        self.error_rate = config.FAKE_MODEL_ERROR_RATE if error_rate is None else error_rate
+        self.dimension = dimension or config.FAKE_EMBEDDING_DIM
+        self.rng = random.Random(config.FAKE_MODEL_SEED if seed is None else seed)
+        self.model = RuleBasedModel()
+        self.calls = {"generate": 0, "embed": 0}
+        self.errors = 0
+
+    def _sample(self, kind: str) -> float:
+        """Seconds for one call of kind, from {"dist": fixed | uniform | lognormal, ...}"""
+        spec = self.latency.get(kind, {})
+        dist = spec.get("dist", "fixed")
+        if dist == "uniform":
+            ms = self.rng.uniform(spec.get("low_ms", 0), spec.get("high_ms", 0))
+        elif dist == "lognormal":
+            ms = spec.get("median_ms", 0) * math.exp(self.rng.gauss(0, spec.get("sigma", 0.25)))
+        else:
+            ms = spec.get("ms", 0)
+        return ms / 1000
+
+    def _start(self, kind: str) -> float:
+        self.calls[kind] += 1
+        seconds = self._sample(kind)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.errors += 1
+            raise FakeModelError(self.rng.choice((429, 429, 503)))
+        return seconds
+
+    def _vector(self, text: str) -> list:
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        values = [rng.gauss(0, 1) for _ in range(self.dimension)]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+    def _vectors(self, contents) -> list:
+        return [self._vector(text) for text in (contents if isinstance(contents, list) else [contents])]
+
+    def generate(self, model: str, prompt: str, generation_config: dict = None) -> str:
+        time.sleep(self._start("generate"))
+        return self.model.respond(prompt)
+
+    async def generate_async(self, model: str, prompt: str, generation_config: dict = None) -> str:
+        await asyncio.sleep(self._start("generate"))
+        return self.model.respond(prompt)
+
+    async def generate_stream_async(self, model: str, prompt: str, generation_config: dict = None):
+        seconds = self._start("generate")
+        words = re.findall(r"\S+\s*", self.model.respond(prompt)) or [""]
+
+        async def texts():
+            # A third of the latency before the first chunk, the rest spread over the others
+            await asyncio.sleep(seconds / 3)
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(seconds * 2 / 3 / max(1, len(words) - 1))
+                yield word
+
+        return texts()
+
+    def embed(self, model: str, contents) -> list:
+        time.sleep(self._start("embed"))
+        return self._vectors(contents)
+
+    async def embed_async(self, model: str, contents) -> list:
+        await asyncio.sleep(self._start("embed"))
+        return self._vectors(contents)
+
+    def stats(self) -> dict:
+        return {"calls": dict(self.calls), "errors": self.errors}
+
+
+BACKENDS = {"gemini": GeminiBackend.from_config, "fake": FakeBackend}
+
+
+def create_backend(name: str = None) -> ModelBackend:
+    """MODEL_BACKEND, wrapped in a cassette when CASSETTE_MODE is record or
+    replay (replaying needs no backend of its own)"""
+    name = (name or config.MODEL_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown MODEL_BACKEND '{name}' (expected one of: {', '.join(BACKENDS)})")
+    if config.CASSETTE_MODE == "replay":
+        return CassetteBackend("replay", config.CASSETTE_PATH)
+    backend = BACKENDS[name]()
+    if config.CASSETTE_MODE == "record":
+        return CassetteBackend("record", config.CASSETTE_PATH, inner=backend)
+    return backend
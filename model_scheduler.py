@@ -0,0 +1,256 @@
+"""
+Central scheduler for Gemini calls.
+
+Every generate_content / embed_content call made by EmbeddingService goes
+through here, so the worker as a whole respects the model's limits instead of
+each route firing calls on its own:
+
+  * a bounded concurrency pool per model (MODEL_CONCURRENCY)
+  * priority lanes: waiters in the interactive lane (/chat, /ask) are always
+    admitted before the bulk lane (/import, bulk_import.py, /embed/batch).
+    The lane comes from a context variable set by the caller, so it follows
+    the request through every helper without being passed around.
+  * a token bucket per model (MODEL_RATE_PER_MINUTE, MODEL_BURST)
+  * jittered exponential backoff on retryable errors (429 / 503 / 500),
+    with the pool slot given up while backing off
+
+Per-model overrides go in MODEL_LIMITS as JSON, e.g.
+{"gemini-embedding-001": {"concurrency": 16, "rate_per_minute": 1500}}.
+Queue depth, wait times, throttling and retries are reported at /metrics.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from config import config
+from latency import percentile
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+current_lane = contextvars.ContextVar("model_lane", default=INTERACTIVE)
+
+RETRYABLE_CODES = {429, 500, 503}
+RETRYABLE_PATTERN = re.compile(r"\b(429|503|RESOURCE_EXHAUSTED|UNAVAILABLE|rate limit)\b", re.IGNORECASE)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits and transient server errors, however the client reports them"""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code in RETRYABLE_CODES:
+        return True
+    return bool(RETRYABLE_PATTERN.search(str(error)))
+
+
+class TokenBucket:
+    """rate tokens per second, up to burst banked; rate 0 means unlimited"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token; returns how long to wait before using it"""
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class ModelPool:
+    """Concurrency slots for one model, handed out by lane then arrival order"""
+
+    def __init__(self, model: str, concurrency: int, rate_per_minute: float, burst: int):
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(rate_per_minute / 60, burst)
+        self.active = 0
+        self.waiters = []  # heap of (lane rank, seq, future)
+        self.seq = itertools.count()
+        self.sync_slots = threading.BoundedSemaphore(self.concurrency)
+
+        self.queued = {lane: 0 for lane in LANES}
+        self.waits = {lane: deque(maxlen=1000) for lane in LANES}
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.throttled_seconds = 0.0
+
+    async def acquire(self, lane: str):
+        started = time.perf_counter()
+        if self.active < self.concurrency and not self.waiters:
+            self.active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self.waiters, (LANES.index(lane), next(self.seq), future))
+            self.queued[lane] += 1
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just as we were cancelled
+                    self.release()
+                else:
+                    self.waiters = [w for w in self.waiters if w[2] is not future]
+                    heapq.heapify(self.waiters)
+                raise
+            finally:
+                self.queued[lane] -= 1
+        self.waits[lane].append(time.perf_counter() - started)
+
+        delay = self.bucket.reserve()
+        if delay > 0:
+            self.throttled_seconds += delay
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.release()
+                raise
+
+    def release(self):
+        # Hand the slot straight to the highest-priority live waiter
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "queue_depth": dict(self.queued),
+            "wait_ms": {
+                lane: {
+                    "p50": round(percentile(self.waits[lane], 50) * 1000, 1),
+                    "p95": round(percentile(self.waits[lane], 95) * 1000, 1),
+                }
+                for lane in LANES
+            },
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+        }
+
+
+class ModelScheduler:
+    """Routes model calls through per-model pools with retry and backoff"""
+
+    def __init__(self):
+        self.pools = {}
+
+    def pool(self, model: str) -> ModelPool:
+        pool = self.pools.get(model)
+        if pool is None:
+            limits = config.MODEL_LIMITS.get(model, {})
+            pool = self.pools[model] = ModelPool(
+                model,
+                limits.get("concurrency", config.MODEL_CONCURRENCY),
+                limits.get("rate_per_minute", config.MODEL_RATE_PER_MINUTE),
+                limits.get("burst", config.MODEL_BURST),
+            )
+        return pool
+
+    @staticmethod
+    @contextlib.contextmanager
+    def lane(name: str):
+        """Run model calls made inside the block (and tasks it starts) in lane `name`"""
+        token = current_lane.set(name)
+        try:
+            yield
+        finally:
+            current_lane.reset(token)
+
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(config.MODEL_BACKOFF_MAX, config.MODEL_BACKOFF_BASE * 2 ** attempt))
+
+    async def call(self, model: str, factory):
+        """Await factory() (a fresh model call per attempt) under model's limits"""
+        pool = self.pool(model)
+        lane = current_lane.get()
+        for attempt in itertools.count():
+            await pool.acquire(lane)
+            try:
+                pool.calls += 1
+                return await factory()
+            except Exception as e:
+                if attempt >= config.MODEL_MAX_RETRIES or not is_retryable(e):
+                    pool.failures += 1
+                    raise
+                pool.retries += 1
+                delay = self.backoff(attempt)
+                print(f"⏳ {model} call failed ({e}); retry {attempt + 1} in {delay:.2f}s")
+            finally:
+                pool.release()
+            await asyncio.sleep(delay)
+
+    async def stream(self, model: str, factory):
+        """Async-iterate the chunks of factory() (an awaitable returning an
+        async iterator). Retries only until the first chunk arrives, since
+        later chunks cannot be retried without repeating text."""
+        pool = self.pool(model)
+        lane = current_lane.get()
+        for attempt in itertools.count():
+            await pool.acquire(lane)
+            started = False
+            try:
+                pool.calls += 1
+                async for chunk in await factory():
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started or attempt >= config.MODEL_MAX_RETRIES or not is_retryable(e):
+                    pool.failures += 1
+                    raise
+                pool.retries += 1
+                delay = self.backoff(attempt)
+                print(f"⏳ {model} stream failed ({e}); retry {attempt + 1} in {delay:.2f}s")
+            finally:
+                pool.release()
+            await asyncio.sleep(delay)
+
+    def call_sync(self, model: str, fn):
+        """Blocking counterpart of call() for scripts using the sync client.
+        Shares the model's rate limit; sync callers have no lanes."""
+        pool = self.pool(model)
+        for attempt in itertools.count():
+            with pool.sync_slots:
+                delay = pool.bucket.reserve()
+                if delay > 0:
+                    time.sleep(delay)
+                try:
+                    pool.calls += 1
+                    return fn()
+                except Exception as e:
+                    if attempt >= config.MODEL_MAX_RETRIES or not is_retryable(e):
+                        pool.failures += 1
+                        raise
+                    pool.retries += 1
+            time.sleep(self.backoff(attempt))
+
+    def stats(self) -> dict:
+        return {model: pool.stats() for model, pool in self.pools.items()}
+
+
+model_scheduler = ModelScheduler()
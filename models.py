@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class EmbedRequest(BaseModel):
     text: str
@@ -9,6 +9,23 @@ class EmbedResponse(BaseModel):
     embedding_dimension: int
     node_id: int
 
+class EmbedBatchRequest(BaseModel):
+    texts: list[str]
+
+class EmbedBatchItem(BaseModel):
+    index: int
+    success: bool
+    node_id: int = None
+    embedding_dimension: int = None
+    error: str = None
+
+class EmbedBatchResponse(BaseModel):
+    success: bool
+    count: int
+    succeeded: int
+    failed: int
+    items: list[EmbedBatchItem]
+
 class EmbeddingInfo(BaseModel):
     id: int
     text: str
@@ -63,6 +80,12 @@ class AddFactResponse(BaseModel):
     nodes: list[GraphNode]
     edges: list[GraphEdge]
 
+class ImportRequest(BaseModel):
+    text: str
+    session_id: str = None
+    # Names the checkpoint file, so only a plain identifier is accepted
+    job_id: str = Field(None, pattern=r"^[A-Za-z0-9_-]{1,64}$")
+
 class ChatRequest(BaseModel):
     message: str
     action_type: str  # 'add_fact' or 'ask_question'
@@ -0,0 +1,131 @@
+"""
+Replay a captured /chat session log and report throughput and per-stage latency.
+
+The log is the JSON Lines file written while the server ran with
+CASSETTE_MODE=record (CASSETTE_CHAT_LOG). To compare changes without Gemini,
+start the server on the same cassette in replay mode:
+
+    CASSETTE_MODE=replay uvicorn app:app --port 5001
+    python replay_chat.py .cassettes/chat.jsonl --url http://localhost:5001 --concurrency 8
+
+Each session's requests are sent in their recorded order (follow-ups depend
+on earlier facts) to the endpoint they were recorded on, /chat or
+/chat/stream (--endpoint sends them all to one); up to --concurrency
+sessions run at once. Stage timings come from the timings_ms reported in
+the /chat details or the /chat/stream done event.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+
+import httpx
+
+from config import config
+from latency import percentile
+
+
+def load_log(path: str) -> dict:
+    """session_id -> [request body] in recorded order"""
+    sessions = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                body = {k: entry.get(k) for k in ("message", "action_type", "history", "session_id")}
+                # Logs from before the endpoint was recorded only came from /chat
+                body["endpoint"] = entry.get("endpoint") or "/chat"
+                sessions[body["session_id"]].append(body)
+    return sessions
+
+
+async def post_chat(client: httpx.AsyncClient, endpoint: str, body: dict) -> dict:
+    """Send one request and return its ChatResponse payload; for /chat/stream
+    that is the done event, read once the whole stream has arrived"""
+    if endpoint != "/chat/stream":
+        response = await client.post(endpoint, json=body)
+        response.raise_for_status()
+        return response.json()
+
+    async with client.stream("POST", endpoint, json=body) as response:
+        response.raise_for_status()
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event in ("done", "error"):
+                data = json.loads(line[len("data: "):])
+                if event == "error":
+                    raise httpx.HTTPError(data.get("detail") or "stream error")
+                return data
+    raise httpx.HTTPError("stream ended without a done event")
+
+
+async def replay(client: httpx.AsyncClient, sessions: dict, concurrency: int, endpoint: str = None) -> dict:
+    """endpoint, when given, overrides the endpoint each request was recorded on"""
+    outcome = {"latency_ms": defaultdict(list), "stages_ms": defaultdict(list), "errors": 0, "requests": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_session(requests: list):
+        async with semaphore:
+            for body in requests:
+                started = time.perf_counter()
+                payload = {k: v for k, v in body.items() if k != "endpoint"}
+                try:
+                    result = await post_chat(client, endpoint or body.get("endpoint") or "/chat", payload)
+                except httpx.HTTPError as e:
+                    outcome["errors"] += 1
+                    print(f"❌ {body['action_type']} '{body['message'][:40]}': {e}")
+                    continue
+                outcome["requests"] += 1
+                action = body["action_type"]
+                outcome["latency_ms"][action].append((time.perf_counter() - started) * 1000)
+                details = result.get("details") or {}
+                for name, ms in (details.get("timings_ms") or {}).items():
+                    outcome["stages_ms"][(action, name)].append(ms)
+                if "llm_latency_ms" in details:
+                    outcome["stages_ms"][(action, "llm (sum)")].append(details["llm_latency_ms"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_session(requests) for requests in sessions.values()))
+    outcome["wall_seconds"] = time.perf_counter() - started
+    return outcome
+
+
+def print_report(outcome: dict):
+    wall = outcome["wall_seconds"]
+    print(f"📊 {outcome['requests']} requests in {wall:.2f}s "
+          f"({outcome['requests'] / wall if wall else 0:.1f} req/s), {outcome['errors']} errors")
+    for action, samples in sorted(outcome["latency_ms"].items()):
+        print(f"   {action:<13} n={len(samples):<5} p50={percentile(samples, 50):8.1f}ms "
+              f"p95={percentile(samples, 95):8.1f}ms")
+        for (stage_action, stage), stage_samples in sorted(outcome["stages_ms"].items()):
+            if stage_action == action:
+                print(f"     {stage:<11} p50={percentile(stage_samples, 50):8.1f}ms "
+                      f"p95={percentile(stage_samples, 95):8.1f}ms")
+
+
+async def main_async(args):
+    sessions = load_log(args.log)
+    print(f"📼 Replaying {sum(len(r) for r in sessions.values())} requests from {len(sessions)} sessions")
+    async with httpx.AsyncClient(
+        base_url=args.url, headers={"x-api-key": config.VITE_API_SECRET}, timeout=None
+    ) as client:
+        outcome = await replay(client, sessions, args.concurrency, args.endpoint)
+    print_report(outcome)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a captured /chat session log")
+    parser.add_argument("log", nargs="?", default=config.CASSETTE_CHAT_LOG, help="captured session log (JSON Lines)")
+    parser.add_argument("--url", default=f"http://localhost:{config.PORT}", help="server to replay against")
+    parser.add_argument("--concurrency", type=int, default=4, help="sessions replayed at once")
+    parser.add_argument("--endpoint", choices=("/chat", "/chat/stream"),
+                        help="send every request here instead of the endpoint it was recorded on")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Graph retrieval for /ask and /chat: secure Cypher query plus result caching.
+"""
+
+import asyncio
+
+from neo4j.exceptions import ClientError
+
+from cache import retrieval_cache
+from config import config
+from database import async_db
+from embeddings import embedding_service, entity_dictionary
+from global_snapshot import global_snapshot
+from session_overlay import GlobalNeighbourhood, session_overlay
+
+
+class GraphRetriever:
+    """Runs the secure retrieval query, serving repeats from retrieval_cache"""
+
+    def __init__(self):
+        self.speculation_hits = 0
+        self.speculation_misses = 0
+        self.speculation_skipped = 0
+
+    async def process_and_retrieve(self, message: str, history: list, session_id: str = None) -> tuple:
+        """
+        process_query_optimized_async with retrieval started speculatively.
+
+        When the question escalates to the LLM, retrieval for the names the
+        entity dictionary finds in it (and, for a pronoun, in the last turn
+        that names anything) runs while the LLM call is in flight. If the
+        LLM's keywords turn out to be the same set, that retrieval is the
+        answer; otherwise it is cancelled and retrieval runs again.
+
+        Returns (processed, retrieval) where retrieval is a task resolving
+        to retrieve()'s result plus "speculation": "hit" | "miss" | "none"
+        ("none" when no known name gave anything to speculate on).
+        """
+        speculative = spec_key = None
+        if config.RETRIEVAL_SPECULATIVE:
+            await entity_dictionary.load_session(session_id)
+            guess = entity_dictionary.speculative_keywords(message, history, session_id)
+            if guess:
+                spec_key = retrieval_cache.make_key(guess, session_id)
+                speculative = asyncio.create_task(self.retrieve(guess, session_id))
+                # A discarded guess may fail unobserved
+                speculative.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+        try:
+            processed = await embedding_service.process_query_optimized_async(message, history, session_id)
+        except BaseException:
+            if speculative is not None:
+                speculative.cancel()
+            raise
+        keywords = processed["keywords"]
+
+        if speculative is not None and retrieval_cache.make_key(keywords, session_id) == spec_key:
+            retrieval, outcome = speculative, "hit"
+        else:
+            if speculative is not None:
+                speculative.cancel()
+            retrieval = asyncio.create_task(self.retrieve(keywords, session_id))
+            outcome = "miss" if speculative is not None else "none"
+
+        # Locally served questions never waited on the LLM, so they say
+        # nothing about how well speculation hides its latency
+        if processed["source"] == "llm":
+            if outcome == "hit":
+                self.speculation_hits += 1
+            elif outcome == "miss":
+                self.speculation_misses += 1
+            else:
+                self.speculation_skipped += 1
+
+        async def settle():
+            return {**await retrieval, "speculation": outcome}
+
+        return processed, asyncio.create_task(settle())
+
+    async def retrieve(self, keywords: list, session_id: str = None) -> dict:
+        """
+        Returns:
+        {
+            "cypher_query": "...",
+            "results": [{"entity1": ..., "relationships": [...], "entity2": ...}],
+            "cache_hit": bool,
+            "truncated": bool   # a supernode fanout cap may have dropped paths
+        }
+        """
+        # Python writes the Cypher query with hardcoded security filter
+        cypher_query = embedding_service.build_secure_cypher_query(keywords)
+
+        cached = retrieval_cache.lookup(keywords, session_id)
+        if cached is not None:
+            return {"cypher_query": cypher_query, "cache_hit": True, **cached}
+
+        generation = retrieval_cache.stamp(session_id)
+        # Execute with BOTH keywords (as index anchors) and session_id as parameters
+        # session_id is safe due to execute_cypher UUID fix
+        params = embedding_service.build_retrieval_params(keywords)
+        params["session_id"] = session_id
+
+        graph = global_snapshot.current() if keywords else None
+        if graph is not None:
+            retrieved = await self._retrieve_with_snapshot(graph, keywords, params, generation)
+        else:
+            rows = await self._read_anchored(
+                lambda: embedding_service.build_secure_cypher_query(keywords), params, generation
+            )
+            retrieved = {
+                "results": [{k: v for k, v in row.items() if k != "truncated"} for row in rows],
+                "truncated": any(row.get("truncated") for row in rows),
+            }
+
+        # Facts still held in the in-process session overlay
+        overlay = session_overlay.get(session_id) if session_id not in (None, "none", "global") else None
+        if overlay is not None:
+            if keywords:
+                neighbourhood = graph
+                if neighbourhood is None and overlay.edges:
+                    # Without the snapshot, read the global nodes around the
+                    # overlay so paths like X -global-> Ohio -overlay-> me
+                    # are found before the facts are promoted
+                    rows = await self._read_anchored(embedding_service.build_overlay_neighbourhood_query, {
+                        **params, "overlay_ids": overlay.global_ids(),
+                        "neighbourhood_fanout": max(params["hop1_fanout"], params["hop2_fanout"] + 1),
+                    }, generation)
+                    neighbourhood = GlobalNeighbourhood(rows)
+                paths, truncated = overlay.paths(neighbourhood, keywords, params)
+            else:
+                paths, truncated = overlay.recent_paths(params["result_limit"]), False
+            stored = [
+                (row["entity1"], tuple(row["relationships"]), row["entity2"], row["path_length"])
+                for row in retrieved["results"]
+            ]
+            # The recent feed lists newest facts first instead of by path length
+            retrieved = {
+                "results": merge_paths(paths + stored, params["result_limit"], by_length=bool(keywords)),
+                "truncated": retrieved["truncated"] or truncated,
+            }
+        retrieval_cache.store(keywords, session_id, retrieved, generation)
+        # Rebuilt: the full-text anchors may have been dropped while retrieving
+        cypher_query = embedding_service.build_secure_cypher_query(keywords)
+        return {"cypher_query": cypher_query, "cache_hit": False, **retrieved}
+
+    @staticmethod
+    async def _read_anchored(build_query, params: dict, generation: tuple = None) -> list:
+        """Run a query with the anchor lookup (build_query() builds it); if the
+        entity_names full-text index has gone missing, drop the full-text
+        anchors and run it again"""
+        try:
+            return await async_db.read_cypher(build_query(), params, generation)
+        except ClientError as e:
+            if not embedding_service.fulltext_anchors or "entity_names" not in str(e):
+                raise
+            embedding_service.disable_fulltext_anchors(e.message or str(e))
+        return await async_db.read_cypher(build_query(), params, generation)
+
+    async def _retrieve_with_snapshot(self, graph, keywords: list, params: dict, generation: tuple) -> dict:
+        """Global paths from the in-process snapshot, session paths from Neo4j.
+
+        The session overlay is the session's own anchors (the usual query,
+        anchored on session nodes only) plus the paths that step from the
+        global frontier into session nodes. Visitors without a session never
+        touch Neo4j.
+        """
+        anchors = graph.anchors(params["anchor_ids"], keywords, params["anchor_per_keyword"])
+        paths, truncated, frontier = graph.expand(
+            anchors, params["hop1_fanout"], params["hop2_fanout"], params["result_limit"]
+        )
+
+        overlay = []
+        if params["session_id"] not in (None, "none", "global"):
+            queries = [self._read_anchored(
+                lambda: embedding_service.build_secure_cypher_query(keywords, session_anchors_only=True),
+                params, generation,
+            )]
+            if frontier:
+                queries.append(async_db.read_cypher(
+                    embedding_service.build_frontier_overlay_query(),
+                    {**params, "frontier": frontier, "frontier_ids": list(frontier)},
+                    generation,
+                ))
+            for rows in await asyncio.gather(*queries):
+                for row in rows:
+                    overlay.append((row["entity1"], tuple(row["relationships"]), row["entity2"], row["path_length"]))
+                    truncated = truncated or bool(row.get("truncated"))
+
+        # Session paths first within each length
+        return {"results": merge_paths(overlay + paths, params["result_limit"]), "truncated": truncated}
+
+    def stats(self) -> dict:
+        """Speculation outcomes for questions that escalated to the LLM"""
+        speculated = self.speculation_hits + self.speculation_misses
+        return {
+            "enabled": config.RETRIEVAL_SPECULATIVE,
+            "hits": self.speculation_hits,
+            "misses": self.speculation_misses,
+            "skipped": self.speculation_skipped,
+            "hit_rate": round(self.speculation_hits / speculated, 4) if speculated else 0.0,
+        }
+
+
+def merge_paths(paths: list, limit: int, by_length: bool = True) -> list:
+    """Result rows from (entity1, relationship types, entity2, length) tuples,
+    shortest first (stable), keeping a path found from both of its ends
+    (e.g. a session anchor next to a global anchor) once"""
+    results, seen = [], set()
+    for entity1, relationships, entity2, path_length in sorted(paths, key=lambda p: p[3]) if by_length else paths:
+        key = min((entity1, relationships, entity2), (entity2, relationships[::-1], entity1))
+        if key in seen:
+            continue
+        seen.add(key)
+        results.append({
+            "entity1": entity1, "relationships": list(relationships),
+            "entity2": entity2, "path_length": path_length,
+        })
+        if len(results) == limit:
+            break
+    return results
+
+
+retriever = GraphRetriever()
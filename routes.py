@@ -1,7 +1,17 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+
 from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from models import (
     EmbedRequest,
     EmbedResponse,
+    EmbedBatchRequest,
+    EmbedBatchItem,
+    EmbedBatchResponse,
     EmbeddingsResponse,
     EmbeddingInfo,
     HealthResponse,
@@ -13,10 +23,23 @@ from models import (
     GraphEdge,
     ChatRequest,
     ChatResponse,
+    ImportRequest,
 )
-from database import db
-from embeddings import embedding_service
+from answer_templates import answer_templates
+from bulk_import import ImportJobError, bulk_importer
+from cache import answer_cache, retrieval_cache
+from cassette import CassetteBackend, chat_log
+from config import config
+from database import async_db
+from embedding_cache import embedding_cache
+from embeddings import embedding_service, entity_dictionary
+from global_snapshot import global_snapshot
+from model_scheduler import model_scheduler
+from retrieval import retriever
 from security import validate_api_key
+from session_cleanup import session_cleaner
+from session_overlay import session_overlay
+from vector_index import vector_search
 
 router = APIRouter(dependencies=[Depends(validate_api_key)])
 
@@ -34,10 +57,16 @@ async def embed_and_store(request: EmbedRequest):
             raise HTTPException(status_code=400, detail="Text cannot be empty")
 
         # Generate embeddings using Gemini
-        embedding = embedding_service.generate_embedding(text)
+        embedding = await embedding_service.generate_embedding_async(text)
 
         # Store in Neo4j
-        record = db.create_embedding_node(text, embedding)
+        record = await async_db.create_embedding_node(text, embedding)
+        await asyncio.to_thread(vector_search.add, [{
+            "id": record["id"],
+            "text": text,
+            "created_at": datetime.now(timezone.utc),
+            "embedding": embedding,
+        }])
 
         return EmbedResponse(
             success=True,
@@ -52,11 +81,85 @@ async def embed_and_store(request: EmbedRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/embed/batch", response_model=EmbedBatchResponse, status_code=201)
+async def embed_and_store_batch(request: EmbedBatchRequest):
+    """
+    POST endpoint that embeds many texts with batched Gemini calls and
+    stores them in Neo4j with one UNWIND per chunk. Failures are reported
+    per item instead of failing the whole request.
+    """
+    texts = request.texts
+
+    if not texts:
+        raise HTTPException(status_code=400, detail="Texts cannot be empty")
+    if len(texts) > config.EMBED_BATCH_MAX_TEXTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {config.EMBED_BATCH_MAX_TEXTS} texts per request",
+        )
+
+    try:
+        items = [EmbedBatchItem(index=i, success=False) for i in range(len(texts))]
+        valid = []
+        for i, text in enumerate(texts):
+            if text and text.strip():
+                valid.append(i)
+            else:
+                items[i].error = "Text cannot be empty"
+
+        # 1. Generate embeddings in batched, concurrent API calls
+        vectors = await embedding_service.generate_embeddings_batch_async([texts[i] for i in valid])
+        embedded = []
+        for i, vector in zip(valid, vectors):
+            if isinstance(vector, Exception):
+                items[i].error = str(vector)
+            else:
+                embedded.append((i, vector))
+
+        # 2. Store in Neo4j, one UNWIND statement per chunk
+        async def store_chunk(chunk: list):
+            try:
+                node_ids = await async_db.create_embedding_nodes(
+                    [texts[i] for i, _ in chunk], [vector for _, vector in chunk]
+                )
+            except Exception as e:
+                for i, _ in chunk:
+                    items[i].error = str(e)
+                return
+            created_at = datetime.now(timezone.utc)
+            # Keep any local vector index in step with the new nodes
+            await asyncio.to_thread(vector_search.add, [
+                {"id": node_id, "text": texts[i], "created_at": created_at, "embedding": vector}
+                for (i, vector), node_id in zip(chunk, node_ids)
+            ])
+            for (i, vector), node_id in zip(chunk, node_ids):
+                items[i].success = True
+                items[i].node_id = node_id
+                items[i].embedding_dimension = len(vector)
+
+        await asyncio.gather(*(
+            store_chunk(embedded[i:i + config.EMBED_BATCH_SIZE])
+            for i in range(0, len(embedded), config.EMBED_BATCH_SIZE)
+        ))
+
+        succeeded = sum(1 for item in items if item.success)
+        return EmbedBatchResponse(
+            success=succeeded == len(items),
+            count=len(items),
+            succeeded=succeeded,
+            failed=len(items) - succeeded,
+            items=items,
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/embeddings", response_model=EmbeddingsResponse)
 async def get_embeddings():
     """Get all stored embeddings"""
     try:
-        result = db.get_all_embeddings()
+        result = await async_db.get_all_embeddings()
 
         embeddings = [
             EmbeddingInfo(
@@ -77,18 +180,37 @@ async def get_embeddings():
 
 @router.get("/search", response_model=SearchResponse)
 async def search_embeddings(
-    q: str = Query(..., min_length=1), top_k: int = Query(5, ge=1, le=20)
+    q: str = Query(..., min_length=1),
+    top_k: int = Query(5, ge=1, le=20),
+    backend: str = Query("neo4j", pattern="^(neo4j|exact|hnsw)$"),
 ):
     """
     GET endpoint that takes a query string, finds the most
-    semantically similar embeddings from Neo4j.
+    semantically similar embeddings from Neo4j, or from an in-process
+    index (backend=exact|hnsw) when LOCAL_VECTOR_INDEX has loaded it.
     """
+    if backend != "neo4j" and backend not in vector_search.backends:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Vector index backend '{backend}' is not loaded (see LOCAL_VECTOR_INDEX)",
+        )
+
     try:
         # 1. Embed the search query
-        query_vector = embedding_service.generate_embedding(q)
-
-        # 2. Search the database with the vector
-        results = db.search_embeddings(query_vector=query_vector, top_k=top_k)
+        query_vector = await embedding_service.generate_embedding_async(q)
+
+        # 2. Search the database (or the local index) with the vector
+        if backend == "neo4j":
+            results = await async_db.search_embeddings(query_vector=query_vector, top_k=top_k)
+        else:
+            if vector_search.needs_sync():
+                try:
+                    await vector_search.sync(async_db)
+                except Exception as e:
+                    # A stale mirror is still a usable one
+                    print(f"⚠️ Local vector index refresh failed: {e}")
+            # CPU-bound on large indexes, so keep it off the event loop
+            results = await asyncio.to_thread(vector_search.search, backend, query_vector, top_k)
 
         # 3. Format the results
         hits = [
@@ -120,10 +242,10 @@ async def add_fact(request: AddFactRequest):
             raise HTTPException(status_code=400, detail="Text cannot be empty")
 
         # Extract graph structure using Gemini
-        graph_data = embedding_service.extract_graph_structure(text)
+        graph_data = await embedding_service.extract_graph_structure_async(text)
 
         # Store graph in Neo4j using MERGE to avoid duplicates
-        result = db.create_graph_from_json(graph_data)
+        result = await async_db.create_graph_from_json(graph_data)
 
         # Format response
         nodes = [
@@ -157,6 +279,34 @@ async def add_fact(request: AddFactRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/import")
+async def import_document(request: ImportRequest):
+    """
+    POST endpoint that bulk-imports a whole document into the knowledge graph.
+    Streams newline-delimited JSON progress events; re-posting the same
+    document (or job_id) resumes from the last committed chunk.
+    """
+    if not request.text or not request.text.strip():
+        raise HTTPException(status_code=400, detail="Text cannot be empty")
+    try:
+        checkpoint = bulk_importer.checkpoint(request.text, request.session_id, request.job_id)
+    except ImportJobError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    async def events():
+        try:
+            async for event in bulk_importer.run(
+                request.text, session_id=request.session_id, checkpoint=checkpoint
+            ):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            # Headers are already sent, so errors are reported in-band
+            yield json.dumps({"event": "error", "error": str(e)}) + "\n"
+
+    # The run releases the job when it ends; this also covers a stream that never started
+    return StreamingResponse(events(), media_type="application/x-ndjson", background=BackgroundTask(checkpoint.close))
+
+
 @router.get("/ask")
 async def ask_question(q: str = Query(..., min_length=1), session_id: str = Query(None)):
     """
@@ -166,23 +316,20 @@ async def ask_question(q: str = Query(..., min_length=1), session_id: str = Quer
     try:
         # MILESTONE 16: DETERMINISTIC RETRIEVAL
         # Step 1: AI extracts keywords
-        keywords = embedding_service.extract_keywords(q)
-        
-        # Step 2: Python builds secure Cypher query
-        cypher_query = embedding_service.build_secure_cypher_query(keywords)
+        keywords = await embedding_service.extract_keywords_async(q, session_id)
         
-        # Step 3: Execute with BOTH keywords and session_id as parameters
-        # session_id is now safe due to execute_cypher UUID fix
-        results = db.execute_cypher(cypher_query, {
-            "keywords": keywords,
-            "session_id": session_id
-        })
+        # Step 2: Python builds secure Cypher query and executes it with
+        # BOTH keywords and session_id as parameters (cached per session)
+        retrieved = await retriever.retrieve(keywords, session_id)
+        cypher_query = retrieved["cypher_query"]
+        results = retrieved["results"]
 
         return {
             "success": True,
             "question": q,
             "keywords_extracted": keywords,
             "generated_cypher": cypher_query,
+            "truncated": retrieved["truncated"],
             "answer": results,
         }
 
@@ -190,6 +337,20 @@ async def ask_question(q: str = Query(..., min_length=1), session_id: str = Quer
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class _StageTimer:
+    """Per-stage wall time for the timings_ms in /chat and /chat/stream details;
+    calling it with a stage name closes that stage and starts the next"""
+
+    def __init__(self):
+        self.timings = {}
+        self.started = time.perf_counter()
+
+    def __call__(self, name: str):
+        now = time.perf_counter()
+        self.timings[name] = round((now - self.started) * 1000, 1)
+        self.started = now
+
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """
@@ -204,16 +365,25 @@ async def chat(request: ChatRequest):
         if not message or not message.strip():
             raise HTTPException(status_code=400, detail="Message cannot be empty")
 
+        usage = embedding_service.track_llm_usage()
+        chat_log.record(request.model_dump(), "/chat")
+        stage = _StageTimer()
+
         # 1. OPTIMIZED QUERY PROCESSING (Single LLM call for rewrite+extract)
-        # For add_fact: Still need rewriting for context
+        # For add_fact: rewritten fact AND its graph in one call
         # For ask_question: Get both rewritten query AND keywords in one call
         if request.action_type == "add_fact":
-            # Only need rewriting for facts
-            rewritten_message = embedding_service.rewrite_query(message, history)
-            print(f"Original: '{message}' -> Rewritten: '{rewritten_message}'")
-            
-            graph_data = embedding_service.extract_graph_structure(rewritten_message)
-            result = db.create_graph_from_json(graph_data, session_id=session_id)
+            processed = await embedding_service.process_fact_async(message, history)
+            stage("process")
+            rewritten_message = processed["rewritten_fact"]
+            print(f"Fact Processing ({processed['source']}): '{message}' -> '{rewritten_message}'")
+
+            graph_data = processed["graph"]
+            if session_overlay.handles(session_id):
+                result = await session_overlay.add_graph(graph_data, session_id, async_db)
+            else:
+                result = await async_db.create_graph_from_json(graph_data, session_id=session_id)
+            stage("write")
 
             response_text = f"Got it! I've added that to your knowledge graph."
             if result["nodes_created"] > 0:
@@ -226,34 +396,40 @@ async def chat(request: ChatRequest):
                 details={
                     "nodes_created": result["nodes_created"],
                     "edges_created": result["edges_created"],
+                    "session_overlay": session_overlay.handles(session_id),
+                    "fact_source": processed["source"],
+                    "timings_ms": stage.timings,
+                    **usage,
                 },
             )
 
         else:  # ask_question
             # PERFORMANCE OPTIMIZATION: Single LLM call for rewrite+extract
             # Reduces latency by ~40% and API costs by ~33%
-            processed = embedding_service.process_query_optimized(message, history)
+            # Retrieval starts from locally known names while the LLM runs
+            processed, retrieval = await retriever.process_and_retrieve(message, history, session_id)
+            stage("process")
             rewritten_message = processed["rewritten_query"]
             keywords = processed["keywords"]
             
-            print(f"Optimized Processing: '{message}' -> '{rewritten_message}' | Keywords: {keywords}")
-            
-            # Step 2: Python writes the Cypher query with hardcoded security filter
-            cypher_query = embedding_service.build_secure_cypher_query(keywords)
+            print(f"Optimized Processing ({processed['source']}): '{message}' -> '{rewritten_message}' | Keywords: {keywords}")
             
-            # Step 3: Execute the secure query with BOTH keywords and session_id as parameters
-            results = db.execute_cypher(cypher_query, {
-                "keywords": keywords,
-                "session_id": session_id  # Now safe due to execute_cypher UUID fix
-            })
+            # Step 2+3: Python writes the secure Cypher query and executes it
+            # with BOTH keywords and session_id as parameters (cached per session)
+            retrieved = await retrieval
+            stage("retrieval")
+            cypher_query = retrieved["cypher_query"]
+            results = retrieved["results"]
             
+            answer_report = {"hit": False, "match": None, "llm_calls_avoided": 0, "latency_saved_ms": 0.0}
             if results and len(results) > 0:
-                # Use REWRITTEN message to format answer
-                answer_text = embedding_service.format_query_results(
-                    rewritten_message, results
+                # Use REWRITTEN message to format answer (cached per session)
+                answer_text, answer_report = await embedding_service.format_query_results_cached_async(
+                    rewritten_message, results, session_id
                 )
             else:
                 answer_text = "I couldn't find any information about that in your knowledge graph yet."
+            stage("answer")
 
             return ChatResponse(
                 success=True,
@@ -262,7 +438,14 @@ async def chat(request: ChatRequest):
                 details={
                     "cypher_query": cypher_query, 
                     "results_count": len(results),
-                    "keywords_extracted": keywords
+                    "keywords_extracted": keywords,
+                    "query_source": processed["source"],
+                    "retrieval_cache_hit": retrieved["cache_hit"],
+                    "retrieval_truncated": retrieved["truncated"],
+                    "retrieval_speculation": retrieved["speculation"],
+                    "answer_cache": answer_report,
+                    "timings_ms": stage.timings,
+                    **usage,
                 },
             )
 
@@ -272,6 +455,163 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Streaming variant of /chat using Server-Sent Events.
+
+    Stage events are sent as soon as each step finishes:
+        rewritten  {"rewritten_query"}
+        keywords   {"keywords", "source"}                     (ask_question)
+        retrieved  {"results_count", "retrieval_cache_hit", "truncated"}  (ask_question)
+        token      {"text"}                                   answer chunks
+        done       same payload as the /chat response
+        error      {"detail"}
+    """
+    message = request.message
+    history = request.history
+    session_id = request.session_id
+
+    if not message or not message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+
+    chat_log.record(request.model_dump(), "/chat/stream")
+
+    async def events():
+        usage = embedding_service.track_llm_usage()
+        stage = _StageTimer()
+        try:
+            if request.action_type == "add_fact":
+                processed = await embedding_service.process_fact_async(message, history)
+                stage("process")
+                yield _sse("rewritten", {"rewritten_query": processed["rewritten_fact"]})
+
+                graph_data = processed["graph"]
+                if session_overlay.handles(session_id):
+                    result = await session_overlay.add_graph(graph_data, session_id, async_db)
+                else:
+                    result = await async_db.create_graph_from_json(graph_data, session_id=session_id)
+                stage("write")
+
+                response_text = f"Got it! I've added that to your knowledge graph."
+                if result["nodes_created"] > 0:
+                    response_text += f" Created {result['nodes_created']} entities and {result['edges_created']} relationships."
+                yield _sse("token", {"text": response_text})
+                yield _sse("done", ChatResponse(
+                    success=True,
+                    action="add_fact",
+                    response=response_text,
+                    details={
+                        "nodes_created": result["nodes_created"],
+                        "edges_created": result["edges_created"],
+                        "session_overlay": session_overlay.handles(session_id),
+                        "fact_source": processed["source"],
+                        "timings_ms": stage.timings,
+                        **usage,
+                    },
+                ).model_dump())
+                return
+
+            processed, retrieval = await retriever.process_and_retrieve(message, history, session_id)
+            stage("process")
+            rewritten_message = processed["rewritten_query"]
+            keywords = processed["keywords"]
+            yield _sse("rewritten", {"rewritten_query": rewritten_message})
+            yield _sse("keywords", {"keywords": keywords, "source": processed["source"]})
+
+            retrieved = await retrieval
+            stage("retrieval")
+            results = retrieved["results"]
+            yield _sse("retrieved", {
+                "results_count": len(results),
+                "retrieval_cache_hit": retrieved["cache_hit"],
+                "truncated": retrieved["truncated"],
+            })
+
+            answer_report = {"hit": False, "match": None, "llm_calls_avoided": 0, "latency_saved_ms": 0.0}
+            if results:
+                parts = []
+                async for text in embedding_service.format_query_results_stream_async(
+                    rewritten_message, results, session_id, report=answer_report
+                ):
+                    parts.append(text)
+                    yield _sse("token", {"text": text})
+                answer_text = "".join(parts).strip()
+            else:
+                answer_text = "I couldn't find any information about that in your knowledge graph yet."
+                yield _sse("token", {"text": answer_text})
+            stage("answer")
+
+            yield _sse("done", ChatResponse(
+                success=True,
+                action="ask_question",
+                response=answer_text,
+                details={
+                    "cypher_query": retrieved["cypher_query"],
+                    "results_count": len(results),
+                    "keywords_extracted": keywords,
+                    "query_source": processed["source"],
+                    "retrieval_cache_hit": retrieved["cache_hit"],
+                    "retrieval_truncated": retrieved["truncated"],
+                    "retrieval_speculation": retrieved["speculation"],
+                    "answer_cache": answer_report,
+                    "timings_ms": stage.timings,
+                    **usage,
+                },
+            ).model_dump())
+        except Exception as e:
+            # Headers are already sent, so errors are reported in-band
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/session/{session_id}/promote")
+async def promote_session(session_id: str):
+    """
+    Persist a session's in-process overlay facts to Neo4j (as session nodes)
+    and clear the overlay.
+    """
+    if session_overlay.get(session_id) is None:
+        raise HTTPException(status_code=404, detail="No session overlay to promote")
+    try:
+        result = await session_overlay.promote(session_id, async_db)
+        return {
+            "success": True,
+            "session_id": session_id,
+            "nodes_created": result["nodes_created"],
+            "edges_created": result["edges_created"],
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+SESSION_GRAPH_QUERY = """
+MATCH (s:Entity)
+WHERE s.session_id = $session_id
+MATCH (s)-[r]-(o)
+WHERE (o.session_id = 'global' OR o.session_id = $session_id)
+  AND (r.session_id = 'global' OR r.session_id = $session_id)
+WITH DISTINCT r
+WITH r, startNode(r) AS n, endNode(r) AS m
+RETURN elementId(n) as source_id, n.name as source_name, labels(n) as source_labels,
+       n.session_id as source_session, r.session_id as rel_session,
+       elementId(m) as target_id, m.name as target_name, labels(m) as target_labels,
+       m.session_id as target_session,
+       elementId(r) as rel_id, type(r) as rel_type
+ORDER BY r.session_id DESC, n.created_at DESC
+LIMIT 1000
+"""
+
+
 @router.get("/graph")
 async def get_graph_data(session_id: str = Query(None)):
     """
@@ -294,8 +634,21 @@ async def get_graph_data(session_id: str = Query(None)):
         ORDER BY r.session_id DESC, n.created_at DESC
         LIMIT 1000
         """
-        # Session ID is now safe due to execute_cypher UUID fix
-        results = db.execute_cypher(query, {"session_id": session_id})
+        graph = global_snapshot.current()
+        if graph is None:
+            # Session ID is now safe due to execute_cypher UUID fix
+            results = await async_db.read_cypher(query, {"session_id": session_id})
+        else:
+            # Relationships between global nodes come from the snapshot; Neo4j
+            # only serves the ones touching this session's own nodes
+            results = []
+            if session_id not in (None, "none", "global"):
+                results = await async_db.read_cypher(SESSION_GRAPH_QUERY, {"session_id": session_id})
+            results = (results + graph.graph_rows(session_id))[:1000]
+        # Facts still held in the in-process session overlay come first
+        overlay = session_overlay.get(session_id) if session_id not in (None, "none", "global") else None
+        if overlay is not None:
+            results = (overlay.graph_rows() + results)[:1000]
 
         # Format for frontend visualization
         nodes = {}
@@ -354,11 +707,36 @@ async def get_graph_data(session_id: str = Query(None)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/metrics")
+async def get_metrics():
+    """In-process cache counters for this worker"""
+    return {
+        "retrieval_cache": retrieval_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "local_query_stage": entity_dictionary.stats(),
+        "global_snapshot": global_snapshot.stats(),
+        "session_overlay": session_overlay.stats(),
+        "session_cleanup": session_cleaner.stats(),
+        "single_flight": {
+            flight.name: flight.stats()
+            for flight in (embedding_service.generate_flight, embedding_service.embed_flight, async_db.read_flight)
+        },
+        "model_scheduler": model_scheduler.stats(),
+        "speculative_retrieval": retriever.stats(),
+        "answer_templates": answer_templates.stats(),
+        "cassette": (
+            embedding_service.backend.stats()
+            if isinstance(embedding_service.backend, CassetteBackend) else {"mode": "off"}
+        ),
+    }
+
+
 @router.get("/health", response_model=HealthResponse)
 async def health():
     """Health check endpoint"""
     try:
-        db.driver.verify_connectivity()
+        await async_db.driver.verify_connectivity()
         return HealthResponse(status="healthy", neo4j="connected", gemini="configured")
     except Exception as e:
         raise HTTPException(status_code=503, detail=str(e))
@@ -0,0 +1,126 @@
+"""
+Scheduled removal of expired session data.
+
+create_graph_from_json stamps every session node and relationship with
+expires_at (now + SESSION_TTL_HOURS, pushed back on each write) and leaves
+it unset on the global layer. Cleanup then needs no session_id parsing:
+
+  * expired session nodes are found through the node_expires_at range index
+    and DETACH DELETEd in batches of SESSION_CLEANUP_BATCH rows, each batch
+    its own transaction, so a large backlog never hits the transaction
+    memory limit
+  * session relationships between two global nodes (facts a session added
+    about e.g. Zayeem) survive their session's nodes, so they are found from
+    the global layer and deleted the same way
+
+Both keep neighbours' degree (used by supernode-aware retrieval) in step.
+The app runs a pass every SESSION_CLEANUP_INTERVAL seconds; cleanup_sessions.py
+runs one from the command line.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from cache import retrieval_cache
+from config import config
+from global_snapshot import global_snapshot
+
+EXPIRED_NODES_QUERY = """
+MATCH (n:Entity)
+WHERE n.expires_at <= $now AND n.session_id <> 'global'
+WITH n, n.session_id AS session_id
+CALL {
+    WITH n
+    OPTIONAL MATCH (n)--(other) WHERE other <> n
+    WITH n, collect(other) AS neighbours
+    FOREACH (other IN neighbours | SET other.degree = coalesce(other.degree, 1) - 1)
+    DETACH DELETE n
+} IN TRANSACTIONS OF $batch ROWS
+RETURN collect(DISTINCT session_id) AS sessions
+"""
+
+# Session relationships whose endpoints are both global outlive the session's
+# nodes; the global layer is small and indexed on session_id
+EXPIRED_GLOBAL_RELATIONSHIPS_QUERY = """
+MATCH (g:Entity {session_id: 'global'})-[r]->(h:Entity {session_id: 'global'})
+WHERE r.expires_at <= $now
+CALL {
+    WITH g, r, h
+    SET g.degree = coalesce(g.degree, 1) - 1,
+        h.degree = coalesce(h.degree, 1) - 1
+    DELETE r
+} IN TRANSACTIONS OF $batch ROWS
+"""
+
+
+class SessionCleaner:
+    """Deletes expired session nodes and relationships in bounded batches"""
+
+    def __init__(self, batch_size: int = None):
+        self.batch_size = batch_size or config.SESSION_CLEANUP_BATCH
+        self.runs = 0
+        self.last_run = None
+
+    async def _run(self, db, query: str, params: dict):
+        """CALL { } IN TRANSACTIONS needs an auto-commit transaction, so this
+        runs on a plain session; returns (records, counters)"""
+        async with db.driver.session(database=config.NEO4J_DATABASE) as session:
+            result = await session.run(query, params)
+            records = await result.data()
+            summary = await result.consume()
+        return records, summary.counters
+
+    async def run(self, db) -> dict:
+        """One cleanup pass. Returns the deleted counts and duration."""
+        started = time.perf_counter()
+        params = {"now": datetime.now(timezone.utc), "batch": self.batch_size}
+
+        records, node_counters = await self._run(db, EXPIRED_NODES_QUERY, params)
+        _, relationship_counters = await self._run(db, EXPIRED_GLOBAL_RELATIONSHIPS_QUERY, params)
+
+        sessions = records[0]["sessions"] if records else []
+        for session_id in sessions:
+            retrieval_cache.invalidate_for_write(session_id)
+        if relationship_counters.relationships_deleted:
+            retrieval_cache.invalidate_for_write("global")
+            global_snapshot.mark_stale()
+
+        report = {
+            "sessions": len(sessions),
+            "nodes_deleted": node_counters.nodes_deleted,
+            "relationships_deleted": node_counters.relationships_deleted,
+            "global_relationships_deleted": relationship_counters.relationships_deleted,
+            "duration_seconds": round(time.perf_counter() - started, 3),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+        }
+        self.runs += 1
+        self.last_run = report
+        print(
+            f"🧹 Session cleanup: {report['nodes_deleted']} nodes and "
+            f"{report['relationships_deleted'] + report['global_relationships_deleted']} relationships "
+            f"from {report['sessions']} expired sessions deleted in {report['duration_seconds']:.2f}s"
+        )
+        return report
+
+    async def run_periodically(self, db, interval: float = None):
+        """Background loop for the app lifespan. Every worker runs it; a pass
+        that races another worker's just deletes less (or retries next time)."""
+        interval = interval or config.SESSION_CLEANUP_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.run(db)
+            except Exception as e:
+                print(f"⚠️ Session cleanup failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "ttl_hours": config.SESSION_TTL_HOURS,
+            "interval_seconds": config.SESSION_CLEANUP_INTERVAL,
+            "runs": self.runs,
+            "last_run": self.last_run,
+        }
+
+
+session_cleaner = SessionCleaner()
@@ -0,0 +1,472 @@
+"""
+Ephemeral in-process store for session facts (optional, SESSION_OVERLAY_ENABLED).
+
+Most chat sessions are short and small, yet every add_fact went into Neo4j
+with a session_id property that cleanup_sessions.py later had to find and
+delete. With the overlay enabled, facts added through /chat stay in this
+worker's memory instead, per session, bounded by SESSION_OVERLAY_MAX_SESSIONS
+(least recently used sessions are dropped), SESSION_OVERLAY_TTL (idle
+sessions expire) and SESSION_OVERLAY_MAX_EDGES (oldest facts are dropped).
+
+Retrieval and /graph merge a session's overlay with the global layer at
+read time. Nothing reaches Neo4j unless the session is promoted
+(POST /session/{session_id}/promote), which writes it through
+create_graph_from_json and clears the overlay.
+
+The overlay lives in one worker: run a single worker or route a session's
+requests to the same worker (sticky sessions) when it is enabled.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from cache import retrieval_cache
+from config import config
+from embeddings import entity_dictionary
+from global_snapshot import global_snapshot
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+GLOBAL_NODES_QUERY = """
+MATCH (n:Entity)
+WHERE n.normalized_id IN $normalized_ids AND n.session_id = 'global'
+RETURN n.normalized_id AS normalized_id, n.name AS name, labels(n) AS labels, elementId(n) AS element_id
+"""
+
+
+class GlobalNeighbourhood:
+    """Read-only stand-in for a GlobalGraph snapshot over the rows of
+    build_overlay_neighbourhood_query, for SessionGraph.paths when the
+    snapshot is not available: the global anchors and the overlay's global
+    nodes with their newest global edges"""
+
+    def __init__(self, rows: list):
+        self.normalized_id, self.name, self._degrees, self._neighbours = [], [], [], []
+        self.rel_type = []
+        self._index, self._rels, self._types = {}, {}, {}
+        ranked = []
+        for row in rows:
+            g = self._node(row["normalized_id"], row["name"], row["degree"])
+            if row["anchor_rank"] is not None:
+                ranked.append((row["anchor_rank"], g))
+            for edge in row["edges"]:
+                n = self._node(edge["normalized_id"], edge["name"], edge["degree"])
+                if edge["rel_id"] not in self._rels:
+                    self._rels[edge["rel_id"]] = len(self.rel_type)
+                    self.rel_type.append(self._types.setdefault(edge["type"], len(self._types)))
+                self._neighbours[g].append((n, self._rels[edge["rel_id"]]))
+        self.type_names = list(self._types)
+        self._anchors = [g for _, g in sorted(ranked)]
+
+    def _node(self, normalized_id: str, name: str, degree: int) -> int:
+        if normalized_id not in self._index:
+            self._index[normalized_id] = len(self.normalized_id)
+            self.normalized_id.append(normalized_id)
+            self.name.append(name)
+            self._degrees.append(degree)
+            self._neighbours.append([])
+        return self._index[normalized_id]
+
+    def find(self, normalized_id: str):
+        return self._index.get(normalized_id)
+
+    def neighbours(self, node: int) -> list:
+        return self._neighbours[node]
+
+    def degree(self, node: int) -> int:
+        return self._degrees[node]
+
+    def anchors(self, anchor_ids: list, keywords: list, per_keyword: int) -> list:
+        # Already ranked and cut per keyword by the query
+        return self._anchors
+
+
+class SessionGraph:
+    """One session's nodes and edges, keyed by normalized_id"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        # normalized_id -> {"name", "label", "properties", "element_id", "global"}
+        self.nodes = OrderedDict()
+        # (from, type, to) -> {"properties", "created_at", "element_id"}, oldest first
+        self.edges = OrderedDict()
+        self.adjacency = defaultdict(list)  # normalized_id -> [edge key], oldest first
+        self.last_used = time.monotonic()
+
+    def add_node(self, normalized_id: str, name: str, label: str, properties: dict,
+                 element_id: str = None, is_global: bool = False):
+        node = self.nodes.get(normalized_id)
+        if node is None or not node["global"]:
+            self.nodes[normalized_id] = {
+                "name": name,
+                "label": label,
+                "properties": {**(node["properties"] if node else {}), **properties},
+                "element_id": element_id or f"overlay:{self.session_id}:{normalized_id}",
+                "global": is_global,
+            }
+        return self.nodes[normalized_id]
+
+    def add_edge(self, from_id: str, rel_type: str, to_id: str, properties: dict) -> dict:
+        key = (from_id, rel_type, to_id)
+        edge = self.edges.get(key)
+        if edge is None:
+            edge = self.edges[key] = {
+                "properties": dict(properties),
+                "created_at": time.time(),
+                "element_id": f"overlay:{self.session_id}:{from_id}:{rel_type}:{to_id}",
+            }
+            self.adjacency[from_id].append(key)
+            if to_id != from_id:
+                self.adjacency[to_id].append(key)
+        else:
+            edge["properties"].update(properties)
+        return edge
+
+    def _remove_edge(self, key: tuple, drop_nodes: bool = True):
+        """Drop an edge, and (drop_nodes) its nodes when no other edge uses them"""
+        del self.edges[key]
+        from_id, _, to_id = key
+        for node_id in {from_id, to_id}:
+            self.adjacency[node_id].remove(key)
+            if not self.adjacency[node_id]:
+                del self.adjacency[node_id]
+                if drop_nodes:
+                    self.nodes.pop(node_id, None)
+
+    def trim(self, max_edges: int):
+        """Drop the oldest edges beyond max_edges, and nodes no edge uses any more"""
+        while len(self.edges) > max_edges:
+            self._remove_edge(next(iter(self.edges)))
+        # Nodes written without edges are bounded the same way
+        while len(self.nodes) > 2 * max_edges:
+            orphan = next((n for n in self.nodes if n not in self.adjacency), None)
+            if orphan is None:
+                break
+            del self.nodes[orphan]
+
+    def graph_data(self) -> dict:
+        """The overlay in extract_graph_structure format, for create_graph_from_json"""
+        return {
+            "nodes": [
+                {"id": node_id, "label": node["label"], "properties": {"name": node["name"], **node["properties"]}}
+                for node_id, node in self.nodes.items()
+            ],
+            "edges": [
+                {"from": from_id, "to": to_id, "type": rel_type, "properties": dict(edge["properties"])}
+                for (from_id, rel_type, to_id), edge in self.edges.items()
+            ],
+        }
+
+    def discard(self, graph_data: dict):
+        """Drop what graph_data (an earlier graph_data()) holds; facts added or
+        changed since then stay"""
+        for edge in graph_data["edges"]:
+            key = (edge["from"], edge["type"], edge["to"])
+            if key in self.edges and self.edges[key]["properties"] == edge["properties"]:
+                self._remove_edge(key, drop_nodes=False)
+        for node in graph_data["nodes"]:
+            stored = self.nodes.get(node["id"])
+            if (stored is not None and node["id"] not in self.adjacency
+                    and {"name": stored["name"], **stored["properties"]} == node["properties"]):
+                del self.nodes[node["id"]]
+
+    def _rank(self, node_id: str, anchor_id: str, keyword: str):
+        """Same matching and ranking as the retrieval query's index lookups:
+        0 exact id, 1 id prefix, 2 every word of the keyword, else None"""
+        if node_id == anchor_id:
+            return 0
+        if node_id.startswith(anchor_id):
+            return 1
+        tokens = set(TOKEN_PATTERN.findall(self.nodes[node_id]["name"].lower())) | {node_id}
+        terms = TOKEN_PATTERN.findall(keyword.lower())
+        if terms and all(t in tokens for t in terms[:-1]) and any(t.startswith(terms[-1]) for t in tokens):
+            return 2
+        return None
+
+    def _anchors(self, anchor_ids: list, keywords: list, per_keyword: int) -> list:
+        """Overlay anchors: each keyword's best per_keyword matches"""
+        found = {}
+        keywords = [keyword for keyword in keywords or [] if keyword.lower().split()]
+        for anchor_id, keyword in zip(anchor_ids, keywords):
+            ranked = sorted(
+                (rank, node_id)
+                for rank, node_id in ((self._rank(n, anchor_id, keyword), n) for n in self.nodes)
+                if rank is not None
+            )
+            for _, node_id in ranked[:per_keyword]:
+                found[node_id] = None
+        return list(found)
+
+    def paths(self, graph, keywords: list, params: dict) -> tuple:
+        """Paths that use at least one overlay edge, expanded hop by hop like
+        build_secure_cypher_query over the overlay plus the global snapshot
+        (graph: a GlobalGraph, a GlobalNeighbourhood read from Neo4j, or None
+        for the overlay alone).
+
+        Returns (paths, truncated) with paths as (entity1, relationship
+        types, entity2, length) tuples.
+        """
+        hop1_fanout, hop2_fanout = params["hop1_fanout"], params["hop2_fanout"]
+        global_index = {}
+
+        def snapshot_node(node_id):
+            if graph is None:
+                return None
+            if node_id not in global_index:
+                global_index[node_id] = graph.find(node_id)
+            return global_index[node_id]
+
+        def name(node_id):
+            node = self.nodes.get(node_id)
+            return node["name"] if node else graph.name[snapshot_node(node_id)]
+
+        def neighbours(node_id, session_only=False):
+            """[(neighbour, edge key, type, is overlay edge)]: overlay edges newest first, then global"""
+            found = [
+                (key[2] if key[0] == node_id else key[0], key, key[1], True)
+                for key in reversed(self.adjacency.get(node_id, []))
+            ]
+            index = None if session_only else snapshot_node(node_id)
+            if index is not None:
+                found.extend(
+                    (graph.normalized_id[b], ("global", r), graph.type_names[graph.rel_type[r]], False)
+                    for b, r in graph.neighbours(index)
+                )
+            return found
+
+        # Session anchors first, then global anchors from the snapshot
+        anchor_ids, per_keyword = params["anchor_ids"], params["anchor_per_keyword"]
+        anchors = self._anchors(anchor_ids, keywords, per_keyword)
+        if graph is not None:
+            anchors += [
+                graph.normalized_id[i]
+                for i in graph.anchors(anchor_ids, keywords, per_keyword)
+                if graph.normalized_id[i] not in self.nodes
+            ]
+        rank = {node_id: i for i, node_id in enumerate(anchors)}
+
+        paths, truncated = [], False
+        for a in rank:
+            # A cap only truncates when it drops a candidate the caller could see
+            hop1 = sorted(neighbours(a), key=lambda n: (n[0] not in rank, not n[3]))
+            capped1 = len(hop1) > hop1_fanout
+            for b, r1, t1, overlay1 in hop1[:hop1_fanout]:
+                if not overlay1 and b not in self.adjacency:
+                    continue  # every path through b would be global only
+                if overlay1:
+                    # Between two anchors: turned to start at the first, so a
+                    # copy a fanout cap left is still kept
+                    turn = b in rank and rank[b] < rank[a]
+                    paths.append((name(b), (t1,), name(a), 1) if turn else (name(a), (t1,), name(b), 1))
+                    truncated = truncated or capped1
+                hop2 = [n for n in neighbours(b, session_only=not overlay1) if n[1] != r1]
+                for c, r2, t2, overlay2 in hop2[:hop2_fanout]:
+                    if (c in rank and rank[c] < rank[a]) or (c == a and str(r1) > str(r2)):
+                        paths.append((name(c), (t2, t1), name(a), 2))
+                    else:
+                        paths.append((name(a), (t1, t2), name(c), 2))
+                    truncated = truncated or capped1 or len(hop2) > hop2_fanout
+        return paths, truncated
+
+    def global_ids(self) -> list:
+        """normalized_ids of the global nodes the overlay links to"""
+        return [node_id for node_id, node in self.nodes.items() if node["global"]]
+
+    def recent_paths(self, limit: int) -> list:
+        """Newest overlay facts, for questions without keywords"""
+        return [
+            (self.nodes[from_id]["name"], (rel_type,), self.nodes[to_id]["name"], 1)
+            for from_id, rel_type, to_id in list(reversed(self.edges))[:limit]
+        ]
+
+    def graph_rows(self) -> list:
+        """/graph rows for the overlay's edges, newest first"""
+        rows = []
+        for (from_id, rel_type, to_id), edge in reversed(self.edges.items()):
+            source, target = self.nodes[from_id], self.nodes[to_id]
+            rows.append({
+                "source_id": source["element_id"], "source_name": source["name"],
+                "source_labels": [source["label"]],
+                "source_session": "global" if source["global"] else self.session_id,
+                "rel_session": self.session_id,
+                "target_id": target["element_id"], "target_name": target["name"],
+                "target_labels": [target["label"]],
+                "target_session": "global" if target["global"] else self.session_id,
+                "rel_id": edge["element_id"], "rel_type": rel_type,
+            })
+        return rows
+
+
+class SessionOverlayStore:
+    """Per-session SessionGraphs with TTL and LRU eviction"""
+
+    def __init__(self, max_sessions: int = None, ttl_seconds: float = None, max_edges: int = None):
+        self.max_sessions = max_sessions or config.SESSION_OVERLAY_MAX_SESSIONS
+        self.ttl_seconds = ttl_seconds or config.SESSION_OVERLAY_TTL
+        self.max_edges = max_edges or config.SESSION_OVERLAY_MAX_EDGES
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.facts_written = 0
+        self.sessions_expired = 0
+        self.sessions_evicted = 0
+        self.sessions_promoted = 0
+        self.write_latency = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return config.SESSION_OVERLAY_ENABLED
+
+    def handles(self, session_id: str) -> bool:
+        """Whether add_fact writes for session_id go to the overlay"""
+        return self.enabled and session_id not in (None, "none", "global")
+
+    def get(self, session_id: str):
+        """The session's overlay, or None (also when it has expired)"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.monotonic() - session.last_used > self.ttl_seconds:
+                del self._sessions[session_id]
+                self.sessions_expired += 1
+                return None
+            session.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def _session_for_write(self, session_id: str) -> SessionGraph:
+        session = self.get(session_id)
+        with self._lock:
+            if session is None:
+                session = self._sessions[session_id] = SessionGraph(session_id)
+            # Expire idle sessions from the LRU end, then enforce the size bound
+            now = time.monotonic()
+            while self._sessions:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                if now - oldest.last_used <= self.ttl_seconds:
+                    break
+                del self._sessions[oldest_id]
+                self.sessions_expired += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.sessions_evicted += 1
+        return session
+
+    async def _resolve_global(self, node_ids: list, db) -> dict:
+        """normalized_id -> global node ({"name", "label", "element_id"}) for ids in the global layer"""
+        graph = global_snapshot.current()
+        if graph is not None:
+            resolved = {}
+            for node_id in node_ids:
+                index = graph.find(node_id)
+                if index is not None:
+                    resolved[node_id] = {
+                        "name": graph.name[index], "label": graph.label[index], "element_id": graph.element_id[index],
+                    }
+            return resolved
+        records = await db.read_cypher(GLOBAL_NODES_QUERY, {"normalized_ids": node_ids})
+        return {
+            r["normalized_id"]: {
+                "name": r["name"],
+                "label": next((l for l in r["labels"] if l != "Entity"), "Entity"),
+                "element_id": r["element_id"],
+            }
+            for r in records
+        }
+
+    async def add_graph(self, graph_data: dict, session_id: str, db) -> dict:
+        """Store extracted facts for session_id; returns a create_graph_from_json style result.
+
+        Nodes that already exist in the global layer are referenced, not
+        copied, so the overlay links into it the way a Neo4j MERGE would.
+        """
+        started = time.perf_counter()
+        node_ids = []
+        for node in graph_data.get("nodes", []):
+            name = node.get("properties", {}).get("name", node.get("id"))
+            node_ids.append(node.get("id").lower() if node.get("id") else name.lower())
+        resolved = await self._resolve_global(node_ids, db) if node_ids else {}
+
+        session = self._session_for_write(session_id)
+        created_nodes, created_edges = [], []
+        with self._lock:
+            for node, node_id in zip(graph_data.get("nodes", []), node_ids):
+                properties = node.get("properties", {})
+                name = properties.get("name", node.get("id"))
+                if node_id in resolved:
+                    found = resolved[node_id]
+                    stored = session.add_node(node_id, found["name"], found["label"], {},
+                                              found["element_id"], is_global=True)
+                else:
+                    stored = session.add_node(
+                        node_id, name, node.get("label", "Entity"),
+                        {k: v for k, v in properties.items() if k != "name"},
+                    )
+                created_nodes.append({"id": node.get("id"), "element_id": stored["element_id"], "name": stored["name"]})
+
+            node_map = {node.get("id"): node_id for node, node_id in zip(graph_data.get("nodes", []), node_ids)}
+            for edge in graph_data.get("edges", []):
+                if edge.get("from") not in node_map or edge.get("to") not in node_map:
+                    continue
+                rel_type = edge.get("type", "RELATED_TO")
+                stored = session.add_edge(node_map[edge["from"]], rel_type, node_map[edge["to"]],
+                                          edge.get("properties") or {})
+                created_edges.append({
+                    "from": edge.get("from"), "to": edge.get("to"), "type": rel_type,
+                    "element_id": stored["element_id"],
+                })
+            session.trim(self.max_edges)
+            self.facts_written += len(created_edges)
+            self.write_latency += time.perf_counter() - started
+
+        retrieval_cache.invalidate_for_write(session_id)
+        entity_dictionary.add_graph(graph_data, session_id)
+        return {
+            "nodes_created": len(created_nodes),
+            "edges_created": len(created_edges),
+            "nodes": created_nodes,
+            "edges": created_edges,
+            # The global layer itself is never written from the overlay
+            "touched_global": False,
+            "touched_global_edges": False,
+        }
+
+    async def promote(self, session_id: str, db) -> dict:
+        """Persist the session's overlay to Neo4j and clear it.
+
+        Facts added while the write is in flight are not part of it, so they
+        stay in the overlay (readable, and promoted by the next call).
+        """
+        session = self.get(session_id)
+        if session is None:
+            return {"nodes_created": 0, "edges_created": 0, "nodes": [], "edges": [],
+                    "touched_global": False, "touched_global_edges": False}
+        with self._lock:
+            graph_data = session.graph_data()
+        result = await db.create_graph_from_json(graph_data, session_id=session_id)
+        with self._lock:
+            session.discard(graph_data)
+            if self._sessions.get(session_id) is session and not session.nodes:
+                del self._sessions[session_id]
+            self.sessions_promoted += 1
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            "enabled": self.enabled,
+            "sessions": len(sessions),
+            "nodes": sum(len(s.nodes) for s in sessions),
+            "edges": sum(len(s.edges) for s in sessions),
+            "facts_written": self.facts_written,
+            "sessions_expired": self.sessions_expired,
+            "sessions_evicted": self.sessions_evicted,
+            "sessions_promoted": self.sessions_promoted,
+            "avg_write_ms": round(self.write_latency / self.facts_written * 1000, 3) if self.facts_written else 0.0,
+        }
+
+
+session_overlay = SessionOverlayStore()
@@ -0,0 +1,68 @@
+"""
+Single-flight coalescing of identical concurrent async calls.
+
+When a popular demo link sends dozens of visitors the same opening question
+at once, every request would otherwise make the same Gemini and Neo4j calls.
+With single-flight, the first caller for a key runs the call; callers that
+arrive while it is in flight await the same result (or exception) instead of
+issuing a duplicate. Nothing is kept once the call finishes; repeats after
+that are the caches' job.
+"""
+
+import asyncio
+import hashlib
+import json
+
+from config import config
+
+
+class SingleFlight:
+    """Per-key in-flight call table for one event loop"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Stable digest of JSON-serializable call arguments"""
+        payload = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def run(self, key: str, factory):
+        """Await factory() for key, or the copy of it already in flight"""
+        if not config.SINGLE_FLIGHT_ENABLED:
+            self.calls += 1
+            return await factory()
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # shield: one cancelled follower must not cancel the shared call
+            return await asyncio.shield(future)
+
+        self.calls += 1
+        future = asyncio.ensure_future(factory())
+        self.in_flight[key] = future
+        # The entry goes when the call finishes, even if this caller was cancelled
+        future.add_done_callback(lambda _: self._release(key, future))
+        return await asyncio.shield(future)
+
+    def leads(self, key: str) -> bool:
+        """Whether run(key, ...) called now makes the call itself rather than
+        joining one in flight (run decides before its first await)"""
+        return not config.SINGLE_FLIGHT_ENABLED or key not in self.in_flight
+
+    def _release(self, key: str, future):
+        if self.in_flight.get(key) is future:
+            del self.in_flight[key]
+
+    def stats(self) -> dict:
+        total = self.calls + self.coalesced
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self.in_flight),
+            "coalesced_rate": round(self.coalesced / total, 4) if total else 0.0,
+        }
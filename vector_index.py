@@ -0,0 +1,306 @@
+"""
+In-process vector search over the Embedding nodes, as an alternative to the
+Neo4j `embedding-index` vector index.
+
+Backends:
+    exact  NumPy brute-force cosine similarity
+    hnsw   HNSW-style approximate nearest neighbour graph
+
+Both share one normalized float32 matrix. The mirror is loaded from Neo4j at
+startup, updated by /embed and /embed/batch writes in this worker, and
+periodically topped up with nodes other workers created.
+"""
+
+import asyncio
+import heapq
+import math
+import random
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+
+from config import config
+
+
+class VectorStore:
+    """Growable matrix of L2-normalized float32 vectors"""
+
+    def __init__(self, dim: int = None):
+        self.dim = dim
+        self.count = 0
+        self._matrix = None
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._matrix[:self.count] if self._matrix is not None else np.empty((0, self.dim or 0), np.float32)
+
+    def append(self, vectors: np.ndarray) -> range:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        needed = self.count + len(vectors)
+        if self._matrix is None or needed > len(self._matrix):
+            capacity = max(needed, 2 * (len(self._matrix) if self._matrix is not None else 1024))
+            grown = np.empty((capacity, self.dim), dtype=np.float32)
+            if self._matrix is not None:
+                grown[:self.count] = self._matrix[:self.count]
+            self._matrix = grown
+
+        self._matrix[self.count:needed] = vectors
+        positions = range(self.count, needed)
+        self.count = needed
+        return positions
+
+
+class ExactVectorIndex:
+    """Brute-force cosine similarity over every stored vector"""
+
+    name = "exact"
+
+    def __init__(self, store: VectorStore):
+        self.store = store
+
+    def add(self, positions: range):
+        # The store is the index
+        pass
+
+    def search(self, query: np.ndarray, top_k: int) -> tuple:
+        similarities = self.store.matrix @ query
+        if len(similarities) <= top_k:
+            order = np.argsort(-similarities)
+        else:
+            candidates = np.argpartition(-similarities, top_k)[:top_k]
+            order = candidates[np.argsort(-similarities[candidates])]
+        return order.tolist(), similarities[order].tolist()
+
+
+class HNSWVectorIndex:
+    """Hierarchical navigable small world graph (Malkov & Yashunin) over the store.
+
+    Layer 0 holds every vector with up to 2*m links; each higher layer holds
+    an exponentially thinner sample with up to m links. Neighbours are picked
+    with the paper's diversity heuristic so clustered data stays connected.
+    """
+
+    name = "hnsw"
+
+    def __init__(self, store: VectorStore, m: int = None, ef_construction: int = None,
+                 ef_search: int = None, seed: int = 42):
+        self.store = store
+        self.m = m or config.HNSW_M
+        self.m0 = 2 * self.m
+        self.ef_construction = ef_construction or config.HNSW_EF_CONSTRUCTION
+        self.ef_search = ef_search or config.HNSW_EF_SEARCH
+        self.level_mult = 1 / math.log(self.m)
+        self.layers = []  # layer -> {position: [neighbour positions]}
+        self.entry = None
+        self.max_level = -1
+        self.rng = random.Random(seed)
+
+    def _distances(self, query: np.ndarray, positions: list) -> list:
+        return (1.0 - self.store.matrix[positions] @ query).tolist()
+
+    def _search_layer(self, query: np.ndarray, entry_points: list, ef: int, layer: dict) -> list:
+        """Best-first search of one layer; returns [(distance, position)] ascending"""
+        visited = set(entry_points)
+        distances = self._distances(query, entry_points)
+        candidates = list(zip(distances, entry_points))
+        heapq.heapify(candidates)
+        results = [(-d, p) for d, p in candidates]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            distance, position = heapq.heappop(candidates)
+            if distance > -results[0][0]:
+                break
+            neighbours = [n for n in layer.get(position, ()) if n not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+            for d, n in zip(self._distances(query, neighbours), neighbours):
+                if len(results) < ef or d < -results[0][0]:
+                    heapq.heappush(candidates, (d, n))
+                    heapq.heappush(results, (-d, n))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted((-d, p) for d, p in results)
+
+    def _descend(self, query: np.ndarray, down_to: int) -> list:
+        entry_points = [self.entry]
+        for level in range(self.max_level, down_to, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, self.layers[level])[0][1]]
+        return entry_points
+
+    def add(self, positions: range):
+        for position in positions:
+            self._insert(position)
+
+    def _insert(self, position: int):
+        query = self.store.matrix[position]
+        level = int(-math.log(1.0 - self.rng.random()) * self.level_mult)
+        while len(self.layers) <= level:
+            self.layers.append({})
+
+        if self.entry is None:
+            for l in range(level + 1):
+                self.layers[l][position] = []
+            self.entry, self.max_level = position, level
+            return
+
+        entry_points = self._descend(query, level)
+        for l in range(min(level, self.max_level), -1, -1):
+            layer = self.layers[l]
+            found = self._search_layer(query, entry_points, self.ef_construction, layer)
+            neighbours = self._select_neighbours(found, self.m)
+            layer[position] = neighbours
+            cap = self.m0 if l == 0 else self.m
+            for n in neighbours:
+                links = layer[n]
+                links.append(position)
+                if len(links) > cap:
+                    distances = self._distances(self.store.matrix[n], links)
+                    layer[n] = self._select_neighbours(sorted(zip(distances, links)), cap)
+            entry_points = [p for _, p in found]
+
+        for l in range(self.max_level + 1, level + 1):
+            self.layers[l][position] = []
+        if level > self.max_level:
+            self.entry, self.max_level = position, level
+
+    def _select_neighbours(self, candidates: list, limit: int) -> list:
+        """Keep a candidate only if it is closer to the new node than to any
+        neighbour already kept; top up with the closest leftovers.
+
+        candidates is [(distance, position)] in ascending distance order.
+        """
+        positions = [p for _, p in candidates]
+        if len(positions) <= limit:
+            return positions
+
+        vectors = self.store.matrix[positions]
+        pairwise = 1.0 - vectors @ vectors.T
+        # Distance from each candidate to its nearest already-selected neighbour
+        nearest_selected = np.full(len(positions), np.inf, dtype=np.float32)
+        selected, skipped = [], []
+        for i, (distance, _) in enumerate(candidates):
+            if len(selected) >= limit:
+                break
+            if nearest_selected[i] < distance:
+                skipped.append(i)
+            else:
+                selected.append(i)
+                np.minimum(nearest_selected, pairwise[i], out=nearest_selected)
+        chosen = selected + skipped[:limit - len(selected)]
+        return [positions[i] for i in chosen]
+
+    def search(self, query: np.ndarray, top_k: int) -> tuple:
+        if self.entry is None:
+            return [], []
+        entry_points = self._descend(query, 0)
+        found = self._search_layer(query, entry_points, max(self.ef_search, top_k), self.layers[0])[:top_k]
+        return [p for _, p in found], [1.0 - d for d, _ in found]
+
+
+INDEX_TYPES = {index.name: index for index in (ExactVectorIndex, HNSWVectorIndex)}
+
+
+class LocalVectorSearch:
+    """Mirror of the Embedding nodes behind the configured local index backends"""
+
+    def __init__(self, backends: list = None):
+        if backends is None:
+            backends = [b.strip() for b in config.LOCAL_VECTOR_INDEX.split(",") if b.strip()]
+        unknown = set(backends) - set(INDEX_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown vector index backend(s): {', '.join(sorted(unknown))}")
+
+        self.store = VectorStore()
+        self.indexes = {name: INDEX_TYPES[name](self.store) for name in backends}
+        self.node_ids = []
+        self.texts = []
+        self.created_at = []
+        self._known = set()
+        self._lock = threading.Lock()
+        self._synced_at = 0.0
+        self._watermark = None  # newest created_at loaded from Neo4j
+
+    @property
+    def backends(self) -> list:
+        return list(self.indexes)
+
+    def add(self, records: list):
+        """Add records with id, text, created_at and embedding keys; known ids are skipped"""
+        if not self.indexes:
+            return
+        with self._lock:
+            fresh = [r for r in records if r["id"] not in self._known and r.get("embedding") is not None]
+            if not fresh:
+                return
+            positions = self.store.append([r["embedding"] for r in fresh])
+            for record in fresh:
+                self._known.add(record["id"])
+                self.node_ids.append(record["id"])
+                self.texts.append(record["text"])
+                self.created_at.append(record["created_at"])
+            for index in self.indexes.values():
+                index.add(positions)
+
+    async def sync(self, db):
+        """Pull Embedding nodes this worker has not seen yet"""
+        if not self.indexes:
+            return
+        self._synced_at = time.monotonic()
+        # Overlap the watermark so slow commits with an earlier timestamp are not
+        # missed; ids already loaded are skipped by add()
+        since = self._watermark - timedelta(minutes=1) if self._watermark else None
+        records = await db.get_embedding_vectors(since)
+        await asyncio.to_thread(self.add, records)
+        for record in records:
+            created_at = record["created_at"]
+            created_at = created_at.to_native() if hasattr(created_at, "to_native") else created_at
+            if created_at is not None and (self._watermark is None or created_at > self._watermark):
+                self._watermark = created_at
+
+    def needs_sync(self) -> bool:
+        return (
+            bool(self.indexes)
+            and config.LOCAL_VECTOR_INDEX_REFRESH > 0
+            and time.monotonic() - self._synced_at > config.LOCAL_VECTOR_INDEX_REFRESH
+        )
+
+    def search(self, backend: str, query_vector: list, top_k: int = 5) -> list:
+        """Same record shape as Neo4jDatabase.search_embeddings"""
+        index = self.indexes[backend]
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        with self._lock:
+            if not self.store.count:
+                return []
+            positions, similarities = index.search(query, top_k)
+            return [
+                {
+                    "id": self.node_ids[p],
+                    "text": self.texts[p],
+                    "created_at": self.created_at[p],
+                    # Match the (1 + cosine) / 2 score Neo4j's cosine vector index reports
+                    "score": (1.0 + s) / 2.0,
+                }
+                for p, s in zip(positions, similarities)
+            ]
+
+
+vector_search = LocalVectorSearch()